@@ -44,6 +44,8 @@
         'account_view.xml',
         'account_asset_invoice_view.xml',
         'report/account_asset_report_view.xml',
+        'report/account_asset_report_cron.xml',
+        'account_asset_cron.xml',
         'res_config_view.xml',
     ],
     'auto_install': False,
@@ -21,9 +21,7 @@
 #
 ##############################################################################
 
-import time
 from openerp.osv import orm, fields
-from openerp import tools
 from openerp import SUPERUSER_ID
 
 
@@ -58,41 +56,81 @@ class account_fiscalyear(orm.Model):
     _inherit = 'account.fiscalyear'
 
     def create(self, cr, uid, vals, context=None):
-        # To DO :
-        # change logic to avoid table recompute overhead
-        # when a regular (duration = 1 year) new FY is created
-        recompute_obj = self.pool.get('account.asset.recompute.trigger')
+        dirty_obj = self.pool.get('account.asset.recompute.dirty')
         user_obj = self.pool.get('res.users')
-        recompute_vals = {
-            'reason': 'creation of fiscalyear %s' % vals.get('code'),
-            'company_id':
-                vals.get('company_id') or
-                user_obj.browse(cr, uid, uid, context).company_id.id,
-            'date_trigger': time.strftime(
-                tools.DEFAULT_SERVER_DATETIME_FORMAT),
-            'state': 'open',
-        }
-        recompute_obj.create(
-            cr, SUPERUSER_ID, recompute_vals, context=context)
-        return super(account_fiscalyear, self).create(
+        company_id = vals.get('company_id') or \
+            user_obj.browse(cr, uid, uid, context).company_id.id
+        dirty_obj._mark_fiscalyear_assets(
+            cr, SUPERUSER_ID, company_id,
+            vals['date_start'], vals['date_stop'],
+            'creation of fiscalyear %s' % vals.get('code'),
+            context=context)
+        fy_id = super(account_fiscalyear, self).create(
             cr, uid, vals, context=context)
+        self.pool.get('account.asset.asset').clear_caches()
+        return fy_id
 
     def write(self, cr, uid, ids, vals, context=None):
         if isinstance(ids, (int, long)):
             ids = [ids]
         if vals.get('date_start') or vals.get('date_stop'):
-            recompute_obj = self.pool.get('account.asset.recompute.trigger')
-            fy_datas = self.read(cr, uid, ids, ['code', 'company_id'])
+            dirty_obj = self.pool.get('account.asset.recompute.dirty')
+            fy_datas = self.read(
+                cr, uid, ids,
+                ['code', 'company_id', 'date_start', 'date_stop'])
             for fy_data in fy_datas:
-                recompute_vals = {
-                    'reason':
-                        'duration change of fiscalyear %s' % fy_data['code'],
-                    'company_id': fy_data['company_id'][0],
-                    'date_trigger':
-                        time.strftime(tools.DEFAULT_SERVER_DATETIME_FORMAT),
-                    'state': 'open',
-                }
-                recompute_obj.create(
-                    cr, SUPERUSER_ID, recompute_vals, context=context)
-        return super(account_fiscalyear, self).write(
+                # the tables spanning the old or new dates are affected
+                date_start = min(
+                    fy_data['date_start'],
+                    vals.get('date_start') or fy_data['date_start'])
+                date_stop = max(
+                    fy_data['date_stop'],
+                    vals.get('date_stop') or fy_data['date_stop'])
+                dirty_obj._mark_fiscalyear_assets(
+                    cr, SUPERUSER_ID, fy_data['company_id'][0],
+                    date_start, date_stop,
+                    'duration change of fiscalyear %s' % fy_data['code'],
+                    context=context)
+        res = super(account_fiscalyear, self).write(
             cr, uid, ids, vals, context=context)
+        self.pool.get('account.asset.asset').clear_caches()
+        return res
+
+    def unlink(self, cr, uid, ids, context=None):
+        res = super(account_fiscalyear, self).unlink(
+            cr, uid, ids, context=context)
+        self.pool.get('account.asset.asset').clear_caches()
+        return res
+
+
+class account_fiscalyear_close_state(orm.TransientModel):
+    _inherit = 'account.fiscalyear.close.state'
+
+    def data_save(self, cr, uid, ids, context=None):
+        # the fiscal year state is updated via SQL
+        res = super(account_fiscalyear_close_state, self).data_save(
+            cr, uid, ids, context=context)
+        self.pool.get('account.asset.asset').clear_caches()
+        return res
+
+
+class account_period(orm.Model):
+    _inherit = 'account.period'
+
+    def create(self, cr, uid, vals, context=None):
+        res = super(account_period, self).create(
+            cr, uid, vals, context=context)
+        self.pool.get('account.asset.asset').clear_caches()
+        return res
+
+    def write(self, cr, uid, ids, vals, context=None):
+        res = super(account_period, self).write(
+            cr, uid, ids, vals, context=context)
+        self.pool.get('account.asset.asset').clear_caches()
+        return res
+
+    def unlink(self, cr, uid, ids, context=None):
+        res = super(account_period, self).unlink(
+            cr, uid, ids, context=context)
+        self.pool.get('account.asset.asset').clear_caches()
+        return res
@@ -23,17 +23,53 @@
 
 import time
 import calendar
-from datetime import datetime
+from array import array
+from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 
+import psycopg2
+
 from openerp.osv import fields, orm
 from openerp.addons.decimal_precision import decimal_precision as dp
 from openerp import tools
+from openerp.tools.float_utils import float_round
 from openerp.tools.translate import _
 from openerp import SUPERUSER_ID
 import logging
 _logger = logging.getLogger(__name__)
 
+# number of depreciation lines inserted per INSERT statement
+DEPRECIATION_LINE_INSERT_CHUNK = 1000
+# retries of a posting partition on concurrent update errors
+POSTING_MAX_TRIES = 5
+# Depreciated value of the assets with ids %(ids)s, summing the posted
+# depreciation and removal lines of the active normal assets of their
+# hierarchy.
+ASSET_DEPRECIATED_VALUE_SQL = (
+    "WITH RECURSIVE tree (root_id, asset_id) AS ("
+    "  SELECT id, id FROM account_asset_asset WHERE id IN %(ids)s "
+    "  UNION ALL "
+    "  SELECT tree.root_id, a.id FROM account_asset_asset a "
+    "  INNER JOIN tree ON a.parent_id = tree.asset_id) "
+    "SELECT tree.root_id, COALESCE(SUM(dl.amount), 0.0) "
+    "FROM tree "
+    "LEFT JOIN account_asset_asset a ON a.id = tree.asset_id "
+    "  AND a.type = 'normal' AND a.active = TRUE "
+    "LEFT JOIN account_asset_depreciation_line dl ON dl.asset_id = a.id "
+    "  AND dl.type IN ('depreciate', 'remove') "
+    "  AND (dl.init_entry = TRUE OR dl.move_check = TRUE) "
+    "GROUP BY tree.root_id")
+# asset fields used as input for the depreciation table computation
+FIELDS_AFFECTS_ASSET_TABLE = set([
+    'purchase_value', 'salvage_value', 'date_start', 'method',
+    'method_number', 'method_period', 'method_end',
+    'method_progress_factor', 'method_time', 'prorata', 'company_id'])
+
+# asset fields which are shown in the Assets Analysis report
+FIELDS_AFFECTS_ASSET_REPORT = set([
+    'date_start', 'date_remove', 'purchase_value', 'salvage_value',
+    'category_id', 'partner_id', 'state', 'company_id'])
+
 
 class dummy_fy(object):
     def __init__(self, *args, **argv):
@@ -41,6 +77,57 @@ class dummy_fy(object):
             setattr(self, key, arg)
 
 
+class dummy_asset(dummy_fy):
+    """ asset parameters of a depreciation board simulation """
+
+
+class depreciation_simulation(object):
+    """
+    Depreciation tables of simulated assets stored in flat arrays.
+    The lines of asset i are found from offsets[i] up to offsets[i + 1]
+    in the line arrays. Line dates are stored as date ordinals.
+    """
+
+    def __init__(self):
+        self.offsets = array('l', [0])
+        self.dates = array('l')
+        self.amounts = array('d')
+        self.depreciated_values = array('d')
+        self.remaining_values = array('d')
+        self.init_entries = array('b')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def append(self, lines):
+        for line in lines:
+            self.dates.append(line['line_date'].toordinal())
+            self.amounts.append(line['amount'])
+            self.depreciated_values.append(line['depreciated_value'])
+            self.remaining_values.append(line['remaining_value'])
+            self.init_entries.append(line['init_entry'] and 1 or 0)
+        self.offsets.append(len(self.dates))
+
+    def get_lines(self, index):
+        """
+        Returns the lines of the asset at index as
+        (date, amount, depreciated value, remaining value) tuples.
+        """
+        return [
+            (date.fromordinal(self.dates[i]), self.amounts[i],
+             self.depreciated_values[i], self.remaining_values[i])
+            for i in xrange(self.offsets[index], self.offsets[index + 1])]
+
+    def get_totals(self):
+        """
+        Returns the depreciation amount of all assets per line date.
+        """
+        totals = {}
+        for i, ordinal in enumerate(self.dates):
+            totals[ordinal] = totals.get(ordinal, 0.0) + self.amounts[i]
+        return [(date.fromordinal(x), totals[x]) for x in sorted(totals)]
+
+
 class account_asset_category(orm.Model):
     _name = 'account.asset.category'
     _description = 'Asset category'
@@ -229,6 +316,270 @@ class account_asset_recompute_trigger(orm.Model):
     }
 
 
+class account_asset_recompute_dirty(orm.Model):
+    """
+    Dirty set of the assets whose depreciation table needs to be recomputed
+    because of a change of the table inputs (values, method, dates or
+    fiscal years spanned by the table).
+    """
+    _name = 'account.asset.recompute.dirty'
+    _description = "Assets with depreciation tables to recompute"
+    _log_access = False
+    _columns = {
+        'asset_id': fields.many2one(
+            'account.asset.asset', 'Asset',
+            required=True, ondelete='cascade', select=True),
+        'reason': fields.char('Reason', size=64, required=True),
+        'date_trigger': fields.datetime('Trigger Date', readonly=True),
+    }
+
+    def _mark_assets(self, cr, uid, asset_ids, reason, context=None):
+        for sub_ids in cr.split_for_in_conditions(asset_ids):
+            cr.execute(
+                "INSERT INTO account_asset_recompute_dirty "
+                "(asset_id, reason, date_trigger) "
+                "SELECT a.id, %s, (now() at time zone 'UTC') "
+                "FROM account_asset_asset a "
+                "WHERE a.id IN %s AND a.type = 'normal' "
+                "AND NOT EXISTS ("
+                "SELECT 1 FROM account_asset_recompute_dirty d "
+                "WHERE d.asset_id = a.id)",
+                (reason, sub_ids))
+        return True
+
+    def _mark_fiscalyear_assets(self, cr, uid, company_id, date_start,
+                                date_stop, reason, context=None):
+        """
+        Marks the assets with a depreciation table spanning the dates
+        of a created or modified fiscal year.
+        When the fiscal year is (or becomes) the first fiscal year of the
+        company, the tables of all assets starting before its end are
+        affected since undefined fiscal years are derived from it.
+        """
+        cr.execute(
+            "SELECT MIN(date_start) FROM account_fiscalyear "
+            "WHERE company_id = %s", (company_id,))
+        first_fy_date_start = cr.fetchone()[0]
+        first_fy = not first_fy_date_start \
+            or date_start <= first_fy_date_start
+        cr.execute(
+            "INSERT INTO account_asset_recompute_dirty "
+            "(asset_id, reason, date_trigger) "
+            "SELECT a.id, %(reason)s, (now() at time zone 'UTC') "
+            "FROM account_asset_asset a "
+            "WHERE a.company_id = %(company_id)s AND a.type = 'normal' "
+            "AND a.state IN ('draft', 'open') "
+            "AND a.date_start <= %(date_stop)s "
+            "AND (%(first_fy)s OR COALESCE("
+            "  (SELECT MAX(dl.line_date) "
+            "   FROM account_asset_depreciation_line dl "
+            "   WHERE dl.asset_id = a.id AND dl.type = 'depreciate'), "
+            "  %(date_start)s) >= %(date_start)s) "
+            "AND NOT EXISTS (SELECT 1 FROM account_asset_recompute_dirty d "
+            "WHERE d.asset_id = a.id)",
+            {'reason': reason, 'company_id': company_id,
+             'date_start': date_start, 'date_stop': date_stop,
+             'first_fy': first_fy})
+        return True
+
+    def _get_dirty_asset_ids(self, cr, uid, asset_ids, context=None):
+        res = []
+        for sub_ids in cr.split_for_in_conditions(asset_ids):
+            cr.execute(
+                "SELECT DISTINCT asset_id FROM account_asset_recompute_dirty "
+                "WHERE asset_id IN %s", (sub_ids,))
+            res += [x[0] for x in cr.fetchall()]
+        return res
+
+    def _clear_assets(self, cr, uid, asset_ids, context=None):
+        for sub_ids in cr.split_for_in_conditions(asset_ids):
+            cr.execute(
+                "DELETE FROM account_asset_recompute_dirty "
+                "WHERE asset_id IN %s", (sub_ids,))
+        return True
+
+
+class account_asset_posting_job(orm.Model):
+    """
+    Partition of assets whose depreciation lines of a period are posted
+    in a separate transaction by a cron worker,
+    cf. account_asset_asset._compute_entries_parallel.
+    """
+    _name = 'account.asset.posting.job'
+    _description = "Asset depreciation posting job"
+    _order = 'id desc'
+    _columns = {
+        'period_id': fields.many2one(
+            'account.period', 'Period', required=True, readonly=True),
+        'company_id': fields.many2one(
+            'res.company', 'Company', readonly=True),
+        'asset_ids': fields.many2many(
+            'account.asset.asset', 'account_asset_posting_job_rel',
+            'job_id', 'asset_id', 'Assets', readonly=True),
+        'chunk_size': fields.integer(
+            'Chunk Size', readonly=True,
+            help="Number of depreciation lines posted per chunk, "
+                 "0 to post them in one chunk."),
+        'state': fields.selection([
+            ('pending', 'Pending'),
+            ('done', 'Done'),
+            ('error', 'Error'),
+            ], 'Status', required=True, readonly=True, select=True),
+        'tries': fields.integer('Tries', readonly=True),
+        'move_count': fields.integer('Created Entries', readonly=True),
+        'error': fields.text('Error', readonly=True),
+        'date_done': fields.datetime('Date Done', readonly=True),
+        'parents_updated': fields.boolean(
+            'Parent Assets Updated', readonly=True,
+            help="The values of the parent assets are updated once "
+                 "all the pending jobs are run."),
+    }
+    _defaults = {
+        'state': 'pending',
+    }
+
+    def _start_workers(self, cr, uid, workers, context=None):
+        """
+        Creates 'workers' one-shot crons running the pending jobs.
+        The crons of previous postings which already ran are removed.
+        """
+        cron_obj = self.pool.get('ir.cron')
+        old_ids = cron_obj.search(cr, SUPERUSER_ID, [
+            ('model', '=', self._name),
+            ('function', '=', 'run_posting_jobs'),
+            ('numbercall', '=', 0),
+            ('active', '=', False)], context=context)
+        if old_ids:
+            cron_obj.unlink(cr, SUPERUSER_ID, old_ids, context=context)
+        nextcall = time.strftime(tools.DEFAULT_SERVER_DATETIME_FORMAT)
+        for i in range(workers):
+            cron_obj.create(cr, SUPERUSER_ID, {
+                'name': _('Asset depreciation posting worker %s') % (i + 1),
+                'user_id': uid,
+                'model': self._name,
+                'function': 'run_posting_jobs',
+                'args': '()',
+                'interval_number': 1,
+                'interval_type': 'minutes',
+                'numbercall': 1,
+                'doall': False,
+                'nextcall': nextcall,
+            }, context=context)
+        return True
+
+    def _lock_job(self, cr, job_id):
+        """
+        Locks a pending job for the current transaction.
+        @return: False if the job is not pending or run by another worker
+        """
+        try:
+            with cr.savepoint():
+                cr.execute(
+                    "SELECT id FROM account_asset_posting_job "
+                    "WHERE id = %s AND state = 'pending' "
+                    "FOR UPDATE NOWAIT", (job_id,))
+                return bool(cr.fetchone())
+        except psycopg2.OperationalError:
+            return False
+
+    def _run_jobs(self, cr, uid, job_ids=None, commit=True, context=None):
+        """
+        Posts the pending jobs, each of them in its own transaction when
+        'commit' is set. The jobs are locked while they are posted, hence
+        several workers can run them concurrently. Jobs failing on a
+        concurrent update are retried on the next run, up to
+        POSTING_MAX_TRIES times.
+        @return: ids of the jobs run
+        """
+        if context is None:
+            context = {}
+        asset_obj = self.pool.get('account.asset.asset')
+        domain = [('state', '=', 'pending')]
+        if job_ids is not None:
+            domain.append(('id', 'in', job_ids))
+        res = []
+        for job_id in self.search(cr, uid, domain, order='id',
+                                  context=context):
+            if not self._lock_job(cr, job_id):
+                continue
+            job = self.browse(cr, uid, job_id, context=context)
+            ctx = dict(context, asset_posting_chunk_size=job.chunk_size,
+                       asset_posting_skip_parents=True)
+            ctx.pop('asset_posting_commit', None)
+            vals = {'tries': job.tries + 1}
+            try:
+                with cr.savepoint():
+                    move_ids = asset_obj._compute_entries(
+                        cr, job.create_uid.id,
+                        [x.id for x in job.asset_ids], job.period_id.id,
+                        context=ctx)
+                vals.update({
+                    'state': 'done',
+                    'move_count': len(move_ids),
+                    'error': False,
+                    'date_done': time.strftime(
+                        tools.DEFAULT_SERVER_DATETIME_FORMAT),
+                })
+            except psycopg2.OperationalError as exc:
+                _logger.exception('Asset depreciation posting error')
+                vals['error'] = tools.ustr(exc)
+                if exc.pgcode not in orm.PG_CONCURRENCY_ERRORS_TO_RETRY \
+                        or vals['tries'] >= POSTING_MAX_TRIES:
+                    vals['state'] = 'error'
+            except Exception as exc:
+                _logger.exception('Asset depreciation posting error')
+                vals['state'] = 'error'
+                if isinstance(exc, orm.except_orm):
+                    vals['error'] = exc.value
+                else:
+                    vals['error'] = tools.ustr(exc)
+            self.write(cr, uid, [job_id], vals, context=context)
+            if commit:
+                cr.commit()
+            _logger.info(
+                "Asset depreciation posting: job %s %s, %s entries created",
+                job_id, vals.get('state', 'pending'),
+                vals.get('move_count', 0))
+            res.append(job_id)
+        if self._update_parent_assets(cr, uid, context=context) and commit:
+            cr.commit()
+        return res
+
+    def _update_parent_assets(self, cr, uid, context=None):
+        """
+        Once no job is pending, updates at once the values of the parent
+        assets of the assets posted by the jobs. The jobs do not update
+        them so that they do not lock the same parent assets.
+        @return: True if parent assets were updated
+        """
+        if self.search(cr, uid, [('state', '=', 'pending')], limit=1,
+                       context=context):
+            return False
+        job_ids = self.search(cr, uid, [('parents_updated', '=', False)],
+                              context=context)
+        if not job_ids:
+            return False
+        asset_obj = self.pool.get('account.asset.asset')
+        cr.execute(
+            "SELECT DISTINCT asset_id FROM account_asset_posting_job_rel "
+            "WHERE job_id IN %s", (tuple(job_ids),))
+        asset_ids = [x[0] for x in cr.fetchall()]
+        parent_ids = list(
+            set(asset_obj._get_assets(cr, uid, asset_ids, context=context))
+            - set(asset_ids))
+        if parent_ids:
+            asset_obj._update_depreciated_values(
+                cr, uid, parent_ids, context=context)
+        self.write(cr, uid, job_ids, {'parents_updated': True},
+                   context=context)
+        return True
+
+    def run_posting_jobs(self, cr, uid, context=None):
+        """Entry point of the cron workers"""
+        self._run_jobs(cr, uid, context=context)
+        return True
+
+
 class account_asset_asset(orm.Model):
     _name = 'account.asset.asset'
     _description = 'Asset'
@@ -236,6 +587,10 @@ class account_asset_asset(orm.Model):
     _parent_store = True
 
     def unlink(self, cr, uid, ids, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        self.pool.get('asset.asset.report')._mark_assets(
+            cr, uid, ids, context=context)
         for asset in self.browse(cr, uid, ids, context=context):
             if asset.state != 'draft':
                 raise orm.except_orm(
@@ -262,6 +617,82 @@ class account_asset_asset(orm.Model):
         else:
             return False
 
+    @tools.ormcache(skiparg=3)
+    def _get_fy_calendar(self, cr, uid, company_id):
+        """
+        Returns the fiscal years and periods of a company, ordered by date.
+        The calendar is cached until a fiscal year or period is changed,
+        hence the returned data should not be modified.
+        """
+        cr.execute(
+            "SELECT id, date_start, date_stop, state "
+            "FROM account_fiscalyear WHERE company_id = %s "
+            "ORDER BY date_start, id", (company_id,))
+        fiscalyears = cr.dictfetchall()
+        cr.execute(
+            "SELECT id, date_start, date_stop, special "
+            "FROM account_period WHERE company_id = %s "
+            "ORDER BY date_start, special DESC, id", (company_id,))
+        periods = cr.dictfetchall()
+        return {
+            'fiscalyears': fiscalyears,
+            'fy_index': dict([(x['id'], x) for x in fiscalyears]),
+            'periods': periods,
+        }
+
+    def _get_calendar(self, cr, uid, company_id, context=None):
+        """
+        Returns the fiscal calendar of the company, or the calendar
+        passed via the 'asset_fy_calendar' context key
+        by depreciation board simulations.
+        """
+        return (context or {}).get('asset_fy_calendar') or \
+            self._get_fy_calendar(cr, uid, company_id)
+
+    def _make_fy_calendar(self, cr, uid, fiscalyears, context=None):
+        """
+        Builds a calendar with the structure of _get_fy_calendar
+        from a list of fiscal year dicts (date_start, date_stop and
+        optionally id and state).
+        """
+        fiscalyears = sorted(
+            [dict(x) for x in fiscalyears], key=lambda x: x['date_start'])
+        for i, fy in enumerate(fiscalyears):
+            fy.setdefault('id', i + 1)
+            fy.setdefault('state', 'draft')
+        return {
+            'fiscalyears': fiscalyears,
+            'fy_index': dict([(x['id'], x) for x in fiscalyears]),
+            'periods': [],
+        }
+
+    def _find_fiscalyear(self, cr, uid, company_id, date, context=None):
+        """
+        Calendar based equivalent of account.fiscalyear.find.
+        @param date: date string or datetime
+        @return: fiscal year dict or None
+        """
+        if isinstance(date, datetime):
+            date = date.strftime('%Y-%m-%d')
+        calendar = self._get_calendar(cr, uid, company_id, context=context)
+        for fy in calendar['fiscalyears']:
+            if fy['date_start'] <= date <= fy['date_stop']:
+                return fy
+        return None
+
+    def _find_period(self, cr, uid, company_id, date, context=None):
+        """
+        Calendar based equivalent of account.period.find
+        with account_period_prefer_normal.
+        @return: period id or False
+        """
+        calendar = self._get_fy_calendar(cr, uid, company_id)
+        periods = [x for x in calendar['periods']
+                   if x['date_start'] <= date <= x['date_stop']]
+        normal_periods = [x for x in periods if not x['special']]
+        periods = normal_periods or periods
+        return periods and periods[0]['id'] or False
+
     def _get_fy_duration(self, cr, uid, fy_id, option='days', context=None):
         """
         Returns fiscal year duration.
@@ -271,12 +702,22 @@ class account_asset_asset(orm.Model):
                   a started month is counted as a full month
         - years: duration in calendar years, considering also leap years
         """
-        cr.execute(
-            "SELECT date_start, date_stop, "
-            "date_stop-date_start+1 AS total_days "
-            "FROM account_fiscalyear WHERE id=%s" % fy_id)
-        fy_vals = cr.dictfetchall()[0]
-        days = fy_vals['total_days']
+        context = context or {}
+        company_id = context.get('company_id')
+        fy_vals = False
+        if company_id or context.get('asset_fy_calendar'):
+            fy_vals = self._get_calendar(
+                cr, uid, company_id, context=context)['fy_index'].get(fy_id)
+        if not fy_vals:
+            cr.execute(
+                "SELECT company_id FROM account_fiscalyear WHERE id=%s",
+                (fy_id,))
+            company_id = cr.fetchone()[0]
+            fy_vals = self._get_fy_calendar(
+                cr, uid, company_id)['fy_index'][fy_id]
+        days = (datetime.strptime(fy_vals['date_stop'], '%Y-%m-%d') -
+                datetime.strptime(fy_vals['date_start'], '%Y-%m-%d')
+                ).days + 1
         months = (int(fy_vals['date_stop'][:4]) -
                   int(fy_vals['date_start'][:4])) * 12 + \
                  (int(fy_vals['date_stop'][5:7]) -
@@ -329,9 +770,9 @@ class account_asset_asset(orm.Model):
                     (fy_date_stop - depreciation_date_start).days + 1
                 if fy_id:
                     first_fy_duration = self._get_fy_duration(
-                        cr, uid, fy_id, option='days')
+                        cr, uid, fy_id, option='days', context=context)
                     first_fy_year_factor = self._get_fy_duration(
-                        cr, uid, fy_id, option='years')
+                        cr, uid, fy_id, option='years', context=context)
                     duration_factor = \
                         float(first_fy_asset_days) / first_fy_duration \
                         * first_fy_year_factor
@@ -343,10 +784,10 @@ class account_asset_asset(orm.Model):
                         float(first_fy_asset_days) / first_fy_duration
             elif fy_id:
                 duration_factor = self._get_fy_duration(
-                    cr, uid, fy_id, option='years')
+                    cr, uid, fy_id, option='years', context=context)
         elif fy_id:
             fy_months = self._get_fy_duration(
-                cr, uid, fy_id, option='months')
+                cr, uid, fy_id, option='months', context=context)
             duration_factor = float(fy_months) / 12
         return duration_factor
 
@@ -429,26 +870,31 @@ class account_asset_asset(orm.Model):
         if not asset.method_number:
             return table
 
-        context['company_id'] = asset.company_id.id
-        fy_obj = self.pool.get('account.fiscalyear')
+        company_id = context['company_id'] = asset.company_id.id
         init_flag = False
-        try:
-            fy_id = fy_obj.find(cr, uid, asset.date_start, context=context)
-            fy = fy_obj.browse(cr, uid, fy_id)
+        fy_vals = self._find_fiscalyear(
+            cr, uid, company_id, asset.date_start, context=context)
+        if fy_vals:
+            fy_id = fy_vals['id']
+            fy = dummy_fy(**fy_vals)
             if fy.state == 'done':
                 init_flag = True
             fy_date_start = datetime.strptime(fy.date_start, '%Y-%m-%d')
             fy_date_stop = datetime.strptime(fy.date_stop, '%Y-%m-%d')
-        except:
+        else:
             # The following logic is used when no fiscalyear
             # is defined for the asset start date:
-            # - We lookup the first fiscal year defined in the system
+            # - We lookup the first fiscal year defined for the company
             # - The 'undefined' fiscal years are assumed to be years
             # with a duration equals to calendar year
-            cr.execute(
-                "SELECT id, date_start, date_stop "
-                "FROM account_fiscalyear ORDER BY date_stop ASC LIMIT 1")
-            first_fy = cr.dictfetchone()
+            fiscalyears = self._get_calendar(
+                cr, uid, company_id, context=context)['fiscalyears']
+            if not fiscalyears:
+                raise orm.except_orm(
+                    _('Error!'),
+                    _("No fiscal year defined for company '%s'.")
+                    % asset.company_id.name)
+            first_fy = fiscalyears[0]
             first_fy_date_start = datetime.strptime(
                 first_fy['date_start'], '%Y-%m-%d')
             asset_date_start = datetime.strptime(asset.date_start, '%Y-%m-%d')
@@ -486,16 +932,13 @@ class account_asset_asset(orm.Model):
                 'date_stop': fy_date_stop,
                 'init': init_flag})
             fy_date_start = fy_date_stop + relativedelta(days=1)
-            try:
-                fy_id = fy_obj.find(cr, uid, fy_date_start, context=context)
-                init_flag = False
-            except:
-                fy_id = False
+            fy_vals = self._find_fiscalyear(
+                cr, uid, company_id, fy_date_start, context=context)
+            fy_id = fy_vals and fy_vals['id'] or False
             if fy_id:
-                fy = fy_obj.browse(cr, uid, fy_id)
-                if fy.state == 'done':
-                    init_flag = True
-                fy_date_stop = datetime.strptime(fy.date_stop, '%Y-%m-%d')
+                init_flag = fy_vals['state'] == 'done'
+                fy_date_stop = datetime.strptime(
+                    fy_vals['date_stop'], '%Y-%m-%d')
             else:
                 fy_date_stop = fy_date_stop + relativedelta(years=1)
 
@@ -601,179 +1044,373 @@ class account_asset_asset(orm.Model):
 
         return table
 
+    def _group_start_lines(self, cr, uid, asset, table, context=None):
+        """
+        Groups the lines of the table prior to the depreciation start period.
+        """
+        depreciation_start_date = datetime.strptime(
+            asset.date_start, '%Y-%m-%d')
+        lines = table[0]['lines']
+        lines1 = []
+        lines2 = []
+        flag = lines[0]['date'] < depreciation_start_date
+        for line in lines:
+            if flag:
+                lines1.append(line)
+                if line['date'] >= depreciation_start_date:
+                    flag = False
+            else:
+                lines2.append(line)
+        if lines1:
+            def group_lines(x, y):
+                y.update({'amount': x['amount'] + y['amount']})
+                return y
+            lines1 = [reduce(group_lines, lines1)]
+            lines1[0]['depreciated_value'] = 0.0
+        table[0]['lines'] = lines1 + lines2
+        return table
+
+    def simulate_depreciation_boards(self, cr, uid, assets_vals, fiscalyears,
+                                     context=None):
+        """
+        Computes the depreciation tables of hypothetical assets
+        without reading or writing asset records.
+        @param assets_vals: list of dicts with the asset parameters
+            purchase_value, salvage_value, date_start, method,
+            method_number, method_period, method_time, method_end,
+            method_progress_factor and prorata
+        @param fiscalyears: list of fiscal year dicts with date_start,
+            date_stop and optionally state, cf. _make_fy_calendar
+        @return: depreciation_simulation
+        """
+        ctx = dict(context or {}, asset_fy_calendar=self._make_fy_calendar(
+            cr, uid, fiscalyears, context=context))
+        digits = self.pool.get('decimal.precision').precision_get(
+            cr, uid, 'Account')
+        company = dummy_fy(id=False, name=_('Simulation'))
+        defaults = {
+            'salvage_value': 0.0,
+            'method': 'linear',
+            'method_number': 5,
+            'method_time': 'year',
+            'method_period': 'year',
+            'method_end': False,
+            'method_progress_factor': 0.3,
+            'prorata': False,
+        }
+        result = depreciation_simulation()
+        for i, vals in enumerate(assets_vals):
+            asset_vals = dict(defaults, **vals)
+            asset_vals.update({
+                'id': False,
+                'code': False,
+                'name': asset_vals.get('name') or str(i + 1),
+                'company_id': company,
+                'asset_value': asset_vals['purchase_value'] -
+                asset_vals['salvage_value'],
+            })
+            if asset_vals['method_time'] != 'year':
+                asset_vals['prorata'] = True
+            asset = dummy_asset(**asset_vals)
+            lines = []
+            table = self._compute_depreciation_table(
+                cr, uid, asset, context=ctx)
+            if table:
+                self._group_start_lines(cr, uid, asset, table, context=ctx)
+                last_date = table[-1]['lines'][-1]['date']
+                depreciated_value = 0.0
+                for entry in table:
+                    for line in entry['lines']:
+                        if line['date'] == last_date:
+                            amount = asset.asset_value - depreciated_value
+                        else:
+                            amount = line['amount']
+                        amount = float_round(amount, precision_digits=digits)
+                        lines.append({
+                            'line_date': line['date'],
+                            'amount': amount,
+                            'init_entry': entry['init'],
+                            'depreciated_value': float_round(
+                                depreciated_value, precision_digits=digits),
+                            'remaining_value': float_round(
+                                asset.asset_value - depreciated_value -
+                                amount, precision_digits=digits),
+                        })
+                        depreciated_value += amount
+            result.append(lines)
+        return result
+
     def _get_depreciation_entry_name(self, cr, uid, asset, seq, context=None):
         """ use this method to customise the name of the accounting entry """
         return (asset.code or str(asset.id)) + '/' + str(seq)
 
-    def compute_depreciation_board(self, cr, uid, ids, context=None):
-        if not context:
+    def _get_posted_depreciation_data(self, cr, uid, ids, context=None):
+        """
+        Returns, per asset, the number and total amount of the posted
+        depreciation lines (accounting entry or initial balance entry)
+        together with the id and date of the last of these lines.
+        """
+        res = {}
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(
+                "SELECT DISTINCT ON (asset_id) asset_id, id, line_date, "
+                "COUNT(*) OVER w, SUM(amount) OVER w "
+                "FROM account_asset_depreciation_line "
+                "WHERE asset_id IN %s AND type = 'depreciate' "
+                "AND (move_check = TRUE OR init_entry = TRUE) "
+                "WINDOW w AS (PARTITION BY asset_id) "
+                "ORDER BY asset_id, line_date DESC, id DESC",
+                (sub_ids,))
+            for asset_id, line_id, line_date, count, amount in cr.fetchall():
+                res[asset_id] = {
+                    'count': count,
+                    'amount': amount,
+                    'last_line_id': line_id,
+                    'last_line_date': line_date,
+                }
+        return res
+
+    def _unlink_unposted_depreciation_lines(self, cr, uid, ids,
+                                            context=None):
+        """
+        Removes the depreciation lines without accounting entry
+        which are not flagged as initial balance entry.
+        """
+        dl_obj = self.pool.get('account.asset.depreciation.line')
+        for sub_ids in cr.split_for_in_conditions(ids):
+            # Remaining lines chained to a removed line must be relinked
+            # by the standard unlink.
+            cr.execute(
+                "SELECT DISTINCT prev.asset_id "
+                "FROM account_asset_depreciation_line dl "
+                "INNER JOIN account_asset_depreciation_line prev "
+                "ON prev.id = dl.previous_id "
+                "WHERE prev.asset_id IN %s AND prev.type = 'depreciate' "
+                "AND prev.move_id IS NULL AND prev.init_entry = FALSE "
+                "AND NOT (dl.type = 'depreciate' AND dl.move_id IS NULL "
+                "AND dl.init_entry = FALSE)",
+                (sub_ids,))
+            orm_asset_ids = [x[0] for x in cr.fetchall()]
+            if orm_asset_ids:
+                old_ids = dl_obj.search(cr, uid, [
+                    ('asset_id', 'in', orm_asset_ids),
+                    ('type', '=', 'depreciate'),
+                    ('move_id', '=', False),
+                    ('init_entry', '=', False)])
+                dl_obj.unlink(cr, uid, old_ids, context=context)
+            cr.execute(
+                "DELETE FROM account_asset_depreciation_line "
+                "WHERE asset_id IN %s AND type = 'depreciate' "
+                "AND move_id IS NULL AND init_entry = FALSE",
+                (sub_ids,))
+        return True
+
+    def _compute_depreciation_board_lines(self, cr, uid, asset, posted,
+                                          context=None):
+        """
+        Returns the values of the depreciation lines to create for an asset.
+        @param posted: posted depreciation lines data of the asset as
+                       returned by _get_posted_depreciation_data
+        """
+        if context is None:
             context = {}
-        depreciation_lin_obj = self.pool.get(
-            'account.asset.depreciation.line')
         digits = self.pool.get('decimal.precision').precision_get(
             cr, uid, 'Account')
+        context['company_id'] = asset.company_id.id
 
-        for asset in self.browse(cr, uid, ids, context=context):
-            if asset.value_residual == 0.0:
-                continue
-            domain = [
-                ('asset_id', '=', asset.id),
-                ('type', '=', 'depreciate'),
-                '|', ('move_check', '=', True), ('init_entry', '=', True)]
-            posted_depreciation_line_ids = depreciation_lin_obj.search(
-                cr, uid, domain, order='line_date desc')
-            if (len(posted_depreciation_line_ids) > 0):
-                last_depreciation_line = depreciation_lin_obj.browse(
-                    cr, uid, posted_depreciation_line_ids[0], context=context)
+        table = self._compute_depreciation_table(
+            cr, uid, asset, context=context)
+        if not table:
+            return []
+        self._group_start_lines(cr, uid, asset, table, context=context)
+
+        # check table with posted entries and
+        # recompute in case of deviation
+        if posted:
+            last_depreciation_date = datetime.strptime(
+                posted['last_line_date'], '%Y-%m-%d')
+            last_date_in_table = table[-1]['lines'][-1]['date']
+            if last_date_in_table <= last_depreciation_date:
+                raise orm.except_orm(
+                    _('Error!'),
+                    _("The duration of the asset conflicts with the "
+                      "posted depreciation table entry dates."))
+
+            for table_i, entry in enumerate(table):
+                residual_amount_table = \
+                    entry['lines'][-1]['remaining_value']
+                if entry['date_start'] <= last_depreciation_date \
+                        <= entry['date_stop']:
+                    break
+            if entry['date_stop'] == last_depreciation_date:
+                table_i += 1
+                line_i = 0
             else:
-                last_depreciation_line = False
-            domain = [
-                ('asset_id', '=', asset.id),
-                ('type', '=', 'depreciate'),
-                ('move_id', '=', False),
-                ('init_entry', '=', False)]
-            old_depreciation_line_ids = depreciation_lin_obj.search(
-                cr, uid, domain)
-            if old_depreciation_line_ids:
-                depreciation_lin_obj.unlink(
-                    cr, uid, old_depreciation_line_ids, context=context)
-            context['company_id'] = asset.company_id.id
-
-            table = self._compute_depreciation_table(
-                cr, uid, asset, context=context)
-            if not table:
-                continue
-
-            # group lines prior to depreciation start period
-            depreciation_start_date = datetime.strptime(
-                asset.date_start, '%Y-%m-%d')
-            lines = table[0]['lines']
-            lines1 = []
-            lines2 = []
-            flag = lines[0]['date'] < depreciation_start_date
-            for line in lines:
-                if flag:
-                    lines1.append(line)
-                    if line['date'] >= depreciation_start_date:
-                        flag = False
-                else:
-                    lines2.append(line)
-            if lines1:
-                def group_lines(x, y):
-                    y.update({'amount': x['amount'] + y['amount']})
-                    return y
-                lines1 = [reduce(group_lines, lines1)]
-                lines1[0]['depreciated_value'] = 0.0
-            table[0]['lines'] = lines1 + lines2
-
-            # check table with posted entries and
-            # recompute in case of deviation
-            if (len(posted_depreciation_line_ids) > 0):
-                last_depreciation_date = datetime.strptime(
-                    last_depreciation_line.line_date, '%Y-%m-%d')
-                last_date_in_table = table[-1]['lines'][-1]['date']
-                if last_date_in_table <= last_depreciation_date:
-                    raise orm.except_orm(
-                        _('Error!'),
-                        _("The duration of the asset conflicts with the "
-                          "posted depreciation table entry dates."))
-
-                for table_i, entry in enumerate(table):
-                    residual_amount_table = \
-                        entry['lines'][-1]['remaining_value']
-                    if entry['date_start'] <= last_depreciation_date \
-                            <= entry['date_stop']:
+                entry = table[table_i]
+                date_min = entry['date_start']
+                for line_i, line in enumerate(entry['lines']):
+                    residual_amount_table = line['remaining_value']
+                    if date_min <= last_depreciation_date <= line['date']:
                         break
-                if entry['date_stop'] == last_depreciation_date:
-                    table_i += 1
-                    line_i = 0
+                    date_min = line['date']
+                if line['date'] == last_depreciation_date:
+                    line_i += 1
+            table_i_start = table_i
+            line_i_start = line_i
+
+            # check if residual value corresponds with table
+            # and adjust table when needed
+            depreciated_value = posted['amount']
+            residual_amount = asset.asset_value - depreciated_value
+            amount_diff = round(
+                residual_amount_table - residual_amount, digits)
+            if amount_diff:
+                entry = table[table_i_start]
+                if entry['fy_id']:
+                    cr.execute(
+                        "SELECT COALESCE(SUM(amount), 0.0) "
+                        "FROM account_asset_depreciation_line "
+                        "WHERE asset_id = %s AND type = 'depreciate' "
+                        "AND (move_check = TRUE OR init_entry = TRUE) "
+                        "AND line_date >= %s and line_date <= %s",
+                        (asset.id, entry['date_start'], entry['date_stop']))
+                    res = cr.fetchone()
+                    fy_amount_check = res[0]
                 else:
-                    entry = table[table_i]
-                    date_min = entry['date_start']
-                    for line_i, line in enumerate(entry['lines']):
-                        residual_amount_table = line['remaining_value']
-                        if date_min <= last_depreciation_date <= line['date']:
-                            break
-                        date_min = line['date']
-                    if line['date'] == last_depreciation_date:
-                        line_i += 1
-                table_i_start = table_i
-                line_i_start = line_i
-
-                # check if residual value corresponds with table
-                # and adjust table when needed
-                cr.execute(
-                    "SELECT COALESCE(SUM(amount), 0.0) "
-                    "FROM account_asset_depreciation_line "
-                    "WHERE id IN %s",
-                    (tuple(posted_depreciation_line_ids),))
-                res = cr.fetchone()
-                depreciated_value = res[0]
-                residual_amount = asset.asset_value - depreciated_value
-                amount_diff = round(
-                    residual_amount_table - residual_amount, digits)
-                if amount_diff:
-                    entry = table[table_i_start]
-                    if entry['fy_id']:
-                        cr.execute(
-                            "SELECT COALESCE(SUM(amount), 0.0) "
-                            "FROM account_asset_depreciation_line "
-                            "WHERE id in %s "
-                            "      AND line_date >= %s and line_date <= %s",
-                            (tuple(posted_depreciation_line_ids),
-                             entry['date_start'],
-                             entry['date_stop']))
-                        res = cr.fetchone()
-                        fy_amount_check = res[0]
-                    else:
-                        fy_amount_check = 0.0
-                    lines = entry['lines']
-                    for line in lines[line_i_start:-1]:
-                        line['depreciated_value'] = depreciated_value
-                        depreciated_value += line['amount']
-                        fy_amount_check += line['amount']
-                        residual_amount -= line['amount']
-                        line['remaining_value'] = residual_amount
-                    lines[-1]['depreciated_value'] = depreciated_value
-                    lines[-1]['amount'] = entry['fy_amount'] - fy_amount_check
+                    fy_amount_check = 0.0
+                lines = entry['lines']
+                for line in lines[line_i_start:-1]:
+                    line['depreciated_value'] = depreciated_value
+                    depreciated_value += line['amount']
+                    fy_amount_check += line['amount']
+                    residual_amount -= line['amount']
+                    line['remaining_value'] = residual_amount
+                lines[-1]['depreciated_value'] = depreciated_value
+                lines[-1]['amount'] = entry['fy_amount'] - fy_amount_check
 
-            else:
-                table_i_start = 0
-                line_i_start = 0
-
-            seq = len(posted_depreciation_line_ids)
-            depr_line_id = last_depreciation_line and last_depreciation_line.id
-            last_date = table[-1]['lines'][-1]['date']
-            for entry in table[table_i_start:]:
-                for line in entry['lines'][line_i_start:]:
-                    seq += 1
-                    name = self._get_depreciation_entry_name(
-                        cr, uid, asset, seq, context=context)
-                    if line['date'] == last_date:
-                        # ensure that the last entry of the table always
-                        # depreciates the remaining value
-                        cr.execute(
-                            "SELECT COALESCE(SUM(amount), 0.0) "
-                            "FROM account_asset_depreciation_line "
-                            "WHERE type = 'depreciate' AND line_date < %s "
-                            "AND asset_id = %s ",
-                            (last_date, asset.id))
-                        res = cr.fetchone()
-                        amount = asset.asset_value - res[0]
-                    else:
-                        amount = line['amount']
-                    vals = {
-                        'previous_id': depr_line_id,
-                        'amount': amount,
-                        'asset_id': asset.id,
-                        'name': name,
-                        'line_date': line['date'].strftime('%Y-%m-%d'),
-                        'init_entry': entry['init'],
-                    }
-                    depr_line_id = depreciation_lin_obj.create(
-                        cr, uid, vals, context=context)
-                line_i_start = 0
+        else:
+            table_i_start = 0
+            line_i_start = 0
+
+        seq = posted and posted['count'] or 0
+        # value depreciated by the lines preceding the line to create,
+        # as stored by the depreciation line function fields
+        depreciated_value = posted and posted['amount'] or 0.0
+        last_date = table[-1]['lines'][-1]['date']
+        prior_amount = depreciated_value
+        vals_list = []
+        for entry in table[table_i_start:]:
+            for line in entry['lines'][line_i_start:]:
+                seq += 1
+                name = self._get_depreciation_entry_name(
+                    cr, uid, asset, seq, context=context)
+                if line['date'] == last_date:
+                    # ensure that the last entry of the table always
+                    # depreciates the remaining value
+                    amount = asset.asset_value - prior_amount
+                else:
+                    amount = line['amount']
+                amount = float_round(amount, precision_digits=digits)
+                if line['date'] < last_date:
+                    prior_amount += amount
+                vals_list.append({
+                    'amount': amount,
+                    'asset_id': asset.id,
+                    'name': name,
+                    'line_date': line['date'].strftime('%Y-%m-%d'),
+                    'init_entry': entry['init'],
+                    'depreciated_value': float_round(
+                        depreciated_value, precision_digits=digits),
+                    'remaining_value': float_round(
+                        asset.asset_value - depreciated_value - amount,
+                        precision_digits=digits),
+                })
+                depreciated_value += amount
+            line_i_start = 0
+        return vals_list
+
+    def _create_depreciation_lines(self, cr, uid, boards, context=None):
+        """
+        Bulk insert of depreciation lines.
+        @param boards: list of (previous_id, vals_list) tuples, one per
+                       asset, with vals_list as returned by
+                       _compute_depreciation_board_lines
+        """
+        nbr_lines = sum([len(x[1]) for x in boards])
+        if not nbr_lines:
+            return []
+        cr.execute(
+            "SELECT nextval('account_asset_depreciation_line_id_seq') "
+            "FROM generate_series(1, %s)", (nbr_lines,))
+        new_ids = [x[0] for x in cr.fetchall()]
+        rows = []
+        i = 0
+        for previous_id, vals_list in boards:
+            for vals in vals_list:
+                rows.append((
+                    new_ids[i], uid, uid, previous_id, vals['asset_id'],
+                    vals['name'], vals['amount'], vals['line_date'],
+                    vals['init_entry'], vals['depreciated_value'],
+                    vals['remaining_value']))
+                previous_id = new_ids[i]
+                i += 1
+        row_sql = "(%s, %s, (now() at time zone 'UTC'), " \
+            "%s, (now() at time zone 'UTC'), " \
+            "%s, %s, %s, %s, %s, %s, 'depreciate', FALSE, %s, %s)"
+        for x in range(0, len(rows), DEPRECIATION_LINE_INSERT_CHUNK):
+            chunk = rows[x:x + DEPRECIATION_LINE_INSERT_CHUNK]
+            cr.execute(
+                "INSERT INTO account_asset_depreciation_line "
+                "(id, create_uid, create_date, write_uid, write_date, "
+                "previous_id, asset_id, name, amount, line_date, "
+                "init_entry, type, move_check, "
+                "depreciated_value, remaining_value) "
+                "VALUES " + ', '.join([row_sql] * len(chunk)),
+                [v for row in chunk for v in row])
+        return new_ids
 
+    def compute_depreciation_board(self, cr, uid, ids, context=None):
+        if not context:
+            context = {}
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        self.pool.get('account.asset.recompute.dirty')._clear_assets(
+            cr, uid, ids, context=context)
+        assets = [x for x in self.browse(cr, uid, ids, context=context)
+                  if x.value_residual != 0.0]
+        if not assets:
+            return True
+        asset_ids = [x.id for x in assets]
+        posted_data = self._get_posted_depreciation_data(
+            cr, uid, asset_ids, context=context)
+        self._unlink_unposted_depreciation_lines(
+            cr, uid, asset_ids, context=context)
+
+        boards = []
+        init_asset_ids = []
+        for asset in assets:
+            posted = posted_data.get(asset.id)
+            vals_list = self._compute_depreciation_board_lines(
+                cr, uid, asset, posted, context=context)
+            if not vals_list:
+                continue
+            boards.append(
+                (posted and posted['last_line_id'] or None, vals_list))
+            if [x for x in vals_list if x['init_entry']]:
+                init_asset_ids.append(asset.id)
+        self._create_depreciation_lines(cr, uid, boards, context=context)
+        self.pool.get('asset.asset.report')._mark_assets(
+            cr, uid, asset_ids, context=context)
+
+        self.pool.get('account.asset.depreciation.line').invalidate_cache(
+            cr, uid, context=context)
+        self.invalidate_cache(
+            cr, uid, ['depreciation_line_ids'], asset_ids, context=context)
+        if init_asset_ids:
+            # initial balance entries are included in the depreciated value
+            self._update_depreciated_values(
+                cr, uid, self._get_assets(cr, uid, init_asset_ids, context),
+                context=context)
         return True
 
     def validate(self, cr, uid, ids, context=None):
@@ -834,29 +1471,46 @@ class account_asset_asset(orm.Model):
                 res[asset.id] = _value_get(asset)
         return res
 
+    def _get_depreciated_values(self, cr, uid, ids, context=None):
+        """
+        Returns the depreciated value of assets, including the value
+        depreciated by their (active) child assets.
+        """
+        res = {}
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(ASSET_DEPRECIATED_VALUE_SQL, {'ids': sub_ids})
+            res.update(dict(cr.fetchall()))
+        return res
+
+    def _update_depreciated_values(self, cr, uid, ids, context=None):
+        """
+        Stores value_residual and value_depreciated of assets
+        with one UPDATE statement per chunk of ids.
+        """
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(
+                "WITH v (asset_id, amount) AS (" +
+                ASSET_DEPRECIATED_VALUE_SQL + ") "
+                "UPDATE account_asset_asset a "
+                "SET value_depreciated = v.amount, "
+                "value_residual = COALESCE(a.asset_value, 0.0) - v.amount "
+                "FROM v WHERE a.id = v.asset_id",
+                {'ids': sub_ids})
+        self.invalidate_cache(
+            cr, uid, ['value_residual', 'value_depreciated'], ids,
+            context=context)
+        return True
+
     def _compute_depreciation(self, cr, uid, ids, name, args, context=None):
         res = {}
+        value_depreciated = self._get_depreciated_values(
+            cr, uid, ids, context=context)
         for asset in self.browse(cr, uid, ids, context=context):
-            res[asset.id] = {}
-            child_ids = self.search(cr, uid,
-                                    [('parent_id', 'child_of', [asset.id]),
-                                     ('type', '=', 'normal')],
-                                    context=context)
-            if child_ids:
-                cr.execute(
-                    "SELECT COALESCE(SUM(amount),0.0) AS amount "
-                    "FROM account_asset_depreciation_line "
-                    "WHERE asset_id in %s "
-                    "AND type in ('depreciate','remove') "
-                    "AND (init_entry=TRUE OR move_check=TRUE)",
-                    (tuple(child_ids),))
-                value_depreciated = cr.fetchone()[0]
-            else:
-                value_depreciated = 0.0
-            res[asset.id]['value_residual'] = \
-                asset.asset_value - value_depreciated
-            res[asset.id]['value_depreciated'] = \
-                value_depreciated
+            res[asset.id] = {
+                'value_residual':
+                    asset.asset_value - value_depreciated[asset.id],
+                'value_depreciated': value_depreciated[asset.id],
+            }
         return res
 
     def _move_line_check(self, cr, uid, ids, name, args, context=None):
@@ -889,33 +1543,32 @@ class account_asset_asset(orm.Model):
 
     def _get_assets(self, cr, uid, ids, context=None):
         asset_ids = []
-        for asset in self.browse(cr, uid, ids, context=context):
-            def _parent_get(record):
-                asset_ids.append(record.id)
-                if record.parent_id:
-                    _parent_get(record.parent_id)
-            _parent_get(asset)
-        return asset_ids
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(
+                "WITH RECURSIVE ancestor (id, parent_id) AS ("
+                "  SELECT id, parent_id FROM account_asset_asset "
+                "  WHERE id IN %s "
+                "  UNION "
+                "  SELECT a.id, a.parent_id FROM account_asset_asset a "
+                "  INNER JOIN ancestor ON a.id = ancestor.parent_id) "
+                "SELECT id FROM ancestor",
+                (sub_ids,))
+            asset_ids += [x[0] for x in cr.fetchall()]
+        return list(set(asset_ids))
 
     def _get_assets_from_dl(self, cr, uid, ids, context=None):
-        asset_ids = []
-        for dl in filter(
-                lambda x: x.type in ['depreciate', 'remove'] and
-                        (x.init_entry or x.move_id),
-                self.pool.get('account.asset.depreciation.line').browse(
-                    cr, uid, ids, context=context)):
-            res = []
-
-            def _parent_get(record):
-                res.append(record.id)
-                if record.parent_id:
-                    res.append(_parent_get(record.parent_id))
-
-            _parent_get(dl.asset_id)
-            for asset_id in res:
-                if asset_id not in asset_ids:
-                    asset_ids.append(asset_id)
-        return asset_ids
+        if not ids:
+            return []
+        cr.execute(
+            "SELECT DISTINCT asset_id FROM account_asset_depreciation_line "
+            "WHERE id IN %s AND type IN ('depreciate', 'remove') "
+            "AND (init_entry = TRUE OR move_id IS NOT NULL)",
+            (tuple(ids),))
+        asset_ids = [x[0] for x in cr.fetchall()]
+        if not asset_ids:
+            return []
+        return self.pool.get('account.asset.asset')._get_assets(
+            cr, uid, asset_ids, context=context)
 
     def _get_method(self, cr, uid, context=None):
         return self.pool.get('account.asset.category')._get_method(
@@ -1202,6 +1855,77 @@ class account_asset_asset(orm.Model):
         return super(account_asset_asset, self).copy(
             cr, uid, id, default, context=context)
 
+    def _check_unposted_lines(self, cr, uid, ids, period, context=None):
+        """
+        Raises an error for the first asset with unposted depreciation lines
+        prior to the given period.
+        """
+        unposted_asset_ids = []
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(
+                "SELECT DISTINCT asset_id "
+                "FROM account_asset_depreciation_line "
+                "WHERE asset_id IN %s AND type = 'depreciate' "
+                "AND init_entry = FALSE AND move_check = FALSE "
+                "AND line_date < %s",
+                (sub_ids, period.date_start))
+            unposted_asset_ids += [x[0] for x in cr.fetchall()]
+        if unposted_asset_ids:
+            asset_id = [x for x in ids if x in unposted_asset_ids][0]
+            asset = self.browse(cr, uid, asset_id, context=context)
+            asset_ref = asset.code and '%s (ref: %s)' \
+                % (asset.name, asset.code) or asset.name
+            raise orm.except_orm(
+                _('Error!'),
+                _("Asset '%s' contains unposted lines "
+                  "prior to the selected period."
+                  "\nPlease post these entries first !") % asset_ref)
+        return True
+
+    def _recompute_triggered_boards(self, cr, uid, ids, context=None):
+        """
+        Recomputes the depreciation boards of the assets in the dirty set
+        and of the assets belonging to a company with open recompute
+        triggers.
+        @return: ids of the processed triggers
+        """
+        recompute_obj = self.pool.get('account.asset.recompute.trigger')
+        dirty_obj = self.pool.get('account.asset.recompute.dirty')
+        recompute_asset_ids = set(dirty_obj._get_dirty_asset_ids(
+            cr, uid, ids, context=context))
+        recompute_ids = recompute_obj.search(
+            cr, SUPERUSER_ID, [('state', '=', 'open')])
+        triggers = []
+        if recompute_ids:
+            recompute_triggers = recompute_obj.read(
+                cr, uid, recompute_ids, ['company_id'])
+            assets = self.browse(cr, uid, ids, context=context)
+            asset_company_ids = set([x.company_id.id for x in assets])
+            triggers = filter(
+                lambda x: x['company_id'][0] in asset_company_ids,
+                recompute_triggers)
+            trigger_company_ids = set(
+                [x['company_id'][0] for x in triggers])
+            recompute_asset_ids |= set([
+                x.id for x in assets
+                if x.company_id.id in trigger_company_ids])
+        if recompute_asset_ids:
+            self.compute_depreciation_board(
+                cr, uid, [x for x in ids if x in recompute_asset_ids],
+                context=context)
+        return [x['id'] for x in triggers]
+
+    def _close_recompute_triggers(self, cr, uid, trigger_ids, context=None):
+        if trigger_ids:
+            recompute_vals = {
+                'date_completed': time.strftime(
+                    tools.DEFAULT_SERVER_DATETIME_FORMAT),
+                'state': 'done',
+            }
+            self.pool.get('account.asset.recompute.trigger').write(
+                cr, SUPERUSER_ID, trigger_ids, recompute_vals)
+        return True
+
     def _compute_entries(self, cr, uid, ids, period_id,
                          check_triggers=False, context=None):
         # To DO : add ir_cron job calling this method to
@@ -1212,39 +1936,11 @@ class account_asset_asset(orm.Model):
         period_obj = self.pool.get('account.period')
         depreciation_obj = self.pool.get('account.asset.depreciation.line')
         period = period_obj.browse(cr, uid, period_id, context=context)
+
+        self._check_unposted_lines(cr, uid, ids, period, context=context)
         if check_triggers:
-            recompute_obj = self.pool.get('account.asset.recompute.trigger')
-            recompute_ids = recompute_obj.search(
-                cr, SUPERUSER_ID, [('state', '=', 'open')])
-            if recompute_ids:
-                recompute_triggers = recompute_obj.read(
-                    cr, uid, recompute_ids, ['company_id'])
-
-        assets = self.browse(cr, uid, ids, context=context)
-        for asset in assets:
-            depreciation_ids = depreciation_obj.search(cr, uid, [
-                ('asset_id', '=', asset.id),
-                ('type', '=', 'depreciate'),
-                ('init_entry', '=', False),
-                ('line_date', '<', period.date_start),
-                ('move_check', '=', False)], context=context)
-            if depreciation_ids:
-                for line in depreciation_obj.browse(
-                        cr, uid, depreciation_ids):
-                    asset_ref = asset.code and '%s (ref: %s)' \
-                        % (asset.name, asset.code) or asset.name
-                    raise orm.except_orm(
-                        _('Error!'),
-                        _("Asset '%s' contains unposted lines "
-                          "prior to the selected period."
-                          "\nPlease post these entries first !") % asset_ref)
-            if check_triggers and recompute_ids:
-                triggers = filter(
-                    lambda x: x['company_id'][0] == asset.company_id.id,
-                    recompute_triggers)
-                if triggers:
-                    self.compute_depreciation_board(
-                        cr, uid, [asset.id], context=context)
+            trigger_ids = self._recompute_triggered_boards(
+                cr, uid, ids, context=context)
         depreciation_ids = depreciation_obj.search(cr, uid, [
             ('asset_id', 'in', ids),
             ('type', '=', 'depreciate'),
@@ -1252,29 +1948,99 @@ class account_asset_asset(orm.Model):
             ('line_date', '<=', period.date_stop),
             ('line_date', '>=', period.date_start),
             ('move_check', '=', False)], context=context)
-        for depreciation in depreciation_obj.browse(
-                cr, uid, depreciation_ids, context=context):
-            context.update({'depreciation_date': depreciation.line_date})
-            result += depreciation_obj.create_move(
-                cr, uid, [depreciation.id], context=context)
-
-        if check_triggers and recompute_ids:
-            asset_company_ids = set([x.company_id.id for x in assets])
-            triggers = filter(
-                lambda x: x['company_id'][0] in asset_company_ids,
-                recompute_triggers)
-            if triggers:
-                recompute_vals = {
-                    'date_completed': time.strftime(
-                        tools.DEFAULT_SERVER_DATETIME_FORMAT),
-                    'state': 'done',
-                }
-                trigger_ids = [x['id'] for x in triggers]
-                recompute_obj.write(
-                    cr, SUPERUSER_ID, trigger_ids, recompute_vals)
+        chunk_size = context.get('asset_posting_chunk_size')
+        if context.get('asset_posting_skip_parents') and not chunk_size:
+            # posting jobs always post in bulk, which does not update
+            # the parent assets
+            chunk_size = max(len(depreciation_ids), 1)
+        if chunk_size:
+            for x in range(0, len(depreciation_ids), chunk_size):
+                result += depreciation_obj.create_move_bulk(
+                    cr, uid, depreciation_ids[x:x + chunk_size],
+                    context=context)
+                if context.get('asset_posting_commit'):
+                    cr.commit()
+                    _logger.info(
+                        "Asset depreciation posting: %s/%s lines posted",
+                        min(x + chunk_size, len(depreciation_ids)),
+                        len(depreciation_ids))
+        else:
+            for depreciation in depreciation_obj.browse(
+                    cr, uid, depreciation_ids, context=context):
+                context.update({'depreciation_date': depreciation.line_date})
+                result += depreciation_obj.create_move(
+                    cr, uid, [depreciation.id], context=context)
 
+        if check_triggers:
+            self._close_recompute_triggers(
+                cr, uid, trigger_ids, context=context)
         return result
 
+    def _get_posting_partitions(self, cr, uid, ids, size, context=None):
+        """
+        Splits the assets into partitions of at most 'size' assets which
+        can be posted independently. The partitions are made per company,
+        the assets being sorted by category. View assets are left out
+        since they have no depreciation lines: their values are updated
+        once all the partitions are posted.
+        @return: list of (company_id, asset_ids) tuples
+        """
+        assets = []
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(
+                "SELECT company_id, category_id, id "
+                "FROM account_asset_asset "
+                "WHERE id IN %s AND type = 'normal'",
+                (sub_ids,))
+            assets += cr.fetchall()
+        partitions = []
+        current = None
+        for company_id, category_id, asset_id in sorted(
+                assets, key=lambda x: (x[0], x[1] or 0, x[2])):
+            if current is None or current[0] != company_id \
+                    or len(current[1]) >= size:
+                current = (company_id, [])
+                partitions.append(current)
+            current[1].append(asset_id)
+        return partitions
+
+    def _compute_entries_parallel(self, cr, uid, ids, period_id, workers,
+                                  partition_size, chunk_size=0,
+                                  check_triggers=False, context=None):
+        """
+        Variant of _compute_entries queuing the posting of the depreciation
+        lines in jobs of at most 'partition_size' assets, cf.
+        account.asset.posting.job. The jobs are run by 'workers' cron
+        workers, each of them posting every job in its own transaction,
+        so errors only roll back the failing partition.
+        @param chunk_size: number of depreciation lines posted per chunk
+            within a job, 0 to post them one by one
+        @return: ids of the created jobs
+        """
+        if context is None:
+            context = {}
+        job_obj = self.pool.get('account.asset.posting.job')
+        period = self.pool.get('account.period').browse(
+            cr, uid, period_id, context=context)
+        self._check_unposted_lines(cr, uid, ids, period, context=context)
+        if check_triggers:
+            trigger_ids = self._recompute_triggered_boards(
+                cr, uid, ids, context=context)
+            self._close_recompute_triggers(
+                cr, uid, trigger_ids, context=context)
+        job_ids = []
+        for company_id, asset_ids in self._get_posting_partitions(
+                cr, uid, ids, partition_size, context=context):
+            job_ids.append(job_obj.create(cr, uid, {
+                'period_id': period_id,
+                'company_id': company_id,
+                'asset_ids': [(6, 0, asset_ids)],
+                'chunk_size': chunk_size,
+            }, context=context))
+        job_obj._start_workers(
+            cr, uid, min(workers, len(job_ids)), context=context)
+        return job_ids
+
     def create(self, cr, uid, vals, context=None):
         if not context:
             context = {}
@@ -1312,11 +2078,17 @@ class account_asset_asset(orm.Model):
         if vals.get('method_time'):
             if vals['method_time'] != 'year' and not vals.get('prorata'):
                 vals['prorata'] = True
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        super(account_asset_asset, self).write(cr, uid, ids, vals, context)
+        if set(vals).intersection(FIELDS_AFFECTS_ASSET_TABLE):
+            self.pool.get('account.asset.recompute.dirty')._mark_assets(
+                cr, uid, ids, 'asset change', context=context)
+        if set(vals).intersection(FIELDS_AFFECTS_ASSET_REPORT):
+            self.pool.get('asset.asset.report')._mark_assets(
+                cr, uid, ids, context=context)
         for asset in self.browse(cr, uid, ids, context):
-            asset_type = vals.get('type') or asset.type
-            super(account_asset_asset, self).write(
-                cr, uid, [asset.id], vals, context)
-            if asset_type == 'view' or \
+            if asset.type == 'view' or \
                     context.get('asset_validate_from_write'):
                 continue
             if asset.category_id.open_asset and \
@@ -1483,8 +2255,19 @@ class account_asset_depreciation_line(orm.Model):
                 'remaining_value': asset_value - depreciated_value - amount}
         return res
 
+    def create(self, cr, uid, vals, context=None):
+        dl_id = super(account_asset_depreciation_line, self).create(
+            cr, uid, vals, context=context)
+        self.pool.get('asset.asset.report')._mark_assets(
+            cr, uid, [vals['asset_id']], context=context)
+        return dl_id
+
     def unlink(self, cr, uid, ids, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        asset_ids = []
         for dl in self.browse(cr, uid, ids, context):
+            asset_ids.append(dl.asset_id.id)
             if dl.type == 'create':
                 raise orm.except_orm(
                     _('Error!'),
@@ -1503,15 +2286,20 @@ class account_asset_depreciation_line(orm.Model):
             if next:
                 next_id = next[0]
                 self.write(cr, uid, [next_id], {'previous_id': previous_id})
-        return super(account_asset_depreciation_line, self).unlink(
+        res = super(account_asset_depreciation_line, self).unlink(
             cr, uid, ids, context=context)
+        self.pool.get('asset.asset.report')._mark_assets(
+            cr, uid, list(set(asset_ids)), context=context)
+        return res
 
     def write(self, cr, uid, ids, vals, context=None):
         if not context:
             context = {}
         if isinstance(ids, (int, long)):
             ids = [ids]
+        asset_ids = []
         for dl in self.browse(cr, uid, ids, context):
+            asset_ids.append(dl.asset_id.id)
             if vals.keys() == ['move_id'] and not vals['move_id']:
                 # allow to remove an accounting entry via the
                 # 'Delete Move' button on the depreciation lines.
@@ -1556,8 +2344,13 @@ class account_asset_depreciation_line(orm.Model):
                         _('Error!'),
                         _("You cannot set the date on a depreciation line "
                           "prior to already posted entries."))
-        return super(account_asset_depreciation_line, self).write(
+        res = super(account_asset_depreciation_line, self).write(
             cr, uid, ids, vals, context)
+        if vals.get('asset_id'):
+            asset_ids.append(vals['asset_id'])
+        self.pool.get('asset.asset.report')._mark_assets(
+            cr, uid, list(set(asset_ids)), context=context)
+        return res
 
     def _setup_move_data(self, depreciation_line, depreciation_date,
                          period_id, context):
@@ -1617,10 +2410,15 @@ class account_asset_depreciation_line(orm.Model):
             else:
                 depreciation_date = context.get('depreciation_date') or \
                     time.strftime('%Y-%m-%d')
-            ctx = dict(context, account_period_prefer_normal=True)
-            period_ids = period_obj.find(
-                cr, uid, depreciation_date, context=ctx)
-            period_id = period_ids and period_ids[0] or False
+            period_id = asset_obj._find_period(
+                cr, uid, asset.company_id.id, depreciation_date,
+                context=context)
+            if not period_id:
+                ctx = dict(context, account_period_prefer_normal=True,
+                           company_id=asset.company_id.id)
+                period_ids = period_obj.find(
+                    cr, uid, depreciation_date, context=ctx)
+                period_id = period_ids and period_ids[0] or False
             move_id = move_obj.create(cr, uid, self._setup_move_data(
                 line, depreciation_date, period_id, context),
                 context=context)
@@ -1646,6 +2444,87 @@ class account_asset_depreciation_line(orm.Model):
                 asset.write({'state': 'close'})
         return created_move_ids
 
+    def create_move_bulk(self, cr, uid, ids, context=None):
+        """
+        Set-based variant of create_move for the periodical posting.
+        The accounting entry of each depreciation line is created with its
+        move lines in a single account.move create, the depreciation lines
+        are linked to their entries with one UPDATE and fully depreciated
+        assets are closed with one write.
+        The depreciation date is the date of the depreciation line.
+        The values of the parent assets are not updated when the context
+        contains asset_posting_skip_parents, cf. account.asset.posting.job.
+        """
+        if context is None:
+            context = {}
+        asset_obj = self.pool.get('account.asset.asset')
+        period_obj = self.pool.get('account.period')
+        move_obj = self.pool.get('account.move')
+        currency_obj = self.pool.get('res.currency')
+        ctx = dict(context, allow_asset=True)
+        line_moves = []
+        asset_ids = []
+        for line in self.browse(cr, uid, ids, context=context):
+            asset = line.asset_id
+            depreciation_date = line.line_date
+            period_id = asset_obj._find_period(
+                cr, uid, asset.company_id.id, depreciation_date,
+                context=context)
+            if not period_id:
+                period_ids = period_obj.find(
+                    cr, uid, depreciation_date,
+                    context=dict(context, account_period_prefer_normal=True,
+                                 company_id=asset.company_id.id))
+                period_id = period_ids[0]
+            move_vals = self._setup_move_data(
+                line, depreciation_date, period_id, context)
+            move_vals['line_id'] = []
+            for account, ml_type in [
+                    (asset.category_id.account_depreciation_id,
+                     'depreciation'),
+                    (asset.category_id.account_expense_depreciation_id,
+                     'expense')]:
+                ml_vals = self._setup_move_line_data(
+                    line, depreciation_date, period_id, account.id,
+                    ml_type, False, context)
+                del ml_vals['move_id']
+                move_vals['line_id'].append((0, 0, ml_vals))
+            move_id = move_obj.create(cr, uid, move_vals, context=ctx)
+            line_moves.append((line.id, move_id))
+            asset_ids.append(asset.id)
+        if not line_moves:
+            return []
+
+        cr.execute(
+            "UPDATE account_asset_depreciation_line dl "
+            "SET move_id = v.move_id, move_check = TRUE, write_uid = %s, "
+            "write_date = (now() at time zone 'UTC') "
+            "FROM (VALUES " + ', '.join(['(%s, %s)'] * len(line_moves)) +
+            ") AS v(id, move_id) WHERE dl.id = v.id",
+            [uid] + [x for line_move in line_moves for x in line_move])
+        self.invalidate_cache(
+            cr, uid, ['move_id', 'move_check'], ids, context=context)
+        asset_ids = list(set(asset_ids))
+        self.pool.get('asset.asset.report')._mark_assets(
+            cr, uid, asset_ids, context=context)
+        if context.get('asset_posting_skip_parents'):
+            update_ids = asset_ids
+        else:
+            update_ids = asset_obj._get_assets(cr, uid, asset_ids, context)
+        asset_obj._update_depreciated_values(
+            cr, uid, update_ids, context=context)
+
+        # close the fully depreciated assets
+        close_ids = [
+            x.id for x in asset_obj.browse(
+                cr, uid, asset_ids, context=context)
+            if currency_obj.is_zero(
+                cr, uid, x.company_id.currency_id, x.value_residual)]
+        if close_ids:
+            asset_obj.write(
+                cr, uid, close_ids, {'state': 'close'}, context=context)
+        return [x[1] for x in line_moves]
+
     def open_move(self, cr, uid, ids, context=None):
         for line in self.browse(cr, uid, ids, context=context):
             return {
@@ -1663,20 +2542,37 @@ class account_asset_depreciation_line(orm.Model):
     def unlink_move(self, cr, uid, ids, context=None):
         if not context:
             context = {}
+        asset_obj = self.pool.get('account.asset.asset')
         move_obj = self.pool.get('account.move')
         ctx = {'unlink_from_asset': True}
-        for line in self.browse(cr, uid, ids, context=context):
-            move = line.move_id
-            if move.state == 'posted':
-                move_obj.button_cancel(cr, uid, [move.id], context=context)
-            move_obj.unlink(cr, uid, [move.id], context=ctx)
+        # grouped removal entries are shared by the removal lines
+        # of several assets
+        move_ids = list(set([
+            x.move_id.id for x in self.browse(cr, uid, ids, context=context)
+            if x.type == 'remove' and x.move_id]))
+        if move_ids:
+            ids = list(set(ids + self.search(
+                cr, uid, [('move_id', 'in', move_ids),
+                          ('type', '=', 'remove')], context=context)))
+        lines = [
+            (x.id, x.move_id.id, x.move_id.state, x.parent_state, x.type,
+             x.asset_id.id)
+            for x in self.browse(cr, uid, ids, context=context)]
+        done_move_ids = []
+        for line_id, move_id, move_state, parent_state, line_type, \
+                asset_id in lines:
+            if move_id not in done_move_ids:
+                if move_state == 'posted':
+                    move_obj.button_cancel(cr, uid, [move_id], context=context)
+                move_obj.unlink(cr, uid, [move_id], context=ctx)
+                done_move_ids.append(move_id)
             # trigger store function
-            self.write(cr, uid, [line.id], {'move_id': False}, context=ctx)
-            if line.parent_state == 'close':
-                line.asset_id.write({'state': 'open'})
-            elif line.parent_state == 'removed' and line.type == 'remove':
-                line.asset_id.write({'state': 'close'})
-                self.unlink(cr, uid, [line.id])
+            self.write(cr, uid, [line_id], {'move_id': False}, context=ctx)
+            if parent_state == 'close':
+                asset_obj.write(cr, uid, [asset_id], {'state': 'open'})
+            elif parent_state == 'removed' and line_type == 'remove':
+                asset_obj.write(cr, uid, [asset_id], {'state': 'close'})
+                self.unlink(cr, uid, [line_id])
         return True
 
 
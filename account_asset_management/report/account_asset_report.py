@@ -21,11 +21,59 @@
 #
 ##############################################################################
 
+import logging
+
 from openerp import tools
 from openerp.osv import fields, orm
 
+_logger = logging.getLogger(__name__)
+
+PARAM_MATERIALIZED = 'account_asset_management.report_materialized'
+PARAM_REFRESH_DATE = 'account_asset_management.report_refresh_date'
+
+ASSET_REPORT_SQL = """
+    select
+        min(dl.id) as id,
+        dl.name as name,
+        dl.line_date as depreciation_date,
+        a.date_start as date_start,
+        a.date_remove as date_remove,
+        a.asset_value as asset_value,
+        dl.amount as depreciation_value,
+        (CASE WHEN dl.move_check
+          THEN dl.amount
+          ELSE 0
+          END) as posted_value,
+        (CASE WHEN NOT dl.move_check
+          THEN dl.amount
+          ELSE 0
+          END) as unposted_value,
+        dl.asset_id as asset_id,
+        dl.move_check as move_check,
+        a.category_id as asset_category_id,
+        a.partner_id as partner_id,
+        a.state as state,
+        count(dl.*) as nbr,
+        a.company_id as company_id
+    from account_asset_depreciation_line dl
+        left join account_asset_asset a on (dl.asset_id=a.id)
+    %s
+    group by
+        dl.amount, dl.asset_id, dl.line_date, dl.name,
+        a.date_start, a.date_remove, dl.move_check, a.state,
+        a.category_id, a.partner_id, a.company_id, a.asset_value,
+        a.id, a.salvage_value
+"""
+
 
 class asset_asset_report(orm.Model):
+    """
+    The report is a plain SQL view by default.
+    When the materialized mode is enabled, the view reads from the
+    asset_asset_report_store table. The rows of the assets with changed
+    depreciation lines are queued in asset_asset_report_pending and
+    refreshed by a scheduled action (see refresh_incremental).
+    """
     _name = "asset.asset.report"
     _description = "Assets Analysis"
     _auto = False
@@ -54,40 +102,146 @@ class asset_asset_report(orm.Model):
         'company_id': fields.many2one('res.company', 'Company', readonly=True),
     }
 
-    def init(self, cr):
+    def _create_view(self, cr, materialized):
         tools.drop_view_if_exists(cr, 'asset_asset_report')
-        cr.execute("""
-            create or replace view asset_asset_report as (
-                select
-                    min(dl.id) as id,
-                    dl.name as name,
-                    dl.line_date as depreciation_date,
-                    a.date_start as date_start,
-                    a.date_remove as date_remove,
-                    a.asset_value as asset_value,
-                    dl.amount as depreciation_value,
-                    (CASE WHEN dl.move_check
-                      THEN dl.amount
-                      ELSE 0
-                      END) as posted_value,
-                    (CASE WHEN NOT dl.move_check
-                      THEN dl.amount
-                      ELSE 0
-                      END) as unposted_value,
-                    dl.asset_id as asset_id,
-                    dl.move_check as move_check,
-                    a.category_id as asset_category_id,
-                    a.partner_id as partner_id,
-                    a.state as state,
-                    count(dl.*) as nbr,
-                    a.company_id as company_id
-                from account_asset_depreciation_line dl
-                    left join account_asset_asset a on (dl.asset_id=a.id)
-                group by
-                    dl.amount, dl.asset_id, dl.line_date, dl.name,
-                    a.date_start, a.date_remove, dl.move_check, a.state,
-                    a.category_id, a.partner_id, a.company_id, a.asset_value,
-                    a.id, a.salvage_value
-        )""")
+        if materialized:
+            cr.execute("""
+                create or replace view asset_asset_report as (
+                    select * from asset_asset_report_store
+            )""")
+        else:
+            cr.execute("""
+                create or replace view asset_asset_report as (
+                    %s
+            )""" % (ASSET_REPORT_SQL % ''))
+
+    def init(self, cr):
+        cr.execute(
+            "SELECT relname FROM pg_class "
+            "WHERE relname IN ('asset_asset_report_store', "
+            "'asset_asset_report_pending')")
+        tables = [x[0] for x in cr.fetchall()]
+        if 'asset_asset_report_store' not in tables:
+            cr.execute(
+                "CREATE TABLE asset_asset_report_store AS (" +
+                ASSET_REPORT_SQL % '' + ") WITH NO DATA")
+            cr.execute(
+                "ALTER TABLE asset_asset_report_store ADD PRIMARY KEY (id)")
+            for column in ['depreciation_date', 'asset_category_id',
+                           'company_id', 'asset_id']:
+                cr.execute(
+                    "CREATE INDEX asset_asset_report_store_%s_index "
+                    "ON asset_asset_report_store (%s)" % (column, column))
+        if 'asset_asset_report_pending' not in tables:
+            cr.execute(
+                "CREATE TABLE asset_asset_report_pending ("
+                "asset_id integer NOT NULL)")
+            cr.execute(
+                "CREATE INDEX asset_asset_report_pending_asset_id_index "
+                "ON asset_asset_report_pending (asset_id)")
+        cr.execute(
+            "SELECT value FROM ir_config_parameter WHERE key = %s",
+            (PARAM_MATERIALIZED,))
+        res = cr.fetchone()
+        self._create_view(cr, bool(res and res[0] == 'True'))
+
+    @tools.ormcache(skiparg=3)
+    def _is_materialized(self, cr, uid):
+        return self.pool.get('ir.config_parameter').get_param(
+            cr, uid, PARAM_MATERIALIZED) == 'True'
+
+    def _mark_assets(self, cr, uid, asset_ids, context=None):
+        """
+        Queues the report rows of the assets for the next
+        incremental refresh of the materialized report.
+        """
+        if not asset_ids or not self._is_materialized(cr, uid):
+            return True
+        cr.execute(
+            "INSERT INTO asset_asset_report_pending (asset_id) "
+            "SELECT DISTINCT x FROM unnest(%s) AS x "
+            "WHERE NOT EXISTS (SELECT 1 FROM asset_asset_report_pending p "
+            "WHERE p.asset_id = x)",
+            (list(asset_ids),))
+        return True
+
+    def _set_refresh_date(self, cr, uid, context=None):
+        self.pool.get('ir.config_parameter').set_param(
+            cr, uid, PARAM_REFRESH_DATE,
+            fields.datetime.now())
+
+    def refresh_incremental(self, cr, uid, context=None):
+        """
+        Replaces the report rows of the queued assets.
+        Called by the 'Refresh Assets Analysis' scheduled action.
+        """
+        if not self._is_materialized(cr, uid):
+            return True
+        cr.execute(
+            "LOCK TABLE asset_asset_report_store IN EXCLUSIVE MODE")
+        cr.execute(
+            "DELETE FROM asset_asset_report_pending RETURNING asset_id")
+        asset_ids = list(set([x[0] for x in cr.fetchall()]))
+        for sub_ids in cr.split_for_in_conditions(asset_ids):
+            cr.execute(
+                "DELETE FROM asset_asset_report_store "
+                "WHERE asset_id IN %s", (sub_ids,))
+            cr.execute(
+                "INSERT INTO asset_asset_report_store " +
+                ASSET_REPORT_SQL % "where dl.asset_id IN %s",
+                (sub_ids,))
+        self._set_refresh_date(cr, uid, context=context)
+        if asset_ids:
+            _logger.info(
+                "Assets Analysis refreshed for %s assets", len(asset_ids))
+        return True
+
+    def refresh_full(self, cr, uid, context=None):
+        if not self._is_materialized(cr, uid):
+            return True
+        cr.execute(
+            "LOCK TABLE asset_asset_report_store IN EXCLUSIVE MODE")
+        cr.execute("DELETE FROM asset_asset_report_pending")
+        cr.execute("DELETE FROM asset_asset_report_store")
+        cr.execute(
+            "INSERT INTO asset_asset_report_store " + ASSET_REPORT_SQL % '')
+        cr.execute("ANALYZE asset_asset_report_store")
+        self._set_refresh_date(cr, uid, context=context)
+        return True
+
+    def set_materialized(self, cr, uid, materialized, context=None):
+        if materialized == self._is_materialized(cr, uid):
+            return True
+        self.pool.get('ir.config_parameter').set_param(
+            cr, uid, PARAM_MATERIALIZED, materialized and 'True' or 'False')
+        self.clear_caches()
+        self._create_view(cr, materialized)
+        if materialized:
+            self.refresh_full(cr, uid, context=context)
+        else:
+            cr.execute("DELETE FROM asset_asset_report_pending")
+            cr.execute("DELETE FROM asset_asset_report_store")
+        return True
+
+    def get_refresh_status(self, cr, uid, context=None):
+        """
+        Returns the staleness indicators of the materialized report:
+        the date of the last refresh and the number of assets
+        with rows waiting for a refresh.
+        """
+        res = {
+            'materialized': self._is_materialized(cr, uid),
+            'refresh_date': False,
+            'pending': 0,
+        }
+        if res['materialized']:
+            res['refresh_date'] = self.pool.get(
+                'ir.config_parameter').get_param(
+                cr, uid, PARAM_REFRESH_DATE) or False
+            cr.execute(
+                "SELECT COUNT(DISTINCT asset_id) "
+                "FROM asset_asset_report_pending")
+            res['pending'] = cr.fetchone()[0]
+        return res
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -34,4 +34,32 @@ class Config(orm.TransientModel):
                     on those assets, and creates account move for those
                     depreciation lines.
                     This installs the module account_asset_management."""),
+        'asset_report_materialized': fields.boolean(
+            'Materialized Assets Analysis',
+            help="Store the Assets Analysis report in a table which is "
+                 "refreshed incrementally by a scheduled action in stead "
+                 "of grouping all depreciation lines on each read."),
+        'asset_report_refresh_date': fields.datetime(
+            'Last Refresh', readonly=True),
+        'asset_report_pending': fields.integer(
+            'Assets waiting for refresh', readonly=True),
     }
+
+    def get_default_asset_report(self, cr, uid, fields, context=None):
+        status = self.pool.get('asset.asset.report').get_refresh_status(
+            cr, uid, context=context)
+        return {
+            'asset_report_materialized': status['materialized'],
+            'asset_report_refresh_date': status['refresh_date'],
+            'asset_report_pending': status['pending'],
+        }
+
+    def set_asset_report(self, cr, uid, ids, context=None):
+        config = self.browse(cr, uid, ids[0], context=context)
+        self.pool.get('asset.asset.report').set_materialized(
+            cr, uid, config.asset_report_materialized, context=context)
+
+    def refresh_asset_report(self, cr, uid, ids, context=None):
+        self.pool.get('asset.asset.report').refresh_full(
+            cr, uid, context=context)
+        return True
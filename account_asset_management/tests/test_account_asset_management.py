@@ -226,3 +226,341 @@ class TestAssetManagement(common.TransactionCase):
                                places=2)
         self.assertAlmostEqual(asset.depreciation_line_ids[-1].amount, 8.22,
                                places=2)
+
+    def test_5_board_batch(self):
+        """Depreciation boards computed in batch equal single computation."""
+        vals = {
+            'name': 'test asset',
+            'category_id': self.ref('account_asset_management.'
+                                    'account_asset_category_car_5Y'),
+            'purchase_value': 3333,
+            'salvage_value': 0,
+            'date_start': time.strftime('%Y-07-07'),
+            'method_number': 5,
+            'method_period': 'month',
+            'prorata': True,
+        }
+        asset_ids = [
+            self.asset_model.create(self.cr, self.uid, vals)
+            for x in range(3)]
+        self.dl_model.create(self.cr, self.uid, {
+            'asset_id': asset_ids[1],
+            'amount': 279.44,
+            'line_date': time.strftime('%Y-11-30'),
+            'type': 'depreciate',
+            'init_entry': True,
+        })
+        self.dl_model.create(self.cr, self.uid, {
+            'asset_id': asset_ids[2],
+            'amount': 279.44,
+            'line_date': time.strftime('%Y-11-30'),
+            'type': 'depreciate',
+            'init_entry': True,
+        })
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, asset_ids[:2])
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, [asset_ids[2]])
+        assets = self.asset_model.browse(self.cr, self.uid, asset_ids)
+        self.assertAlmostEqual(assets[0].depreciation_line_ids[-1].amount,
+                               8.22, places=2)
+        batch, single = assets[1], assets[2]
+        self.assertEquals(len(batch.depreciation_line_ids),
+                          len(single.depreciation_line_ids))
+        for dl_b, dl_s in zip(batch.depreciation_line_ids,
+                              single.depreciation_line_ids):
+            self.assertEquals(dl_b.line_date, dl_s.line_date)
+            self.assertAlmostEqual(dl_b.amount, dl_s.amount, places=2)
+            self.assertAlmostEqual(dl_b.remaining_value,
+                                   dl_s.remaining_value, places=2)
+            self.assertEquals(dl_b.previous_id.line_date,
+                              dl_s.previous_id.line_date)
+        # I recompute the batch and check the board is left unchanged
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, asset_ids)
+        batch.refresh()
+        self.assertEquals(len(batch.depreciation_line_ids),
+                          len(single.depreciation_line_ids))
+
+    def test_6_fy_calendar(self):
+        """Fiscal year calendar lookups and cache invalidation."""
+        fy_model = self.registry('account.fiscalyear')
+        company_id = self.ref('base.main_company')
+        date = time.strftime('%Y-07-07')
+        fy_id = fy_model.find(
+            self.cr, self.uid, date, context={'company_id': company_id})
+        fy = self.asset_model._find_fiscalyear(
+            self.cr, self.uid, company_id, date)
+        self.assertEquals(fy['id'], fy_id)
+        # I create a fiscal year in the future and check it is found
+        year = datetime.now().year + 50
+        date = '%d-01-01' % year
+        self.assertIsNone(self.asset_model._find_fiscalyear(
+            self.cr, self.uid, company_id, date))
+        new_fy_id = fy_model.create(self.cr, self.uid, {
+            'name': 'FY%d' % year,
+            'code': 'FY%d' % year,
+            'date_start': date,
+            'date_stop': '%d-12-31' % year,
+            'company_id': company_id,
+        })
+        fy = self.asset_model._find_fiscalyear(
+            self.cr, self.uid, company_id, date)
+        self.assertEquals(fy['id'], new_fy_id)
+
+    def test_7_bulk_posting(self):
+        """Bulk posting of the depreciation lines of a period."""
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, [ict0.id])
+        ict0.validate()
+        ict0.refresh()
+        dl = ict0.depreciation_line_ids[1]
+        period_ids = self.registry('account.period').find(
+            self.cr, self.uid, dl.line_date,
+            context={'company_id': ict0.company_id.id})
+        move_ids = self.asset_model._compute_entries(
+            self.cr, self.uid, [ict0.id], period_ids[0],
+            context={'asset_posting_chunk_size': 10})
+        self.assertEquals(len(move_ids), 1)
+        dl.refresh()
+        self.assertEquals(dl.move_id.id, move_ids[0])
+        self.assertTrue(dl.move_check)
+        self.assertEquals(len(dl.move_id.line_id), 2)
+        ict0.refresh()
+        self.assertEquals(ict0.state, 'open')
+        self.assertEquals(ict0.value_depreciated, 500)
+        self.assertEquals(ict0.value_residual, 1000)
+
+    def test_8_posting_partitions(self):
+        """Assets are partitioned per company, view assets left out."""
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        vehicle0 = self.browse_ref('account_asset_management.'
+                                   'account_asset_asset_vehicle0')
+        asset_ids = [ict0.id, vehicle0.id, ict0.parent_id.id]
+        partitions = self.asset_model._get_posting_partitions(
+            self.cr, self.uid, asset_ids, 1)
+        self.assertEquals(len(partitions), 2)
+        self.assertEquals(
+            sorted([x[1][0] for x in partitions]),
+            sorted([ict0.id, vehicle0.id]))
+        partitions = self.asset_model._get_posting_partitions(
+            self.cr, self.uid, asset_ids, 10)
+        self.assertEquals(len(partitions), 1)
+        self.assertEquals(partitions[0][0], ict0.company_id.id)
+        self.assertEquals(
+            sorted(partitions[0][1]), sorted([ict0.id, vehicle0.id]))
+
+    def test_9_recompute_dirty_set(self):
+        """Changes of the table inputs mark the asset for recompute."""
+        dirty_model = self.registry('account.asset.recompute.dirty')
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        vehicle0 = self.browse_ref('account_asset_management.'
+                                   'account_asset_asset_vehicle0')
+        asset_ids = [ict0.id, vehicle0.id]
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, asset_ids)
+        self.assertEquals(dirty_model._get_dirty_asset_ids(
+            self.cr, self.uid, asset_ids), [])
+        ict0.write({'name': 'ICT'})
+        self.assertEquals(dirty_model._get_dirty_asset_ids(
+            self.cr, self.uid, asset_ids), [])
+        ict0.write({'salvage_value': 100})
+        self.assertEquals(dirty_model._get_dirty_asset_ids(
+            self.cr, self.uid, asset_ids), [ict0.id])
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, [ict0.id])
+        self.assertEquals(dirty_model._get_dirty_asset_ids(
+            self.cr, self.uid, asset_ids), [])
+
+    def test_10_materialized_report(self):
+        """The materialized report follows the depreciation lines."""
+        report_model = self.registry('asset.asset.report')
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        report_model.set_materialized(self.cr, self.uid, True)
+        status = report_model.get_refresh_status(self.cr, self.uid)
+        self.assertTrue(status['materialized'])
+        self.assertEquals(status['pending'], 0)
+        report_ids = report_model.search(
+            self.cr, self.uid, [('asset_id', '=', ict0.id)])
+        self.assertEquals(len(report_ids), 1)
+
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, [ict0.id])
+        status = report_model.get_refresh_status(self.cr, self.uid)
+        self.assertEquals(status['pending'], 1)
+        report_model.refresh_incremental(self.cr, self.uid)
+        status = report_model.get_refresh_status(self.cr, self.uid)
+        self.assertEquals(status['pending'], 0)
+        ict0.refresh()
+        report_ids = report_model.search(
+            self.cr, self.uid, [('asset_id', '=', ict0.id)])
+        self.assertEquals(
+            len(report_ids), len(ict0.depreciation_line_ids))
+
+        report_model.set_materialized(self.cr, self.uid, False)
+        report_ids = report_model.search(
+            self.cr, self.uid, [('asset_id', '=', ict0.id)])
+        self.assertEquals(
+            len(report_ids), len(ict0.depreciation_line_ids))
+
+    def test_11_batch_removal(self):
+        """Several assets are removed with grouped removal entries."""
+        remove_model = self.registry('account.asset.remove')
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        vehicle0 = self.browse_ref('account_asset_management.'
+                                   'account_asset_asset_vehicle0')
+        assets = [ict0, vehicle0]
+        asset_ids = [x.id for x in assets]
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, asset_ids)
+        self.asset_model.validate(self.cr, self.uid, asset_ids)
+        for asset in assets:
+            asset.refresh()
+        date_remove = min(
+            [x.depreciation_line_ids[1].line_date for x in assets])
+        ctx = {'active_id': ict0.id, 'active_ids': asset_ids}
+        wiz_id = remove_model.create(self.cr, self.uid, {
+            'date_remove': date_remove,
+            'posting_regime': 'residual_value',
+            'account_residual_value_id':
+                ict0.category_id.account_expense_depreciation_id.id,
+            }, context=ctx)
+        remove_model.remove(self.cr, self.uid, [wiz_id], context=ctx)
+        move_ids = set()
+        for asset in assets:
+            asset.refresh()
+            self.assertEquals(asset.state, 'removed')
+            self.assertEquals(asset.date_remove, date_remove)
+            remove_lines = [x for x in asset.depreciation_line_ids
+                            if x.type == 'remove']
+            self.assertEquals(len(remove_lines), 1)
+            self.assertTrue(remove_lines[0].move_id)
+            move_ids.add(remove_lines[0].move_id.id)
+        journal_ids = set([x.category_id.journal_id.id for x in assets])
+        self.assertEquals(len(move_ids), len(journal_ids))
+
+    def test_12_board_simulation(self):
+        """A simulated board equals the computed board of the asset."""
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, [ict0.id])
+        ict0.refresh()
+        fy_model = self.registry('account.fiscalyear')
+        fy_ids = fy_model.search(
+            self.cr, self.uid, [('company_id', '=', ict0.company_id.id)])
+        fiscalyears = fy_model.read(
+            self.cr, self.uid, fy_ids, ['date_start', 'date_stop', 'state'])
+        vals = dict([
+            (x, ict0[x]) for x in [
+                'purchase_value', 'salvage_value', 'date_start', 'method',
+                'method_number', 'method_period', 'method_time',
+                'method_end', 'method_progress_factor', 'prorata']])
+        simulation = self.asset_model.simulate_depreciation_boards(
+            self.cr, self.uid, [vals, vals], fiscalyears)
+        self.assertEquals(len(simulation), 2)
+        expected = [
+            (x.line_date, x.amount) for x in ict0.depreciation_line_ids
+            if x.type == 'depreciate']
+        for i in range(2):
+            lines = simulation.get_lines(i)
+            self.assertEquals(
+                [(x[0].strftime('%Y-%m-%d'), x[1]) for x in lines],
+                expected)
+        self.assertEquals(
+            sum([x[1] for x in simulation.get_totals()]),
+            2 * ict0.asset_value)
+
+    def test_13_parallel_posting(self):
+        """Posting jobs are queued per partition and run by cron workers."""
+        job_model = self.registry('account.asset.posting.job')
+        cron_model = self.registry('ir.cron')
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, [ict0.id])
+        ict0.validate()
+        ict0.refresh()
+        dl1 = ict0.depreciation_line_ids[1]
+        dl2 = ict0.depreciation_line_ids[2]
+        parent_depreciated = ict0.parent_id.value_depreciated
+        period_model = self.registry('account.period')
+        ctx = {'company_id': ict0.company_id.id}
+        period1_id = period_model.find(
+            self.cr, self.uid, dl1.line_date, context=ctx)[0]
+        period2_id = period_model.find(
+            self.cr, self.uid, dl2.line_date, context=ctx)[0]
+        # a job posting a later period first fails without side effects
+        error_job_id = job_model.create(self.cr, self.uid, {
+            'period_id': period2_id,
+            'company_id': ict0.company_id.id,
+            'asset_ids': [(6, 0, [ict0.id])],
+        })
+        job_model._run_jobs(
+            self.cr, self.uid, [error_job_id], commit=False)
+        error_job = job_model.browse(self.cr, self.uid, error_job_id)
+        self.assertEquals(error_job.state, 'error')
+        self.assertTrue(error_job.error)
+        dl2.refresh()
+        self.assertFalse(dl2.move_check)
+        # the posting of the period is queued and run by the workers
+        job_ids = self.asset_model._compute_entries_parallel(
+            self.cr, self.uid, [ict0.id], period1_id, 2, 1, chunk_size=10)
+        self.assertEquals(len(job_ids), 1)
+        cron_ids = cron_model.search(self.cr, self.uid, [
+            ('model', '=', 'account.asset.posting.job'),
+            ('function', '=', 'run_posting_jobs'),
+            ('numbercall', '=', 1)])
+        self.assertEquals(len(cron_ids), 1)
+        self.assertEquals(job_model._run_jobs(
+            self.cr, self.uid, job_ids, commit=False), job_ids)
+        job = job_model.browse(self.cr, self.uid, job_ids[0])
+        self.assertEquals(job.state, 'done')
+        self.assertEquals(job.move_count, 1)
+        self.assertEquals(job.tries, 1)
+        dl1.refresh()
+        self.assertTrue(dl1.move_check)
+        # the parent assets are updated once no job is pending
+        self.assertTrue(job.parents_updated)
+        ict0.refresh()
+        self.assertEquals(ict0.parent_id.value_depreciated,
+                          parent_depreciated + dl1.amount)
+        # done jobs are not run again
+        self.assertEquals(job_model._run_jobs(
+            self.cr, self.uid, job_ids, commit=False), [])
+
+    def test_14_list_removal_single_asset(self):
+        """The list action removes a single asset through the batch path."""
+        remove_model = self.registry('account.asset.remove')
+        ict0 = self.browse_ref('account_asset_management.'
+                               'account_asset_asset_ict0')
+        self.asset_model.compute_depreciation_board(
+            self.cr, self.uid, [ict0.id])
+        self.asset_model.validate(self.cr, self.uid, [ict0.id])
+        ict0.refresh()
+        date_remove = ict0.depreciation_line_ids[1].line_date
+        ctx = {'active_id': ict0.id, 'active_ids': [ict0.id],
+               'asset_remove_batch': True}
+        wiz_id = remove_model.create(self.cr, self.uid, {
+            'date_remove': date_remove,
+            'posting_regime': 'residual_value',
+            'account_residual_value_id':
+                ict0.category_id.account_expense_depreciation_id.id,
+            }, context=ctx)
+        wiz = remove_model.browse(self.cr, self.uid, wiz_id)
+        self.assertTrue(wiz.batch)
+        self.assertEquals(wiz.sale_value, 0.0)
+        remove_model.remove(self.cr, self.uid, [wiz_id], context=ctx)
+        ict0.refresh()
+        self.assertEquals(ict0.state, 'removed')
+        # the early removal dropped the unposted depreciation lines
+        self.assertFalse([
+            x for x in ict0.depreciation_line_ids
+            if x.type == 'depreciate' and not x.move_check
+            and not x.init_entry])
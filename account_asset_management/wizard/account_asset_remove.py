@@ -52,29 +52,52 @@ class account_asset_remove(orm.TransientModel):
         else:
             return 'gain_loss_on_sale'
 
-    def _get_sale(self, cr, uid, context=None):
-        if not context:
-            context = {}
+    def _get_sales(self, cr, uid, asset_ids, context=None):
+        """
+        Returns the sale value and sale account of the assets
+        from their open or paid invoice lines.
+        """
         inv_line_obj = self.pool.get('account.invoice.line')
         currency_obj = self.pool.get('res.currency')
-        asset_id = context.get('active_id')
-        sale_value = 0.0
-        account_sale_id = False
+        res = dict([
+            (x, {'sale_value': 0.0, 'account_sale_id': False})
+            for x in asset_ids])
         inv_line_ids = inv_line_obj.search(
-            cr, uid, [('asset_id', '=', asset_id)], context=context)
+            cr, uid, [('asset_id', 'in', asset_ids)], context=context)
         for line in inv_line_obj.browse(cr, uid, inv_line_ids):
             inv = line.invoice_id
             comp_curr = inv.company_id.currency_id
             inv_curr = inv.currency_id
             if line.invoice_id.state in ['open', 'paid']:
-                account_sale_id = line.account_id.id
+                sale = res[line.asset_id.id]
+                sale['account_sale_id'] = line.account_id.id
                 amount = line.price_subtotal
                 if inv_curr != comp_curr:
                     amount = currency_obj.compute(
                         cr, uid, inv_curr.id, comp_curr.id, amount,
                         context=context)
-                sale_value += amount
-        return {'sale_value': sale_value, 'account_sale_id': account_sale_id}
+                sale['sale_value'] += amount
+        return res
+
+    def _is_batch(self, cr, uid, context=None):
+        """
+        Batch mode is used when several assets are selected or when the
+        wizard is opened from the list action, the sale value and accounts
+        are then taken per asset by _remove_batch.
+        """
+        if not context:
+            context = {}
+        return bool(context.get('asset_remove_batch') or
+                    len(context.get('active_ids') or []) > 1)
+
+    def _get_sale(self, cr, uid, context=None):
+        if not context:
+            context = {}
+        asset_id = context.get('active_id')
+        if not asset_id or self._is_batch(cr, uid, context=context):
+            return {'sale_value': 0.0, 'account_sale_id': False}
+        return self._get_sales(
+            cr, uid, [asset_id], context=context)[asset_id]
 
     def _get_sale_value(self, cr, uid, context=None):
         return self._get_sale(cr, uid, context=context)['sale_value']
@@ -88,7 +111,7 @@ class account_asset_remove(orm.TransientModel):
         acc = False
         asset_obj = self.pool.get('account.asset.asset')
         asset = asset_obj.browse(cr, uid, context.get('active_id'))
-        if asset:
+        if asset and not self._is_batch(cr, uid, context=context):
             acc = asset.category_id.account_plus_value_id
         return acc and acc.id or False
 
@@ -98,7 +121,7 @@ class account_asset_remove(orm.TransientModel):
         acc = False
         asset_obj = self.pool.get('account.asset.asset')
         asset = asset_obj.browse(cr, uid, context.get('active_id'))
-        if asset:
+        if asset and not self._is_batch(cr, uid, context=context):
             acc = asset.category_id.account_min_value_id
         return acc and acc.id or False
 
@@ -108,10 +131,18 @@ class account_asset_remove(orm.TransientModel):
         acc = False
         asset_obj = self.pool.get('account.asset.asset')
         asset = asset_obj.browse(cr, uid, context.get('active_id'))
-        if asset:
+        if asset and not self._is_batch(cr, uid, context=context):
             acc = asset.category_id.account_residual_value_id
         return acc and acc.id or False
 
+    def _get_asset_count(self, cr, uid, context=None):
+        if not context:
+            context = {}
+        return len(context.get('active_ids') or []) or 1
+
+    def _get_batch(self, cr, uid, context=None):
+        return self._is_batch(cr, uid, context=context)
+
     _columns = {
         'date_remove': fields.date(
             'Asset Removal Date', required=True,
@@ -143,6 +174,17 @@ class account_asset_remove(orm.TransientModel):
                  "  * Gain/Loss on Sale: The Gain or Loss will be posted on "
                  "the 'Plus-Value Account' or 'Min-Value Account' "),
         'note': fields.text('Notes'),
+        'asset_count': fields.integer('Number of Assets', readonly=True),
+        'batch': fields.boolean(
+            'Batch Removal', readonly=True,
+            help="The sale value and sale account of each asset are taken "
+                 "from its invoices, the gain/loss and residual value "
+                 "accounts from its category. The accounts of the wizard "
+                 "are only used for the assets without them."),
+        'group_moves': fields.boolean(
+            'Group Removal Entries',
+            help="Create one removal entry per journal and period "
+                 "in stead of one entry per asset."),
     }
 
     _defaults = {
@@ -152,6 +194,9 @@ class account_asset_remove(orm.TransientModel):
         'account_min_value_id': _get_min_account,
         'account_residual_value_id': _get_residual_account,
         'posting_regime': _get_posting_regime,
+        'asset_count': _get_asset_count,
+        'batch': _get_batch,
+        'group_moves': True,
     }
 
     _sql_constraints = [(
@@ -207,8 +252,99 @@ class account_asset_remove(orm.TransientModel):
         asset_line_obj.unlink(cr, uid, dl_ids, context=context)
         return residual_value
 
+    def _prepare_early_removal_batch(self, cr, uid, assets, date_remove,
+                                     context=None):
+        """
+        Batch variant of _prepare_early_removal.
+        The last depreciation lines of all assets are computed together,
+        posted with one create_move_bulk call and the remaining unposted
+        depreciation lines are removed with a single statement.
+        Returns the residual value per asset.
+        """
+        asset_obj = self.pool.get('account.asset.asset')
+        asset_line_obj = self.pool.get('account.asset.depreciation.line')
+        digits = self.pool.get('decimal.precision').precision_get(
+            cr, uid, 'Account')
+        res = dict([(x.id, x.value_residual) for x in assets])
+        asset_ids = [x.id for x in assets if x.value_residual]
+        if not asset_ids:
+            return res
+
+        first_lines = []
+        for sub_ids in cr.split_for_in_conditions(asset_ids):
+            cr.execute(
+                "SELECT DISTINCT ON (dl.asset_id) "
+                "dl.asset_id, dl.id, dl.line_date, dl.amount, "
+                "prev.line_date "
+                "FROM account_asset_depreciation_line dl "
+                "LEFT JOIN account_asset_depreciation_line prev "
+                "ON prev.id = dl.previous_id "
+                "WHERE dl.asset_id IN %s AND dl.type = 'depreciate' "
+                "AND NOT COALESCE(dl.init_entry, FALSE) "
+                "AND NOT COALESCE(dl.move_check, FALSE) "
+                "ORDER BY dl.asset_id, dl.line_date, dl.id",
+                (sub_ids,))
+            first_lines += cr.fetchall()
+        if not first_lines:
+            return res
+
+        date_remove = datetime.strptime(date_remove, '%Y-%m-%d')
+        new_line_date = date_remove + relativedelta(days=-1)
+        post_ids = []
+        for asset_id, dl_id, first_date, amount, last_depr_date \
+                in first_lines:
+            if date_remove > datetime.strptime(first_date, '%Y-%m-%d'):
+                raise orm.except_orm(
+                    _('Error!'),
+                    _("You can't make an early removal if all the "
+                      "depreciation lines for previous periods "
+                      "are not posted."))
+            period_number_days = (
+                datetime.strptime(first_date, '%Y-%m-%d') -
+                datetime.strptime(last_depr_date, '%Y-%m-%d')).days
+            to_depreciate_days = (
+                new_line_date -
+                datetime.strptime(last_depr_date, '%Y-%m-%d')).days
+            to_depreciate_amount = round(
+                float(to_depreciate_days) / float(period_number_days) *
+                amount, digits)
+            res[asset_id] -= to_depreciate_amount
+            if to_depreciate_amount:
+                asset_line_obj.write(cr, uid, [dl_id], {
+                    'amount': to_depreciate_amount,
+                    'line_date': new_line_date,
+                    }, context=context)
+                post_ids.append(dl_id)
+        if post_ids:
+            asset_line_obj.create_move_bulk(
+                cr, uid, post_ids, context=context)
+        asset_obj._unlink_unposted_depreciation_lines(
+            cr, uid, [x[0] for x in first_lines], context=context)
+        self.pool.get('asset.asset.report')._mark_assets(
+            cr, uid, [x[0] for x in first_lines], context=context)
+        asset_obj.invalidate_cache(
+            cr, uid, ['depreciation_line_ids'], asset_ids, context=context)
+        return res
+
+    def _get_removal_values(self, cr, uid, wiz_data, asset, context=None):
+        return {
+            'sale_value': wiz_data.sale_value,
+            'account_sale_id': wiz_data.account_sale_id.id,
+            'account_plus_value_id': wiz_data.account_plus_value_id.id,
+            'account_min_value_id': wiz_data.account_min_value_id.id,
+            'account_residual_value_id':
+                wiz_data.account_residual_value_id.id,
+        }
+
     def _get_removal_data(self, cr, uid, wiz_data, asset, residual_value,
-                          context=None):
+                          context=None, removal_values=None):
+        """
+        @param removal_values: sale value and accounts of the asset,
+                               taken from the wizard when not given
+        """
+        if removal_values is None:
+            removal_values = self._get_removal_values(
+                cr, uid, wiz_data, asset, context=context)
         move_lines = []
         partner_id = asset.partner_id and asset.partner_id.id or False
         categ = asset.category_id
@@ -238,7 +374,7 @@ class account_asset_remove(orm.TransientModel):
             if wiz_data.posting_regime == 'residual_value':
                 move_line_vals = {
                     'name': asset.name,
-                    'account_id': wiz_data.account_residual_value_id.id,
+                    'account_id': removal_values['account_residual_value_id'],
                     'analytic_account_id': asset.account_analytic_id.id,
                     'debit': residual_value,
                     'credit': 0.0,
@@ -247,11 +383,11 @@ class account_asset_remove(orm.TransientModel):
                 }
                 move_lines.append((0, 0, move_line_vals))
             elif wiz_data.posting_regime == 'gain_loss_on_sale':
-                if wiz_data.sale_value:
-                    sale_value = wiz_data.sale_value
+                if removal_values['sale_value']:
+                    sale_value = removal_values['sale_value']
                     move_line_vals = {
                         'name': asset.name,
-                        'account_id': wiz_data.account_sale_id.id,
+                        'account_id': removal_values['account_sale_id'],
                         'analytic_account_id': asset.account_analytic_id.id,
                         'debit': sale_value,
                         'credit': 0.0,
@@ -259,10 +395,10 @@ class account_asset_remove(orm.TransientModel):
                         'asset_id': asset.id
                     }
                     move_lines.append((0, 0, move_line_vals))
-                balance = wiz_data.sale_value - residual_value
-                account_id = (wiz_data.account_plus_value_id.id
+                balance = removal_values['sale_value'] - residual_value
+                account_id = (removal_values['account_plus_value_id']
                               if balance > 0
-                              else wiz_data.account_min_value_id.id)
+                              else removal_values['account_min_value_id'])
                 move_line_vals = {
                     'name': asset.name,
                     'account_id': account_id,
@@ -276,11 +412,192 @@ class account_asset_remove(orm.TransientModel):
 
         return move_lines
 
+    def _get_removal_period(self, cr, uid, wiz_data, asset, context=None):
+        asset_obj = self.pool.get('account.asset.asset')
+        period_obj = self.pool.get('account.period')
+        period_id = wiz_data.period_id and wiz_data.period_id.id or False
+        if not period_id:
+            period_id = asset_obj._find_period(
+                cr, uid, asset.company_id.id, wiz_data.date_remove,
+                context=context)
+        if not period_id:
+            ctx = dict(context, company_id=asset.company_id.id,
+                       account_period_prefer_normal=True)
+            period_ids = period_obj.find(
+                cr, uid, wiz_data.date_remove, context=ctx)
+            period_id = period_ids[0]
+        return period_id
+
+    def _check_removal_accounts(self, cr, uid, wiz_data, residual_value,
+                                removal_values, context=None):
+        """
+        Returns False when an account needed by the removal entry
+        of the asset is missing in removal_values.
+        """
+        if not residual_value:
+            return True
+        if wiz_data.posting_regime == 'residual_value':
+            field_names = ['account_residual_value_id']
+        else:
+            balance = removal_values['sale_value'] - residual_value
+            field_names = [balance > 0 and 'account_plus_value_id'
+                           or 'account_min_value_id']
+            if removal_values['sale_value']:
+                field_names.append('account_sale_id')
+        return all(removal_values[x] for x in field_names)
+
+    def _remove_batch(self, cr, uid, ids, asset_ids, context=None):
+        """
+        Removes several assets at once.
+        The sale value and sale account of each asset are taken from its
+        invoices, the gain/loss and residual value accounts from its
+        category with the accounts of the wizard as fallback.
+        """
+        asset_obj = self.pool.get('account.asset.asset')
+        asset_line_obj = self.pool.get('account.asset.depreciation.line')
+        move_obj = self.pool.get('account.move')
+        wiz_data = self.browse(cr, uid, ids[0], context=context)
+        date_remove = wiz_data.date_remove
+
+        assets = asset_obj.browse(cr, uid, asset_ids, context=context)
+        invalid = [
+            x.code and '%s (ref: %s)' % (x.name, x.code) or x.name
+            for x in assets
+            if x.type != 'normal' or x.method_time != 'year' or
+            x.state not in ['open', 'close']]
+        if invalid:
+            raise orm.except_orm(
+                _('Error!'),
+                _("The following assets can not be removed:\n%s")
+                % '\n'.join(invalid))
+
+        residual_values = self._prepare_early_removal_batch(
+            cr, uid, assets, date_remove, context=context)
+
+        line_data = {}
+        for sub_ids in cr.split_for_in_conditions(asset_ids):
+            cr.execute(
+                "SELECT asset_id, COUNT(id), MAX(line_date) "
+                "FROM account_asset_depreciation_line "
+                "WHERE asset_id IN %s AND type = 'depreciate' "
+                "GROUP BY asset_id",
+                (sub_ids,))
+            for asset_id, count, last_date in cr.fetchall():
+                line_data[asset_id] = (count, last_date)
+        for asset in assets:
+            count, last_date = line_data.get(asset.id, (0, False))
+            if last_date and date_remove < last_date:
+                raise orm.except_orm(
+                    _('Error!'),
+                    _("The removal date must be after "
+                      "the last depreciation date."))
+
+        sales = self._get_sales(cr, uid, asset_ids, context=context)
+        wiz_values = self._get_removal_values(
+            cr, uid, wiz_data, assets[0], context=context)
+
+        # removal entries per journal and period
+        moves = {}
+        missing = []
+        for asset in assets:
+            categ = asset.category_id
+            period_id = self._get_removal_period(
+                cr, uid, wiz_data, asset, context=context)
+            journal_id = categ.journal_id.id
+            line_name = asset_obj._get_depreciation_entry_name(
+                cr, uid, asset, line_data.get(asset.id, (0, ))[0] + 1,
+                context=context)
+            removal_values = dict(wiz_values, **sales[asset.id])
+            for field in ['account_plus_value_id', 'account_min_value_id',
+                          'account_residual_value_id']:
+                if categ[field]:
+                    removal_values[field] = categ[field].id
+            if removal_values['sale_value'] and \
+                    not removal_values['account_sale_id']:
+                removal_values['account_sale_id'] = \
+                    wiz_values['account_sale_id']
+            residual_value = residual_values[asset.id]
+            if not self._check_removal_accounts(
+                    cr, uid, wiz_data, residual_value, removal_values,
+                    context=context):
+                missing.append(
+                    asset.code and '%s (ref: %s)' % (asset.name, asset.code)
+                    or asset.name)
+                continue
+            move_lines = self._get_removal_data(
+                cr, uid, wiz_data, asset, residual_value, context=context,
+                removal_values=removal_values)
+            key = wiz_data.group_moves and (journal_id, period_id) \
+                or (journal_id, period_id, asset.id)
+            move = moves.setdefault(key, {
+                'move_vals': {
+                    'name': asset.name,
+                    'date': date_remove,
+                    'ref': line_name,
+                    'period_id': period_id,
+                    'journal_id': journal_id,
+                    'narration': wiz_data.note,
+                    'line_id': [],
+                },
+                'asset_lines': [],
+            })
+            if wiz_data.group_moves and move['asset_lines']:
+                move['move_vals'].update({
+                    'name': _("Asset Removal"),
+                    'ref': False,
+                })
+            move['move_vals']['line_id'] += move_lines
+            move['asset_lines'].append({
+                'amount': residual_value,
+                'asset_id': asset.id,
+                'name': line_name,
+                'line_date': date_remove,
+                'type': 'remove',
+            })
+
+        if missing:
+            raise orm.except_orm(
+                _('Error!'),
+                _("No removal account found for the following assets, "
+                  "please set it on their category or in the wizard:\n%s")
+                % '\n'.join(missing))
+
+        move_ids = []
+        ctx = dict(context, allow_asset=True)
+        for move in moves.values():
+            move_id = move_obj.create(
+                cr, uid, move['move_vals'], context=ctx)
+            move_ids.append(move_id)
+            for asset_line_vals in move['asset_lines']:
+                asset_line_vals['move_id'] = move_id
+                asset_line_obj.create(
+                    cr, uid, asset_line_vals, context=context)
+        asset_obj.write(
+            cr, uid, asset_ids,
+            {'state': 'removed', 'date_remove': date_remove},
+            context=context)
+
+        return {
+            'name': _("Asset Removal Journal Entries"),
+            'view_type': 'form',
+            'view_mode': 'tree,form',
+            'res_model': 'account.move',
+            'view_id': False,
+            'type': 'ir.actions.act_window',
+            'context': context,
+            'nodestroy': True,
+            'domain': [('id', 'in', move_ids)],
+        }
+
     def remove(self, cr, uid, ids, context=None):
         asset_obj = self.pool.get('account.asset.asset')
         asset_line_obj = self.pool.get('account.asset.depreciation.line')
         move_obj = self.pool.get('account.move')
-        period_obj = self.pool.get('account.period')
+
+        asset_ids = context.get('active_ids') or [context['active_id']]
+        if self._is_batch(cr, uid, context=context):
+            return self._remove_batch(
+                cr, uid, ids, asset_ids, context=context)
 
         asset_id = context['active_id']
         asset = asset_obj.browse(cr, uid, asset_id, context=context)
@@ -294,13 +611,8 @@ class account_asset_remove(orm.TransientModel):
         else:
             residual_value = asset.value_residual
 
-        ctx = dict(context, company_id=asset.company_id.id)
-        period_id = wiz_data.period_id and wiz_data.period_id.id or False
-        if not period_id:
-            ctx.update(account_period_prefer_normal=True)
-            period_ids = period_obj.find(
-                cr, uid, wiz_data.date_remove, context=ctx)
-            period_id = period_ids[0]
+        period_id = self._get_removal_period(
+            cr, uid, wiz_data, asset, context=context)
         dl_ids = asset_line_obj.search(
             cr, uid,
             [('asset_id', '=', asset.id), ('type', '=', 'depreciate')],
@@ -35,6 +35,26 @@ class asset_depreciation_confirmation_wizard(orm.TransientModel):
             required=True,
             help="Choose the period for which you want to automatically "
                  "post the depreciation lines of running assets"),
+        'bulk': fields.boolean(
+            'Bulk Posting',
+            help="Create the depreciation entries in chunks, "
+                 "committing the database transaction after each chunk."),
+        'chunk_size': fields.integer(
+            'Chunk Size',
+            help="Number of depreciation lines posted per chunk "
+                 "in bulk posting mode."),
+        'workers': fields.integer(
+            'Workers',
+            help="Number of cron workers posting the depreciation lines. "
+                 "With more than one worker, the assets are split in "
+                 "partitions which are queued as posting jobs and posted "
+                 "in separate transactions: an error only rolls back the "
+                 "partition of the asset in error."),
+        'partition_size': fields.integer(
+            'Partition Size',
+            help="Number of assets per partition when posting with "
+                 "several workers."),
+        'report': fields.text('Report', readonly=True),
     }
 
     def _get_period(self, cr, uid, context=None):
@@ -46,8 +66,24 @@ class asset_depreciation_confirmation_wizard(orm.TransientModel):
 
     _defaults = {
         'period_id': _get_period,
+        'chunk_size': 500,
+        'workers': 1,
+        'partition_size': 100,
     }
 
+    def _show_report(self, cr, uid, ids, report, context=None):
+        self.write(cr, uid, ids, {'report': report}, context=context)
+        return {
+            'name': _('Compute Assets'),
+            'view_type': 'form',
+            'view_mode': 'form',
+            'res_model': 'asset.depreciation.confirmation.wizard',
+            'res_id': ids[0],
+            'target': 'new',
+            'type': 'ir.actions.act_window',
+            'context': context,
+        }
+
     def asset_compute(self, cr, uid, ids, context):
         ass_obj = self.pool.get('account.asset.asset')
         asset_ids = ass_obj.search(
@@ -56,9 +92,33 @@ class asset_depreciation_confirmation_wizard(orm.TransientModel):
             context=context)
         data = self.browse(cr, uid, ids, context=context)
         period_id = data[0].period_id.id
-        created_move_ids = ass_obj._compute_entries(
-            cr, uid, asset_ids, period_id,
-            check_triggers=True, context=context)
+        ctx = dict(context)
+        if data[0].bulk and data[0].chunk_size <= 0:
+            raise orm.except_orm(
+                _('Error!'),
+                _("The Chunk Size must be a positive number."))
+        if data[0].workers > 1:
+            if data[0].partition_size <= 0:
+                raise orm.except_orm(
+                    _('Error!'),
+                    _("The Partition Size must be a positive number."))
+            job_ids = ass_obj._compute_entries_parallel(
+                cr, uid, asset_ids, period_id, data[0].workers,
+                data[0].partition_size,
+                chunk_size=data[0].bulk and data[0].chunk_size or 0,
+                check_triggers=True, context=ctx)
+            return self._show_report(
+                cr, uid, ids,
+                _("%s posting jobs have been queued, they can be followed "
+                  "in the Asset Posting Jobs menu.") % len(job_ids),
+                context=context)
+        else:
+            if data[0].bulk:
+                ctx.update(asset_posting_chunk_size=data[0].chunk_size,
+                           asset_posting_commit=True)
+            created_move_ids = ass_obj._compute_entries(
+                cr, uid, asset_ids, period_id,
+                check_triggers=True, context=ctx)
         domain = "[('id', 'in', [" + \
             ','.join(map(str, created_move_ids)) + "])]"
         return {
@@ -33,6 +33,14 @@ _logger = logging.getLogger(__name__)
 
 _ir_translation_name = 'account.asset.report'
 
+# xlwt (BIFF8) worksheets are limited to 65536 rows,
+# larger reports are continued on additional worksheets
+XLS_MAX_ROWS = 65536
+# maximum length of an Excel 97-2003 formula
+XLS_FORMULA_MAX_LEN = 1024
+# number of assets browsed at once when writing the report rows
+ROW_BROWSE_CHUNK = 500
+
 
 class asset_report_xls_parser(report_sxw.rml_parse):
 
@@ -410,55 +418,239 @@ class asset_report_xls(report_xls):
         row_pos = self.xls_write_row(
             ws, row_pos, row_data, row_style=cell_style)
 
+    def _report_sheet(self, _p, _xs, wb, report, sheet=1):
+        title = self._get_title(report, 'normal')
+        title_short = self._get_title(report, 'short')
+        suffix = sheet > 1 and ' (%s)' % sheet or ''
+        sheet_name = title_short[:31 - len(suffix)].replace('/', '-') + suffix
+        ws = wb.add_sheet(sheet_name)
+        ws.panes_frozen = True
+        ws.remove_splits = True
+        ws.portrait = 0  # Landscape
+        ws.fit_width_to_pages = 1
+        row_pos = 0
+        ws.header_str = self.xls_headers['standard']
+        ws.footer_str = self.xls_footers['standard']
+        row_pos = self._report_title(ws, _p, row_pos, _xs, title)
+        return ws, row_pos
+
+    def _report_header(self, ws, _p, row_pos, template, wanted_list):
+        c_specs = map(
+            lambda x: self.render(
+                x, template, 'header',
+                render_space={'_': _p._}),
+            wanted_list)
+        row_data = self.xls_row_template(
+            c_specs, [x[0] for x in c_specs])
+        row_pos = self.xls_write_row(
+            ws, row_pos, row_data, row_style=self.rh_cell_style,
+            set_column_size=True)
+        ws.set_horz_split_pos(row_pos)
+        return row_pos
+
     def _get_children(self, parent_id):
+        # SQL in stead of child_ids since ORDER BY different from _order,
+        # the sort path returns the tree in depth-first order
+        self.cr.execute(
+            "WITH RECURSIVE children AS ( "
+            "  SELECT id, type, parent_id, ROW_NUMBER() OVER ( "
+            "    PARTITION BY parent_id "
+            "    ORDER BY date_start ASC, name, id) AS seq "
+            "  FROM account_asset_asset "
+            "  WHERE parent_id IS NOT NULL AND state != 'draft'), "
+            "tree(id, type, parent_id, path) AS ( "
+            "  SELECT id, type, parent_id, ARRAY[seq] "
+            "  FROM children WHERE parent_id = %s "
+            "  UNION ALL "
+            "  SELECT c.id, c.type, c.parent_id, t.path || c.seq "
+            "  FROM children c JOIN tree t ON c.parent_id = t.id) "
+            "SELECT id, type, parent_id FROM tree ORDER BY path",
+            (parent_id, ))
+        return [(parent_id, 'view', False)] + self.cr.fetchall()
+
+    def _get_report_entries(self, report_ids):
+        """
+        Returns the assets of the report together with their parent views
+        in the order of the asset hierarchy, and the list positions
+        of the children of each view.
+        """
+        parents = dict([(x[0], x[2]) for x in self.assets])
+        report_assets = set()
+        for asset_id in report_ids:
+            while asset_id and asset_id not in report_assets:
+                report_assets.add(asset_id)
+                asset_id = parents.get(asset_id)
+        entries = filter(lambda x: x[0] in report_assets, self.assets)
+        child_pos = {}
+        for asset_i, data in enumerate(entries):
+            child_pos.setdefault(data[2], []).append(asset_i)
+        return entries, child_pos
+
+    def _browse_entries(self, entries):
+        """
+        Browse the report entries per chunk and drop the record cache
+        afterwards so that memory usage does not grow with the number
+        of assets in the report.
+        """
         cr = self.cr
-
-        def _child_get(asset_id):
-            assets = []
-            # SQL in stead of child_ids since ORDER BY different from _order
+        uid = self.uid
+        context = self.context
+        asset_obj = self.pool.get('account.asset.asset')
+        for i in xrange(0, len(entries), ROW_BROWSE_CHUNK):
+            chunk = entries[i:i + ROW_BROWSE_CHUNK]
+            assets = asset_obj.browse(
+                cr, uid, [x[0] for x in chunk], context=context)
+            for data, asset in zip(chunk, assets):
+                yield data, asset
+            asset_obj.invalidate_cache(cr, uid, context=context)
+
+    def _get_asset_values(self, asset_ids):
+        cr = self.cr
+        res = {}
+        for sub_ids in cr.split_for_in_conditions(asset_ids):
+            cr.execute(
+                "SELECT id, asset_value, salvage_value, value_depreciated, "
+                "state, method_number, name, code "
+                "FROM account_asset_asset WHERE id IN %s",
+                (sub_ids, ))
+            for row in cr.dictfetchall():
+                for field in ('asset_value', 'salvage_value',
+                              'value_depreciated'):
+                    row[field] = row[field] or 0.0
+                res[row['id']] = row
+        return res
+
+    def _get_active_values(self, act_ids):
+        """
+        Adds the fiscal year start and end values to the asset values.
+        The first depreciation line as from the start of the fiscal year
+        and the first one after the end of the fiscal year are retrieved
+        for all assets with a single windowed query.
+        """
+        cr = self.cr
+        fy = self.fiscalyear
+        res = self._get_asset_values(act_ids)
+        fy_start_depr = {}
+        fy_end_depr = {}
+        for sub_ids in cr.split_for_in_conditions(act_ids):
             cr.execute(
-                "SELECT id, type FROM account_asset_asset "
-                "WHERE parent_id = %s AND state != 'draft' "
-                "ORDER BY date_start ASC, name",
-                (asset_id, ))
-            children = cr.fetchall()
-            for child in children:
-                assets.append((child[0], child[1], asset_id))
-                assets += _child_get(child[0])
-            return assets
-
-        assets = _child_get(parent_id)
-        return [(parent_id, 'view', False)] + assets
-
-    def _view_add(self, acq, assets):
-        parent = filter(lambda x: x[0] == acq[2], self.assets)
-        if parent:
-            parent = parent[0]
-            if parent not in assets:
-                self._view_add(parent, assets)
-        assets.append(acq)
+                "SELECT asset_id, depreciated_value, after_fy FROM ( "
+                "  SELECT asset_id, depreciated_value, "
+                "    line_date > %(date_stop)s AS after_fy, "
+                "    ROW_NUMBER() OVER ( "
+                "      PARTITION BY asset_id, line_date > %(date_stop)s "
+                "      ORDER BY line_date ASC, id) AS seq "
+                "  FROM account_asset_depreciation_line "
+                "  WHERE asset_id IN %(ids)s AND type = 'depreciate' "
+                "  AND line_date >= %(date_start)s) AS l "
+                "WHERE seq = 1 "
+                "ORDER BY after_fy DESC",
+                {'ids': sub_ids,
+                 'date_start': fy.date_start,
+                 'date_stop': fy.date_stop})
+            # lines within the fiscal year come last and take precedence
+            for asset_id, depreciated_value, after_fy in cr.fetchall():
+                fy_start_depr[asset_id] = depreciated_value
+                if after_fy:
+                    fy_end_depr[asset_id] = depreciated_value
+
+        for asset_id, vals in res.iteritems():
+
+            # fy_start_value
+            if asset_id in fy_start_depr:
+                value_depreciated = fy_start_depr[asset_id]
+            elif vals['state'] in ['close', 'removed']:
+                value_depreciated = vals['value_depreciated']
+            elif not vals['method_number']:
+                value_depreciated = 0.0
+            else:
+                error_name = vals['name']
+                if vals['code']:
+                    error_name += ' (' + vals['code'] + ')' or ''
+                if vals['state'] in ['open']:
+                    cr.execute(
+                        "SELECT line_date "
+                        "FROM account_asset_depreciation_line "
+                        "WHERE asset_id = %s AND type = 'depreciate' "
+                        "AND init_entry=FALSE AND move_check=FALSE "
+                        "AND line_date < %s"
+                        "ORDER BY line_date ASC LIMIT 1",
+                        (asset_id, fy.date_start))
+                    line = cr.fetchone()
+                    if line:
+                        raise orm.except_orm(
+                            _('Data Error'),
+                            _("You can not report on a Fiscal Year "
+                              "with unposted entries in prior years. "
+                              "Please post depreciation table entry "
+                              "dd. '%s'  of asset '%s' !")
+                            % (line[0], error_name))
+                    else:
+                        raise orm.except_orm(
+                            _('Data Error'),
+                            _("Depreciation Table error for asset %s !")
+                            % error_name)
+                else:
+                    raise orm.except_orm(
+                        _('Data Error'),
+                        _("Depreciation Table error for asset %s !")
+                        % error_name)
+            vals['fy_start_value'] = vals['asset_value'] - value_depreciated
+
+            # fy_end_value
+            if asset_id in fy_end_depr:
+                value_depreciated = fy_end_depr[asset_id]
+            elif not vals['method_number']:
+                value_depreciated = 0.0
+            else:
+                value_depreciated = vals['asset_value']
+            vals['fy_end_value'] = vals['asset_value'] - value_depreciated
+        return res
+
+    def _get_view_totals(self, entries, values, fields):
+        """
+        Sums the values of the normal assets over their parent views.
+        """
+        totals = {}
+        for data in reversed(entries):
+            if data[1] == 'view':
+                vals = totals.setdefault(data[0], dict.fromkeys(fields, 0.0))
+            else:
+                vals = values.get(data[0]) or dict.fromkeys(fields, 0.0)
+            if data[2]:
+                parent_vals = totals.setdefault(
+                    data[2], dict.fromkeys(fields, 0.0))
+                for field in fields:
+                    parent_vals[field] += vals[field]
+        return totals
+
+    def _number_formula(self, value):
+        digits = self.pool.get('decimal.precision').precision_get(
+            self.cr, self.uid, 'Account')
+        return '%.*f' % (digits, value)
+
+    def _view_formula(self, row_pos_start, col_pos, child_pos, value, split):
+        """
+        Returns the sum formula over the child rows of a view.
+        The precomputed total is used in stead when the report is spread
+        over several worksheets or when the formula would exceed
+        the maximum formula length.
+        """
+        if not split:
+            formula = '+'.join([
+                rowcol_to_cell(row_pos_start + x, col_pos)
+                for x in child_pos])
+            if len(formula) <= XLS_FORMULA_MAX_LEN:
+                return formula
+        return self._number_formula(value)
 
     def _acquisition_report(self, _p, _xs, data, objects, wb):
         cr = self.cr
-        uid = self.uid
-        context = self.context
         fy = self.fiscalyear
         wl_acq = _p.wanted_list_acquisition
         template = self.acquisition_template
-        asset_obj = self.pool.get('account.asset.asset')
 
-        title = self._get_title('acquisition', 'normal')
-        title_short = self._get_title('acquisition', 'short')
-        sheet_name = title_short[:31].replace('/', '-')
-        ws = wb.add_sheet(sheet_name)
-        ws.panes_frozen = True
-        ws.remove_splits = True
-        ws.portrait = 0  # Landscape
-        ws.fit_width_to_pages = 1
-        row_pos = 0
-        ws.header_str = self.xls_headers['standard']
-        ws.footer_str = self.xls_footers['standard']
-        row_pos = self._report_title(ws, _p, row_pos, _xs, title)
+        ws, row_pos = self._report_sheet(_p, _xs, wb, 'acquisition')
 
         cr.execute(
             "SELECT id FROM account_asset_asset "
@@ -471,17 +663,7 @@ class asset_report_xls(report_xls):
         if not acq_ids:
             return self._empty_report(ws, _p, row_pos, _xs, 'acquisition')
 
-        c_specs = map(
-            lambda x: self.render(
-                x, template, 'header',
-                render_space={'_': _p._}),
-            wl_acq)
-        row_data = self.xls_row_template(
-            c_specs, [x[0] for x in c_specs])
-        row_pos = self.xls_write_row(
-            ws, row_pos, row_data, row_style=self.rh_cell_style,
-            set_column_size=True)
-        ws.set_horz_split_pos(row_pos)
+        row_pos = self._report_header(ws, _p, row_pos, template, wl_acq)
 
         row_pos_start = row_pos
         if 'account' not in wl_acq:
@@ -493,37 +675,29 @@ class asset_report_xls(report_xls):
         salvage_value_pos = 'salvage_value' in wl_acq and \
             wl_acq.index('salvage_value')
 
-        acqs = filter(lambda x: x[0] in acq_ids, self.assets)
-        acqs_and_parents = []
-        for acq in acqs:
-            self._view_add(acq, acqs_and_parents)
-
-        entries = []
-        for asset_i, data in enumerate(acqs_and_parents):
-            entry = {}
-            asset = asset_obj.browse(cr, uid, data[0], context=context)
-            if data[1] == 'view':
-                cp_i = asset_i + 1
-                cp = []
-                for a in acqs_and_parents[cp_i:]:
-                    if a[2] == data[0]:
-                        cp.append(cp_i)
-                    cp_i += 1
-                entry['child_pos'] = cp
-            entry['asset'] = asset
-            entries.append(entry)
-
-        for entry in entries:
-            asset = entry['asset']
+        entries, child_pos = self._get_report_entries(acq_ids)
+        split = row_pos_start + len(entries) + 1 > XLS_MAX_ROWS
+        totals = self._get_view_totals(
+            entries, self._get_asset_values(acq_ids),
+            ['asset_value', 'salvage_value'])
+        sheet = 1
+
+        for data, asset in self._browse_entries(entries):
+            if row_pos >= XLS_MAX_ROWS:
+                sheet += 1
+                ws, row_pos = self._report_sheet(
+                    _p, _xs, wb, 'acquisition', sheet)
+                row_pos = self._report_header(
+                    ws, _p, row_pos, template, wl_acq)
             if asset.type == 'view':
-                asset_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, asset_value_pos)
-                    for x in entry['child_pos']]
-                asset_formula = '+'.join(asset_value_cells)  # noqa: disable F841, report_xls namespace trick
-                salvage_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, salvage_value_pos)
-                    for x in entry['child_pos']]
-                salvage_formula = '+'.join(salvage_value_cells)  # noqa: disable F841, report_xls namespace trick
+                cp = child_pos[asset.id]
+                view_totals = totals[asset.id]
+                asset_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, asset_value_pos, cp,
+                    view_totals['asset_value'], split)
+                salvage_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, salvage_value_pos, cp,
+                    view_totals['salvage_value'], split)
                 c_specs = map(
                     lambda x: self.render(
                         x, template, 'asset_view'),
@@ -542,9 +716,21 @@ class asset_report_xls(report_xls):
                 row_pos = self.xls_write_row(
                     ws, row_pos, row_data, row_style=self.an_cell_style)
 
-        asset_total_formula = rowcol_to_cell(row_pos_start, asset_value_pos)  # noqa: disable F841, report_xls namespace trick
-        salvage_total_formula = rowcol_to_cell(row_pos_start,  # noqa: disable F841, report_xls namespace trick
-                                               salvage_value_pos)
+        if row_pos >= XLS_MAX_ROWS:
+            sheet += 1
+            ws, row_pos = self._report_sheet(
+                _p, _xs, wb, 'acquisition', sheet)
+            row_pos = self._report_header(ws, _p, row_pos, template, wl_acq)
+        if split:
+            root_totals = totals[entries[0][0]]
+            asset_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['asset_value'])
+            salvage_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['salvage_value'])
+        else:
+            asset_total_formula = rowcol_to_cell(row_pos_start, asset_value_pos)  # noqa: disable F841, report_xls namespace trick
+            salvage_total_formula = rowcol_to_cell(row_pos_start,  # noqa: disable F841, report_xls namespace trick
+                                                   salvage_value_pos)
 
         c_specs = map(
             lambda x: self.render(
@@ -557,25 +743,11 @@ class asset_report_xls(report_xls):
 
     def _active_report(self, _p, _xs, data, objects, wb):
         cr = self.cr
-        uid = self.uid
-        context = self.context
         fy = self.fiscalyear
         wl_act = _p.wanted_list_active
         template = self.active_template
-        asset_obj = self.pool.get('account.asset.asset')
 
-        title = self._get_title('active', 'normal')
-        title_short = self._get_title('active', 'short')
-        sheet_name = title_short[:31].replace('/', '-')
-        ws = wb.add_sheet(sheet_name)
-        ws.panes_frozen = True
-        ws.remove_splits = True
-        ws.portrait = 0  # Landscape
-        ws.fit_width_to_pages = 1
-        row_pos = 0
-        ws.header_str = self.xls_headers['standard']
-        ws.footer_str = self.xls_footers['standard']
-        row_pos = self._report_title(ws, _p, row_pos, _xs, title)
+        ws, row_pos = self._report_sheet(_p, _xs, wb, 'active')
 
         cr.execute(
             "SELECT id FROM account_asset_asset "
@@ -591,17 +763,7 @@ class asset_report_xls(report_xls):
         if not act_ids:
             return self._empty_report(ws, _p, row_pos, _xs, 'active')
 
-        c_specs = map(
-            lambda x: self.render(
-                x, template, 'header',
-                render_space={'_': _p._}),
-            wl_act)
-        row_data = self.xls_row_template(
-            c_specs, [x[0] for x in c_specs])
-        row_pos = self.xls_write_row(
-            ws, row_pos, row_data, row_style=self.rh_cell_style,
-            set_column_size=True)
-        ws.set_horz_split_pos(row_pos)
+        row_pos = self._report_header(ws, _p, row_pos, template, wl_act)
 
         row_pos_start = row_pos
         if 'account' not in wl_act:
@@ -617,125 +779,43 @@ class asset_report_xls(report_xls):
         fy_end_value_pos = 'fy_end_value' in wl_act and \
             wl_act.index('fy_end_value')
 
-        acts = filter(lambda x: x[0] in act_ids, self.assets)
-        acts_and_parents = []
-        for act in acts:
-            self._view_add(act, acts_and_parents)
-
-        entries = []
-        for asset_i, data in enumerate(acts_and_parents):
-            entry = {}
-            asset = asset_obj.browse(cr, uid, data[0], context=context)
-
-            if data[1] == 'view':
-                cp_i = asset_i + 1
-                cp = []
-                for a in acts_and_parents[cp_i:]:
-                    if a[2] == data[0]:
-                        cp.append(cp_i)
-                    cp_i += 1
-                entry['child_pos'] = cp
-
-            else:
-
-                # fy_start_value
-                cr.execute(
-                    "SELECT depreciated_value "
-                    "FROM account_asset_depreciation_line "
-                    "WHERE line_date >= %s"
-                    "AND asset_id = %s AND type = 'depreciate' "
-                    "ORDER BY line_date ASC LIMIT 1",
-                    (fy.date_start, data[0]))
-                res = cr.fetchone()
-                if res:
-                    value_depreciated = res[0]
-                elif asset.state in ['close', 'removed']:
-                    value_depreciated = asset.value_depreciated
-                elif not asset.method_number:
-                    value_depreciated = 0.0
-                else:
-                    error_name = asset.name
-                    if asset.code:
-                        error_name += ' (' + asset.code + ')' or ''
-                    if asset.state in ['open']:
-                        cr.execute(
-                            "SELECT line_date "
-                            "FROM account_asset_depreciation_line "
-                            "WHERE asset_id = %s AND type = 'depreciate' "
-                            "AND init_entry=FALSE AND move_check=FALSE "
-                            "AND line_date < %s"
-                            "ORDER BY line_date ASC LIMIT 1",
-                            (data[0], fy.date_start))
-                        res = cr.fetchone()
-                        if res:
-                            raise orm.except_orm(
-                                _('Data Error'),
-                                _("You can not report on a Fiscal Year "
-                                  "with unposted entries in prior years. "
-                                  "Please post depreciation table entry "
-                                  "dd. '%s'  of asset '%s' !")
-                                % (res[0], error_name))
-                        else:
-                            raise orm.except_orm(
-                                _('Data Error'),
-                                _("Depreciation Table error for asset %s !")
-                                % error_name)
-                    else:
-                        raise orm.except_orm(
-                            _('Data Error'),
-                            _("Depreciation Table error for asset %s !")
-                            % error_name)
-                asset.fy_start_value = asset.asset_value - value_depreciated
-
-                # fy_end_value
-                cr.execute(
-                    "SELECT depreciated_value "
-                    "FROM account_asset_depreciation_line "
-                    "WHERE line_date > %s"
-                    "AND asset_id = %s AND type = 'depreciate' "
-                    "ORDER BY line_date ASC LIMIT 1",
-                    (fy.date_stop, data[0]))
-                res = cr.fetchone()
-                if res:
-                    value_depreciated = res[0]
-                elif not asset.method_number:
-                    value_depreciated = 0.0
-                else:
-                    value_depreciated = asset.asset_value
-                asset.fy_end_value = asset.asset_value - value_depreciated
-            entry['asset'] = asset
-            entries.append(entry)
-
-        for entry in entries:
-            asset = entry['asset']
+        entries, child_pos = self._get_report_entries(act_ids)
+        split = row_pos_start + len(entries) + 1 > XLS_MAX_ROWS
+        values = self._get_active_values(act_ids)
+        totals = self._get_view_totals(
+            entries, values,
+            ['asset_value', 'salvage_value',
+             'fy_start_value', 'fy_end_value'])
+        sheet = 1
+
+        for data, asset in self._browse_entries(entries):
+            if row_pos >= XLS_MAX_ROWS:
+                sheet += 1
+                ws, row_pos = self._report_sheet(_p, _xs, wb, 'active', sheet)
+                row_pos = self._report_header(
+                    ws, _p, row_pos, template, wl_act)
 
             fy_start_value_cell = rowcol_to_cell(row_pos, fy_start_value_pos)
             fy_end_value_cell = rowcol_to_cell(row_pos, fy_end_value_pos)
             asset_value_cell = rowcol_to_cell(row_pos, asset_value_pos)
-            fy_diff_formula = fy_start_value_cell + '-' + fy_end_value_cell
-            total_depr_formula = asset_value_cell + '-' + fy_end_value_cell
+            fy_diff_formula = fy_start_value_cell + '-' + fy_end_value_cell  # noqa: disable F841, report_xls namespace trick
+            total_depr_formula = asset_value_cell + '-' + fy_end_value_cell  # noqa: disable F841, report_xls namespace trick
 
             if asset.type == 'view':
-
-                asset_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, asset_value_pos)
-                    for x in entry['child_pos']]
-                asset_formula = '+'.join(asset_value_cells)  # noqa: disable F841, report_xls namespace trick
-
-                salvage_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, salvage_value_pos)
-                    for x in entry['child_pos']]
-                salvage_formula = '+'.join(salvage_value_cells)  # noqa: disable F841, report_xls namespace trick
-
-                fy_start_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, fy_start_value_pos)
-                    for x in entry['child_pos']]
-                fy_start_formula = '+'.join(fy_start_value_cells)  # noqa: disable F841, report_xls namespace trick
-
-                fy_end_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, fy_end_value_pos)
-                    for x in entry['child_pos']]
-                fy_end_formula = '+'.join(fy_end_value_cells)  # noqa: disable F841, report_xls namespace trick
+                cp = child_pos[asset.id]
+                view_totals = totals[asset.id]
+                asset_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, asset_value_pos, cp,
+                    view_totals['asset_value'], split)
+                salvage_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, salvage_value_pos, cp,
+                    view_totals['salvage_value'], split)
+                fy_start_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, fy_start_value_pos, cp,
+                    view_totals['fy_start_value'], split)
+                fy_end_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, fy_end_value_pos, cp,
+                    view_totals['fy_end_value'], split)
 
                 c_specs = map(
                     lambda x: self.render(
@@ -747,6 +827,8 @@ class asset_report_xls(report_xls):
                     ws, row_pos, row_data, row_style=self.av_cell_style)
 
             else:
+                asset.fy_start_value = values[asset.id]['fy_start_value']
+                asset.fy_end_value = values[asset.id]['fy_end_value']
                 c_specs = map(
                     lambda x: self.render(
                         x, template, 'asset'),
@@ -756,12 +838,27 @@ class asset_report_xls(report_xls):
                 row_pos = self.xls_write_row(
                     ws, row_pos, row_data, row_style=self.an_cell_style)
 
-        asset_total_formula = rowcol_to_cell(row_pos_start, asset_value_pos)  # noqa: disable F841, report_xls namespace trick
-        salvage_total_formula = rowcol_to_cell(row_pos_start,  # noqa: disable F841, report_xls namespace trick
-                                               salvage_value_pos)
-        fy_start_total_formula = rowcol_to_cell(row_pos_start,  # noqa: disable F841, report_xls namespace trick
-                                                fy_start_value_pos)
-        fy_end_total_formula = rowcol_to_cell(row_pos_start, fy_end_value_pos)  # noqa: disable F841, report_xls namespace trick
+        if row_pos >= XLS_MAX_ROWS:
+            sheet += 1
+            ws, row_pos = self._report_sheet(_p, _xs, wb, 'active', sheet)
+            row_pos = self._report_header(ws, _p, row_pos, template, wl_act)
+        if split:
+            root_totals = totals[entries[0][0]]
+            asset_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['asset_value'])
+            salvage_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['salvage_value'])
+            fy_start_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['fy_start_value'])
+            fy_end_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['fy_end_value'])
+        else:
+            asset_total_formula = rowcol_to_cell(row_pos_start, asset_value_pos)  # noqa: disable F841, report_xls namespace trick
+            salvage_total_formula = rowcol_to_cell(row_pos_start,  # noqa: disable F841, report_xls namespace trick
+                                                   salvage_value_pos)
+            fy_start_total_formula = rowcol_to_cell(row_pos_start,  # noqa: disable F841, report_xls namespace trick
+                                                    fy_start_value_pos)
+            fy_end_total_formula = rowcol_to_cell(row_pos_start, fy_end_value_pos)  # noqa: disable F841, report_xls namespace trick
 
         fy_start_value_cell = rowcol_to_cell(row_pos, fy_start_value_pos)
         fy_end_value_cell = rowcol_to_cell(row_pos, fy_end_value_pos)
@@ -780,25 +877,11 @@ class asset_report_xls(report_xls):
 
     def _removal_report(self, _p, _xs, data, objects, wb):
         cr = self.cr
-        uid = self.uid
-        context = self.context
         fy = self.fiscalyear
         wl_dsp = _p.wanted_list_removal
         template = self.removal_template
-        asset_obj = self.pool.get('account.asset.asset')
 
-        title = self._get_title('removal', 'normal')
-        title_short = self._get_title('removal', 'short')
-        sheet_name = title_short[:31].replace('/', '-')
-        ws = wb.add_sheet(sheet_name)
-        ws.panes_frozen = True
-        ws.remove_splits = True
-        ws.portrait = 0  # Landscape
-        ws.fit_width_to_pages = 1
-        row_pos = 0
-        ws.header_str = self.xls_headers['standard']
-        ws.footer_str = self.xls_footers['standard']
-        row_pos = self._report_title(ws, _p, row_pos, _xs, title)
+        ws, row_pos = self._report_sheet(_p, _xs, wb, 'removal')
 
         cr.execute(
             "SELECT id FROM account_asset_asset "
@@ -811,17 +894,7 @@ class asset_report_xls(report_xls):
         if not dsp_ids:
             return self._empty_report(ws, _p, row_pos, _xs, 'removal')
 
-        c_specs = map(
-            lambda x: self.render(
-                x, template, 'header',
-                render_space={'_': _p._}),
-            wl_dsp)
-        row_data = self.xls_row_template(
-            c_specs, [x[0] for x in c_specs])
-        row_pos = self.xls_write_row(
-            ws, row_pos, row_data, row_style=self.rh_cell_style,
-            set_column_size=True)
-        ws.set_horz_split_pos(row_pos)
+        row_pos = self._report_header(ws, _p, row_pos, template, wl_dsp)
 
         row_pos_start = row_pos
         if 'account' not in wl_dsp:
@@ -833,37 +906,29 @@ class asset_report_xls(report_xls):
         salvage_value_pos = 'salvage_value' in wl_dsp and \
             wl_dsp.index('salvage_value')
 
-        dsps = filter(lambda x: x[0] in dsp_ids, self.assets)
-        dsps_and_parents = []
-        for dsp in dsps:
-            self._view_add(dsp, dsps_and_parents)
-
-        entries = []
-        for asset_i, data in enumerate(dsps_and_parents):
-            entry = {}
-            asset = asset_obj.browse(cr, uid, data[0], context=context)
-            if data[1] == 'view':
-                cp_i = asset_i + 1
-                cp = []
-                for a in dsps_and_parents[cp_i:]:
-                    if a[2] == data[0]:
-                        cp.append(cp_i)
-                    cp_i += 1
-                entry['child_pos'] = cp
-            entry['asset'] = asset
-            entries.append(entry)
-
-        for entry in entries:
-            asset = entry['asset']
+        entries, child_pos = self._get_report_entries(dsp_ids)
+        split = row_pos_start + len(entries) + 1 > XLS_MAX_ROWS
+        totals = self._get_view_totals(
+            entries, self._get_asset_values(dsp_ids),
+            ['asset_value', 'salvage_value'])
+        sheet = 1
+
+        for data, asset in self._browse_entries(entries):
+            if row_pos >= XLS_MAX_ROWS:
+                sheet += 1
+                ws, row_pos = self._report_sheet(
+                    _p, _xs, wb, 'removal', sheet)
+                row_pos = self._report_header(
+                    ws, _p, row_pos, template, wl_dsp)
             if asset.type == 'view':
-                asset_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, asset_value_pos)
-                    for x in entry['child_pos']]
-                asset_formula = '+'.join(asset_value_cells)  # noqa: disable F841, report_xls namespace trick
-                salvage_value_cells = [
-                    rowcol_to_cell(row_pos_start + x, salvage_value_pos)
-                    for x in entry['child_pos']]
-                salvage_formula = '+'.join(salvage_value_cells)  # noqa: disable F841, report_xls namespace trick
+                cp = child_pos[asset.id]
+                view_totals = totals[asset.id]
+                asset_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, asset_value_pos, cp,
+                    view_totals['asset_value'], split)
+                salvage_formula = self._view_formula(  # noqa: disable F841, report_xls namespace trick
+                    row_pos_start, salvage_value_pos, cp,
+                    view_totals['salvage_value'], split)
                 c_specs = map(
                     lambda x: self.render(
                         x, template, 'asset_view'),
@@ -882,9 +947,20 @@ class asset_report_xls(report_xls):
                 row_pos = self.xls_write_row(
                     ws, row_pos, row_data, row_style=self.an_cell_style)
 
-        asset_total_formula = rowcol_to_cell(row_pos_start, asset_value_pos)  # noqa: disable F841, report_xls namespace trick
-        salvage_total_formula = rowcol_to_cell(row_pos_start,   # noqa: disable F841, report_xls namespace trick
-                                               salvage_value_pos)
+        if row_pos >= XLS_MAX_ROWS:
+            sheet += 1
+            ws, row_pos = self._report_sheet(_p, _xs, wb, 'removal', sheet)
+            row_pos = self._report_header(ws, _p, row_pos, template, wl_dsp)
+        if split:
+            root_totals = totals[entries[0][0]]
+            asset_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['asset_value'])
+            salvage_total_formula = self._number_formula(  # noqa: disable F841, report_xls namespace trick
+                root_totals['salvage_value'])
+        else:
+            asset_total_formula = rowcol_to_cell(row_pos_start, asset_value_pos)  # noqa: disable F841, report_xls namespace trick
+            salvage_total_formula = rowcol_to_cell(row_pos_start,   # noqa: disable F841, report_xls namespace trick
+                                                   salvage_value_pos)
 
         c_specs = map(
             lambda x: self.render(
@@ -19,6 +19,7 @@
 #
 ##############################################################################
 from . import mail
+from . import report_pdf
 from . import run
 from . import line
 from . import account
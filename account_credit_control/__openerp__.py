@@ -37,6 +37,7 @@
           "partner_view.xml",
           "policy_view.xml",
           "run_view.xml",
+          "run_cron.xml",
           "company_view.xml",
           "wizard/credit_control_emailer_view.xml",
           "wizard/credit_control_marker_view.xml",
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+""" Benchmark of the credit control hot paths.
+
+Generates synthetic partners, invoices and overdue move lines, then runs
+and measures each stage of a dunning wave:
+
+* ``generate``: ``credit.control.run.generate_credit_lines``
+* ``mark``: the marker wizard setting the lines to ``to_be_sent``
+* ``communication``: the grouping of the lines in communications
+* ``email``: the emailer wizard (capped by ``--email-limit`` lines)
+
+For each scale and stage, the wall time, the number of queries and the
+growth of the peak memory of the process are reported. Everything is done
+in a transaction rolled back after each scale.
+
+The database must have ``account_credit_control`` installed with a chart
+of accounts and a credit control policy on the company, like the demo data.
+
+Usage::
+
+    python credit_control_benchmark.py -c openerp-server.conf -d mydb \\
+        --lines 10000 --lines 100000 --lines 1000000
+
+"""
+import argparse
+import json
+import logging
+import resource
+import time
+from datetime import date, timedelta
+
+import openerp
+from openerp import api, fields, SUPERUSER_ID
+
+_logger = logging.getLogger('credit.control.benchmark')
+
+STAGES = ['generate', 'mark', 'communication', 'email']
+
+
+class StageRecorder(object):
+    """ Record the wall time, the number of queries and the growth of the
+    peak memory (ru_maxrss, in kB) of the stages of a scale.
+
+    The queries of the cursors opened by the rendering workers of the
+    emailer are not counted.
+    """
+
+    def __init__(self, cr, scale):
+        self.cr = cr
+        self.scale = scale
+        self.results = []
+
+    def run(self, name, fun, *args, **kwargs):
+        queries = self.cr.sql_log_count
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        res = fun(*args, **kwargs)
+        self.results.append({
+            'scale': self.scale,
+            'stage': name,
+            'time': time.time() - start,
+            'queries': self.cr.sql_log_count - queries,
+            'peak_memory': (resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss - peak),
+        })
+        _logger.info('%(scale)s lines, %(stage)s: %(time).2fs, '
+                     '%(queries)s queries, +%(peak_memory)s kB',
+                     self.results[-1])
+        return res
+
+
+def _clone_rows(cr, table, template_id, source, overrides):
+    """ Insert copies of a row, one per row of ``source``.
+
+    :param source: SQL of a subquery aliased ``src``
+    :param overrides: dict {column: SQL expression} of the values
+                      replacing the ones of the template
+    :returns: ids of the new rows, in the order of ``src.seq``
+    """
+    cr.execute("SELECT column_name FROM information_schema.columns "
+               "WHERE table_name = %s AND column_name != 'id'", (table,))
+    columns = [row[0] for row in cr.fetchall()]
+    values = [overrides.get(column, 'tmpl.%s' % column)
+              for column in columns]
+    cr.execute("INSERT INTO %s (%s) SELECT %s FROM %s tmpl, (%s) src "
+               "WHERE tmpl.id = %%s ORDER BY src.seq RETURNING id" %
+               (table, ', '.join(columns), ', '.join(values), table,
+                source),
+               (template_id,))
+    return sorted(row[0] for row in cr.fetchall())
+
+
+def _create_template_invoice(env, controlling_date, overdue_days):
+    """ Create and validate the invoice copied for the synthetic data """
+    company = env.user.company_id
+    policy = company.credit_policy_id
+    assert policy and policy.account_ids, \
+        'The company needs a credit control policy with accounts'
+    journal = env['account.journal'].search(
+        [('type', '=', 'sale'), ('company_id', '=', company.id)], limit=1)
+    partner = env['res.partner'].create({'name': 'Benchmark Partner',
+                                         'customer': True,
+                                         'email': 'benchmark@example.com'})
+    due_date = controlling_date - timedelta(days=overdue_days)
+    invoice = env['account.invoice'].create({
+        'partner_id': partner.id,
+        'account_id': policy.account_ids[0].id,
+        'journal_id': journal.id,
+        'date_invoice': fields.Date.to_string(due_date),
+        'date_due': fields.Date.to_string(due_date),
+        'invoice_line': [(0, 0, {
+            'name': 'Benchmark',
+            'quantity': 1.0,
+            'price_unit': 100.0,
+            'account_id': journal.default_credit_account_id.id,
+        })],
+    })
+    invoice.signal_workflow('invoice_open')
+    return invoice
+
+
+def generate_data(env, lines, lines_per_partner, controlling_date,
+                  overdue_days):
+    """ Generate ``lines`` overdue invoices, each with its move and move
+    lines, spread over partners having ``lines_per_partner`` invoices.
+
+    :returns: policy of the company
+    """
+    cr = env.cr
+    invoice = _create_template_invoice(env, controlling_date, overdue_days)
+    partner_count = max(lines // lines_per_partner, 1)
+    partner_ids = _clone_rows(
+        cr, 'res_partner', invoice.partner_id.id,
+        'SELECT generate_series(1, %d) AS seq' % partner_count,
+        {'name': "tmpl.name || ' ' || src.seq",
+         'display_name': "tmpl.name || ' ' || src.seq"})
+    cr.execute("UPDATE res_partner SET commercial_partner_id = id "
+               "WHERE id = ANY(%s)", (partner_ids,))
+    # invoice i belongs to partner i modulo the number of partners
+    source = ("SELECT seq, (%s)[1 + mod(seq - 1, %d)] AS partner_id "
+              "FROM generate_series(1, %d) AS seq" %
+              (cr.mogrify('%s::int[]', (partner_ids,)), partner_count,
+               lines))
+    move_ids = _clone_rows(
+        cr, 'account_move', invoice.move_id.id, source,
+        {'name': "tmpl.name || '-' || src.seq",
+         'partner_id': 'src.partner_id'})
+    moves = ("SELECT seq, partner_id, (%s)[seq] AS move_id FROM (%s) s" %
+             (cr.mogrify('%s::int[]', (move_ids,)), source))
+    for line in invoice.move_id.line_id:
+        _clone_rows(cr, 'account_move_line', line.id, moves,
+                    {'move_id': 'src.move_id',
+                     'partner_id': 'src.partner_id'})
+    _clone_rows(cr, 'account_invoice', invoice.id, moves,
+                {'move_id': 'src.move_id',
+                 'partner_id': 'src.partner_id',
+                 'number': "tmpl.number || '-' || src.seq",
+                 'internal_number': "tmpl.internal_number || '-' || src.seq"})
+    env.invalidate_all()
+    return env.user.company_id.credit_policy_id
+
+
+def benchmark_scale(env, scale, args, stages):
+    """ Generate the data of a scale and run the stages on it """
+    recorder = StageRecorder(env.cr, scale)
+    controlling_date = date.today()
+    policy = recorder.run('data', generate_data, env, scale,
+                          args.lines_per_partner, controlling_date,
+                          args.overdue_days)
+    line_obj = env['credit.control.line']
+    run = env['credit.control.run'].create({
+        'date': fields.Date.to_string(controlling_date),
+        'policy_ids': [(6, 0, policy.ids)],
+    })
+    if 'generate' in stages:
+        recorder.run('generate', run.generate_credit_lines)
+    lines = line_obj.search([('run_id', '=', run.id)])
+    if 'mark' in stages and lines:
+        marker = env['credit.control.marker'].create({
+            'name': 'to_be_sent',
+            'line_ids': [(6, 0, lines.ids)],
+        })
+        recorder.run('mark', marker.mark_lines)
+    if 'communication' in stages and lines:
+        comm_obj = env['credit.control.communication']
+        recorder.run('communication',
+                     comm_obj._generate_comm_from_credit_lines, lines)
+    email_lines = line_obj.search([('run_id', '=', run.id),
+                                   ('state', '=', 'to_be_sent'),
+                                   ('channel', '=', 'email')],
+                                  limit=args.email_limit)
+    if 'email' in stages and email_lines:
+        emailer = env['credit.control.emailer'].create({
+            'line_ids': [(6, 0, email_lines.ids)],
+            'workers': args.workers,
+        })
+        recorder.run('email', emailer.email_lines)
+    return recorder.results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the credit control runs')
+    parser.add_argument('-c', '--config', required=True,
+                        help='configuration file of the server')
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--lines', type=int, action='append',
+                        help='number of overdue move lines of a scale, '
+                             'repeat for several scales (default: 10000)')
+    parser.add_argument('--lines-per-partner', type=int, default=10)
+    parser.add_argument('--overdue-days', type=int, default=45)
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='comma separated stages to run '
+                             '(default: %(default)s)')
+    parser.add_argument('--email-limit', type=int, default=500,
+                        help='maximum number of lines to email')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='workers of the emailer')
+    parser.add_argument('--output', help='write the results in this '
+                                         'JSON file')
+    args = parser.parse_args()
+    stages = args.stages.split(',')
+
+    openerp.tools.config.parse_config(['-c', args.config])
+    logging.basicConfig(level=logging.INFO)
+    registry = openerp.modules.registry.RegistryManager.get(args.database)
+    results = []
+    with api.Environment.manage():
+        for scale in args.lines or [10000]:
+            cr = registry.cursor()
+            try:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                results += benchmark_scale(env, scale, args, stages)
+            finally:
+                cr.rollback()
+                cr.close()
+
+    print '%10s %-14s %10s %10s %14s' % ('lines', 'stage', 'time (s)',
+                                         'queries', 'peak mem (kB)')
+    for res in results:
+        print '%(scale)10d %(stage)-14s %(time)10.2f %(queries)10d ' \
+              '%(peak_memory)14d' % res
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
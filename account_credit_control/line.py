@@ -21,9 +21,71 @@
 import logging
 
 from openerp import models, fields, api, _
+from openerp.models import get_pg_type
 
 logger = logging.getLogger('credit.line.control')
 
+# number of credit control lines inserted per INSERT statement
+CREDIT_LINE_INSERT_CHUNK = 1000
+
+# latest credit line of each move line, ignored and manually overridden
+# lines excepted, with a flag telling if one of its lines was processed
+LEVEL_SUMMARY_SQL = """
+    SELECT DISTINCT ON (move_line_id)
+           move_line_id, id AS credit_line_id, level, state, date,
+           bool_or(state != 'draft')
+             OVER (PARTITION BY move_line_id) AS processed
+    FROM credit_control_line
+    WHERE state != 'ignored'
+    AND NOT manually_overridden
+    %s
+    ORDER BY move_line_id, level DESC, id DESC
+"""
+
+# fields of the credit lines the level summary depends on
+FIELDS_AFFECTS_LEVEL_SUMMARY = ['state', 'manually_overridden',
+                                'policy_level_id', 'level',
+                                'move_line_id', 'date']
+
+
+def prepare_bulk_insert(model, vals_list, excluded=()):
+    """ Prepare the multi-row INSERT of new records of ``model``, the
+    values being completed with the defaults as ``create`` does.
+
+    :param model: recordset of the model of the new records
+    :param vals_list: list of dicts of values of the new records
+    :param excluded: fields inserted by the caller
+    :returns: (names, placeholders, rows): the names of the inserted
+              columns, the SQL placeholders of their values in a row and
+              the parameters of each row. None when a field is not a
+              plain column, the records must then be created with the ORM.
+    """
+    model.check_access_rights('create')
+    defaults = model.default_get(list(model._fields))
+    for name, column in model._columns.iteritems():
+        if column._type == 'boolean' and name not in defaults:
+            defaults[name] = False
+    names = set(defaults)
+    for vals in vals_list:
+        names.update(vals)
+    names = sorted([x for x in names
+                    if x not in excluded and
+                    x not in models.LOG_ACCESS_COLUMNS and
+                    x != 'id'])
+    columns = [model._columns.get(x) for x in names]
+    if not all(x is not None and x._classic_write and
+               x._type not in ('one2many', 'many2many')
+               for x in columns):
+        return None
+    placeholders = ', '.join(['%%s::%s' % get_pg_type(x)[0]
+                              for x in columns])
+    rows = []
+    for vals in vals_list:
+        vals = dict(defaults, **vals)
+        rows.append([column._symbol_set[1](vals.get(name))
+                     for name, column in zip(names, columns)])
+    return names, placeholders, rows
+
 
 class CreditControlLine(models.Model):
     """ A credit control line describes an amount due by a customer for a due date.
@@ -159,9 +221,34 @@ class CreditControlLine(models.Model):
         data['move_line_id'] = move_line.id
         return data
 
+    @api.model
+    def _get_tolerances(self, controlling_date):
+        """ Return the credit control tolerance of the company of the user
+        converted in each currency at the rates of the controlling date.
+
+        The table is meant to be computed once per run and shared by the
+        levels and policies of the run.
+
+        :param controlling_date: date string of the credit controlling date
+        :returns: dict {currency id: tolerance}, the key False holds
+                  the tolerance of the lines without currency
+        """
+        currency_obj = self.env['res.currency'].with_context(
+            date=controlling_date)
+        user = self.env.user
+        currencies = currency_obj.search([])
+
+        tolerance_base = user.company_id.credit_control_tolerance
+        tolerance = {False: tolerance_base}
+        user_currency = user.company_id.currency_id
+        for currency in currencies:
+            tolerance[currency.id] = currency.compute(tolerance_base,
+                                                      user_currency)
+        return tolerance
+
     @api.model
     def create_or_update_from_mv_lines(self, lines, level, controlling_date,
-                                       check_tolerance=True):
+                                       check_tolerance=True, tolerances=None):
         """ Create or update line based on levels
 
         if check_tolerance is true credit line will not be
@@ -178,46 +265,191 @@ class CreditControlLine(models.Model):
                                 will not be generated if open amount
                                 is smaller than company defined
                                 tolerance
+        :param tolerances: table of the tolerances as returned by
+                           ``_get_tolerances``, computed when not given
 
         :returns: recordset of created credit lines
         """
-        currency_obj = self.env['res.currency']
-        user = self.env.user
-        currencies = currency_obj.search([])
-
-        tolerance = {}
-        tolerance_base = user.company_id.credit_control_tolerance
-        user_currency = user.company_id.currency_id
-        for currency in currencies:
-            tolerance[currency.id] = currency.compute(tolerance_base,
-                                                      user_currency)
+        tolerance = tolerances
+        if check_tolerance and tolerance is None:
+            tolerance = self._get_tolerances(controlling_date)
 
-        new_lines = self.browse()
+        vals_list = []
         for move_line in lines:
             open_amount = move_line.amount_residual_currency
-            cur_tolerance = tolerance.get(move_line.currency_id.id,
-                                          tolerance_base)
-            if check_tolerance and open_amount < cur_tolerance:
-                continue
-            vals = self._prepare_from_move_line(move_line,
-                                                level,
-                                                controlling_date,
-                                                open_amount)
-            line = self.create(vals)
-            new_lines += line
-
-            # when we have lines generated earlier in draft,
-            # on the same level, it means that we have left
-            # them, so they are to be considered as ignored
-            previous_drafts = self.search([('move_line_id', '=', move_line.id),
-                                           ('policy_level_id', '=', level.id),
-                                           ('state', '=', 'draft'),
-                                           ('id', '!=', line.id)])
-            if previous_drafts:
-                previous_drafts.write({'state': 'ignored'})
+            if check_tolerance:
+                cur_tolerance = tolerance.get(move_line.currency_id.id,
+                                              tolerance[False])
+                if open_amount < cur_tolerance:
+                    continue
+            vals_list.append(self._prepare_from_move_line(move_line,
+                                                          level,
+                                                          controlling_date,
+                                                          open_amount))
+        new_lines = self._create_bulk(vals_list)
+
+        # when we have lines generated earlier in draft,
+        # on the same level, it means that we have left
+        # them, so they are to be considered as ignored
+        self._ignore_previous_drafts(new_lines, level)
+        return new_lines
+
+    # related fields filled from the move line and the level
+    # by the bulk insert
+    _bulk_related_columns = {
+        'date_entry': 'mv_line.date',
+        'account_id': 'mv_line.account_id',
+        'currency_id': 'mv_line.currency_id',
+        'company_id': 'mv_line.company_id',
+        'policy_id': 'level.policy_id',
+        'level': 'level.level',
+    }
+
+    @api.model
+    def _create_bulk(self, vals_list):
+        """ Create credit control lines with one multi-row INSERT
+        per chunk of lines.
 
+        The values must only contain plain columns, the related fields
+        are filled from the move line and the policy level.
+        Otherwise the lines are created with the ORM.
+
+        :param vals_list: list of dicts as returned by
+                          ``_prepare_from_move_line``
+        :returns: recordset of created credit lines
+        """
+        if not vals_list:
+            return self.browse()
+        prepared = prepare_bulk_insert(self, vals_list,
+                                       excluded=self._bulk_related_columns)
+        if prepared is None:
+            new_lines = self.browse()
+            for vals in vals_list:
+                new_lines += self.create(vals)
+            return new_lines
+
+        cr = self.env.cr
+        names, placeholders, rows = prepared
+        related_names = sorted(self._bulk_related_columns)
+        new_ids = []
+        for i in xrange(0, len(rows), CREDIT_LINE_INSERT_CHUNK):
+            chunk = rows[i:i + CREDIT_LINE_INSERT_CHUNK]
+            cr.execute(
+                "INSERT INTO credit_control_line "
+                "(create_uid, create_date, write_uid, write_date, " +
+                ', '.join(names + related_names) + ") "
+                "SELECT %s, (now() at time zone 'UTC'), "
+                "%s, (now() at time zone 'UTC'), " +
+                ', '.join(['v.%s' % x for x in names] +
+                          [self._bulk_related_columns[x]
+                           for x in related_names]) +
+                " FROM (VALUES " +
+                ', '.join(['(%s)' % placeholders] * len(chunk)) +
+                ") AS v(" + ', '.join(names) + ") "
+                "JOIN account_move_line mv_line "
+                "  ON (mv_line.id = v.move_line_id) "
+                "JOIN credit_control_policy_level level "
+                "  ON (level.id = v.policy_level_id) "
+                "RETURNING id",
+                [self.env.uid, self.env.uid] +
+                [param for row in chunk for param in row])
+            new_ids += [row[0] for row in cr.fetchall()]
+        new_lines = self.browse(new_ids)
+        self._refresh_level_summary([vals['move_line_id']
+                                     for vals in vals_list])
+
+        # other stored computed fields added by extensions
+        for name, field in self._fields.iteritems():
+            if field.store and field.compute and \
+                    name not in self._bulk_related_columns:
+                self.env.add_todo(field, new_lines)
+        self.recompute()
         return new_lines
 
+    @api.model
+    def _ignore_previous_drafts(self, new_lines, level):
+        """ Set the draft lines of the same move lines and level
+        than the new lines to ignored, with one UPDATE per chunk.
+        """
+        cr = self.env.cr
+        move_line_ids = []
+        for sub_ids in cr.split_for_in_conditions(new_lines.ids):
+            cr.execute(
+                "UPDATE credit_control_line "
+                "SET state = 'ignored', write_uid = %s, "
+                "    write_date = (now() at time zone 'UTC') "
+                "WHERE policy_level_id = %s AND state = 'draft' "
+                "AND move_line_id IN (SELECT move_line_id "
+                "                     FROM credit_control_line "
+                "                     WHERE id IN %s) "
+                "AND id NOT IN %s "
+                "RETURNING move_line_id",
+                (self.env.uid, level.id, sub_ids, sub_ids))
+            move_line_ids += [row[0] for row in cr.fetchall()]
+        self.invalidate_cache(['state'])
+        self._refresh_level_summary(move_line_ids)
+
+    def init(self, cr):
+        """ Create the table holding the current level of each move line.
+
+        The table is refilled on each installation or update of the
+        module, in case the credit lines were changed without
+        refreshing it.
+        """
+        cr.execute("SELECT relname FROM pg_class "
+                   "WHERE relname = 'credit_control_line_level'")
+        if cr.fetchone():
+            cr.execute("TRUNCATE credit_control_line_level")
+        else:
+            cr.execute("CREATE TABLE credit_control_line_level ("
+                       "move_line_id integer PRIMARY KEY, "
+                       "credit_line_id integer NOT NULL, "
+                       "level integer, "
+                       "state varchar, "
+                       "date date, "
+                       "processed boolean)")
+            cr.execute("CREATE INDEX "
+                       "credit_control_line_level_level_state_index "
+                       "ON credit_control_line_level (level, state)")
+        cr.execute("INSERT INTO credit_control_line_level " +
+                   LEVEL_SUMMARY_SQL % '')
+
+    @api.model
+    def _refresh_level_summary(self, move_line_ids):
+        """ Update the current level of the move lines in the
+        ``credit_control_line_level`` table, which has one row per move line
+        with its latest credit line that is not ignored nor manually
+        overridden.
+
+        :param move_line_ids: ids of the move lines to update
+        """
+        move_line_ids = list(set(move_line_ids))
+        if not move_line_ids:
+            return
+        cr = self.env.cr
+        cr.execute("DELETE FROM credit_control_line_level "
+                   "WHERE move_line_id = ANY(%s)", (move_line_ids,))
+        cr.execute("INSERT INTO credit_control_line_level " +
+                   LEVEL_SUMMARY_SQL % "AND move_line_id = ANY(%s)",
+                   (move_line_ids,))
+
+    @api.model
+    @api.returns('self', lambda value: value.id)
+    def create(self, vals):
+        line = super(CreditControlLine, self).create(vals)
+        self._refresh_level_summary(line.move_line_id.ids)
+        return line
+
+    @api.multi
+    def write(self, vals):
+        if not any(name in vals for name in FIELDS_AFFECTS_LEVEL_SUMMARY):
+            return super(CreditControlLine, self).write(vals)
+        move_line_ids = self.mapped('move_line_id').ids
+        res = super(CreditControlLine, self).write(vals)
+        self._refresh_level_summary(move_line_ids +
+                                    self.mapped('move_line_id').ids)
+        return res
+
     @api.multi
     def unlink(self):
         for line in self:
@@ -227,4 +459,7 @@ class CreditControlLine(models.Model):
                       'line that is not in draft state.')
                 )
 
-        return super(CreditControlLine, self).unlink()
+        move_line_ids = self.mapped('move_line_id').ids
+        res = super(CreditControlLine, self).unlink()
+        self._refresh_level_summary(move_line_ids)
+        return res
@@ -47,12 +47,20 @@ class CreditControlPolicy(models.Model):
 
     @api.multi
     def _move_lines_domain(self, controlling_date):
-        """ Build the default domain for searching move lines """
-        self.ensure_one()
-        return [('account_id', 'in', self.account_ids.ids),
-                ('date_maturity', '<=', controlling_date),
-                ('reconcile_id', '=', False),
-                ('partner_id', '!=', False)]
+        """ Build the default domain for searching move lines
+
+        The ``credit_control_partner_range`` context key (first partner id,
+        last partner id) restricts the move lines to a range of partners.
+        """
+        domain = [('account_id', 'in', self.mapped('account_ids').ids),
+                  ('date_maturity', '<=', controlling_date),
+                  ('reconcile_id', '=', False),
+                  ('partner_id', '!=', False)]
+        partner_range = self.env.context.get('credit_control_partner_range')
+        if partner_range:
+            domain += [('partner_id', '>=', partner_range[0]),
+                       ('partner_id', '<=', partner_range[1])]
+        return domain
 
     @api.multi
     @api.returns('account.move.line')
@@ -191,6 +199,207 @@ class CreditControlPolicy(models.Model):
             return move_line_obj.browse([row[0] for row in res])
         return different_lines
 
+    @api.multi
+    def _classify_move_lines(self, controlling_date, lines, tolerances=None):
+        """ Assign the move lines to the level of the policy they
+        have to be generated for.
+
+        Equivalent to calling ``get_level_lines`` on each level, but done
+        with one query for all the levels: the latest credit line of each
+        move line is read from the ``credit_control_line_level`` table and
+        the move line is matched against the level following the latest
+        one.
+
+        We use Raw SQL for performance. Security rule where applied in
+        policy object when the first set of lines were retrieved
+
+        When ``tolerances`` is given, the lines whose open amount is
+        below the tolerance of their currency are left out. The open amount
+        is computed in SQL when the partial payments are in the currency of
+        the line; the other lines are kept and checked on creation of the
+        credit lines.
+
+        :param str controlling_date: date of credit control
+        :param lines: recordset of move lines to classify
+        :param tolerances: dict {currency id or False: tolerance}
+                           as returned by credit.control.line._get_tolerances
+        :return: dict {level record: recordset of move lines}
+        """
+        self.ensure_one()
+        move_line_obj = self.env['account.move.line']
+        if not lines or not self.level_ids:
+            return {}
+        cr = self.env.cr
+        boundaries = []
+        for level in self.level_ids:
+            boundary = level._get_sql_date_boundary_for_computation_mode(
+                controlling_date)
+            boundary = cr.mogrify(boundary,
+                                  {'controlling_date': controlling_date,
+                                   'delay': level.delay_days})
+            boundaries.append(cr.mogrify(" WHEN %s THEN ", (level.id,)) +
+                              boundary.replace('%', '%%'))
+        params = {'policy_id': self.id, 'line_ids': lines.ids}
+        tolerance_join = tolerance_where = ""
+        if tolerances is not None:
+            tolerance_join = (
+                " LEFT JOIN (SELECT unnest(%(tol_currency_ids)s::int[])\n"
+                "                   AS currency_id,\n"
+                "                   unnest(%(tol_amounts)s::numeric[])\n"
+                "                   AS amount) tol\n"
+                " ON (tol.currency_id = COALESCE(mv_line.currency_id, 0))\n"
+                " LEFT JOIN res_currency cur\n"
+                " ON (cur.id = mv_line.currency_id)\n"
+                " LEFT JOIN (SELECT reconcile_partial_id,\n"
+                "                   SUM(debit - credit) AS balance,\n"
+                "                   SUM(amount_currency) AS amount_currency,\n"
+                "                   MIN(COALESCE(currency_id, 0))"
+                " AS currency_id,\n"
+                "                   COUNT(DISTINCT COALESCE(currency_id, 0))\n"
+                "                     AS currency_count\n"
+                "            FROM account_move_line\n"
+                "            WHERE reconcile_partial_id IN (\n"
+                "              SELECT reconcile_partial_id\n"
+                "              FROM account_move_line\n"
+                "              WHERE id = ANY(%(line_ids)s))\n"
+                "            GROUP BY reconcile_partial_id) partial\n"
+                " ON (partial.reconcile_partial_id ="
+                " mv_line.reconcile_partial_id)\n")
+            # same computation as the residual amount of the move line,
+            # NULL when the payments are in another currency than the line
+            residual = (
+                "CASE WHEN mv_line.currency_id IS NULL\n"
+                "      THEN COALESCE(partial.balance,\n"
+                "                    mv_line.debit - mv_line.credit)\n"
+                "      WHEN mv_line.reconcile_partial_id IS NULL\n"
+                "      THEN mv_line.amount_currency\n"
+                "      WHEN partial.currency_count = 1\n"
+                "       AND partial.currency_id = mv_line.currency_id\n"
+                "      THEN partial.amount_currency\n"
+                " END")
+            # keep a margin of the currency rounding, the check on
+            # the rounded amount is done again on creation of the lines
+            tolerance_where = (
+                " AND NOT COALESCE(" + residual + " <\n"
+                "     COALESCE(tol.amount, %(tolerance_base)s) -\n"
+                "     COALESCE(cur.rounding, %(company_rounding)s), false)\n")
+            currency_ids = [x or 0 for x in tolerances]
+            params.update(
+                tol_currency_ids=currency_ids,
+                tol_amounts=[tolerances[x or False] for x in currency_ids],
+                tolerance_base=tolerances[False],
+                company_rounding=self.env.user.company_id.currency_id.rounding,
+            )
+        sql = ("WITH levels AS (\n"
+               "  SELECT id, level,\n"
+               "         lag(level) OVER (ORDER BY level) AS previous_level\n"
+               "  FROM credit_control_policy_level\n"
+               "  WHERE policy_id = %(policy_id)s)\n"
+               "SELECT mv_line.id, levels.id\n"
+               " FROM account_move_line mv_line\n"
+               " LEFT JOIN credit_control_line_level cr_line\n"
+               " ON (cr_line.move_line_id = mv_line.id)\n"
+               + tolerance_join +
+               # lines from a previous level with a draft or ignored state
+               # or manually overridden
+               # have to be generated again for the previous level
+               " JOIN levels\n"
+               " ON ((levels.previous_level IS NULL\n"
+               "      AND cr_line.processed IS NOT TRUE)\n"
+               "     OR (levels.previous_level = cr_line.level\n"
+               "         AND cr_line.state != 'draft'))\n"
+               " WHERE mv_line.id = ANY(%(line_ids)s)\n"
+               " AND (mv_line.debit IS NOT NULL AND mv_line.debit != 0.0)\n"
+               " AND CASE levels.id" + "".join(boundaries) +
+               " ELSE false END\n"
+               + tolerance_where)
+        cr.execute(sql, params)
+        line_ids_by_level = {}
+        for line_id, level_id in cr.fetchall():
+            line_ids_by_level.setdefault(level_id, []).append(line_id)
+        return dict((level, move_line_obj.browse(line_ids_by_level[level.id]))
+                    for level in self.level_ids
+                    if level.id in line_ids_by_level)
+
+    @api.multi
+    def _select_move_lines(self, controlling_date, count_only=False):
+        """ Select the move lines to process for all the policies at once.
+
+        Same selection as ``_get_move_lines_to_process`` and
+        ``_lines_different_policy`` called on each policy, done in one
+        query: the policy of a move line is the one of its invoice, or
+        the one of its partner, or the one of the company of the user.
+        The security rules of the move lines are applied on the query.
+
+        :param str controlling_date: date of credit control
+        :param count_only: only count the lines (dry run)
+        :return: dict {policy record: (move lines to process,
+                                       move lines to handle manually)},
+                 the values are numbers of lines with ``count_only``
+        """
+        move_line_obj = self.env['account.move.line']
+        empty = (0, 0) if count_only else (move_line_obj.browse(),
+                                           move_line_obj.browse())
+        res = dict((policy, empty) for policy in self)
+        if not self.mapped('account_ids'):
+            return res
+        query = move_line_obj._where_calc(
+            self._move_lines_domain(controlling_date))
+        move_line_obj._apply_ir_rules(query, 'read')
+        from_clause, where_clause, where_params = query.get_sql()
+        accounts_column = self._columns['account_ids']
+        sql = ("WITH candidates AS (\n"
+               "  SELECT account_move_line.id FROM " + from_clause + "\n"
+               "  WHERE " + (where_clause or "true") + "),\n"
+               " policy_lines AS (\n"
+               "  SELECT mv_line.id, mv_line.account_id,\n"
+               "         COALESCE(inv.credit_policy_id,\n"
+               "                  CASE WHEN partner.active\n"
+               "                  THEN partner.credit_policy_id END,\n"
+               "                  %s) AS policy_id\n"
+               "  FROM candidates\n"
+               "  JOIN account_move_line mv_line\n"
+               "  ON (mv_line.id = candidates.id)\n"
+               "  JOIN res_partner partner\n"
+               "  ON (partner.id = mv_line.partner_id)\n"
+               "  LEFT JOIN account_invoice inv\n"
+               "  ON (inv.move_id = mv_line.move_id))\n"
+               "SELECT policy_lines.policy_id, policy_lines.id,\n"
+               "       EXISTS (SELECT id FROM credit_control_line\n"
+               "               WHERE move_line_id = policy_lines.id\n"
+               "               AND policy_id != policy_lines.policy_id\n"
+               "               AND manually_overridden IS false)\n"
+               "         AS manual\n"
+               " FROM policy_lines\n"
+               " JOIN " + accounts_column._rel + " policy_account\n"
+               " ON (policy_account." + accounts_column._id1 +
+               "     = policy_lines.policy_id\n"
+               "     AND policy_account." + accounts_column._id2 +
+               "     = policy_lines.account_id)\n"
+               " WHERE policy_lines.policy_id IN %s\n")
+        if count_only:
+            sql = ("SELECT policy_id,\n"
+                   "       SUM(CASE WHEN manual THEN 0 ELSE 1 END),\n"
+                   "       SUM(CASE WHEN manual THEN 1 ELSE 0 END)\n"
+                   " FROM (" + sql + ") lines\n"
+                   " GROUP BY policy_id")
+        company_policy = self.env.user.company_id.credit_policy_id
+        self.env.cr.execute(sql, where_params + [company_policy.id or None,
+                                                 tuple(self.ids)])
+        rows = self.env.cr.fetchall()
+        if count_only:
+            for policy_id, lines_count, manual_count in rows:
+                res[self.browse(policy_id)] = (lines_count, manual_count)
+            return res
+        line_ids = dict((policy_id, ([], [])) for policy_id in self.ids)
+        for policy_id, line_id, manual in rows:
+            line_ids[policy_id][manual].append(line_id)
+        for policy in self:
+            lines, manual_lines = line_ids[policy.id]
+            res[policy] = (move_line_obj.browse(lines),
+                           move_line_obj.browse(manual_lines))
+        return res
+
     @api.multi
     def check_policy_against_account(self, account):
         """ Ensure that the policy corresponds to account relation """
@@ -325,15 +534,13 @@ class CreditControlPolicyLevel(models.Model):
         cr = self.env.cr
         sql = ("SELECT DISTINCT mv_line.id\n"
                " FROM account_move_line mv_line\n"
+               " LEFT JOIN credit_control_line_level cr_line\n"
+               " ON (cr_line.move_line_id = mv_line.id)\n"
                " WHERE mv_line.id in %(line_ids)s\n"
-               " AND NOT EXISTS (SELECT id\n"
-               "                 FROM credit_control_line\n"
-               "                 WHERE move_line_id = mv_line.id\n"
                # lines from a previous level with a draft or ignored state
                # or manually overridden
                # have to be generated again for the previous level
-               "                 AND NOT manually_overridden\n"
-               "                 AND state NOT IN ('draft', 'ignored'))"
+               " AND cr_line.processed IS NOT TRUE\n"
                " AND (mv_line.debit IS NOT NULL AND mv_line.debit != 0.0)\n")
         sql += " AND"
         _get_sql_date_part = self._get_sql_date_boundary_for_computation_mode
@@ -357,22 +564,17 @@ class CreditControlPolicyLevel(models.Model):
         if not lines:
             return move_line_obj.browse()
         cr = self.env.cr
+        # the level table holds the latest credit line of each move line
+        # which is not ignored nor manually overridden
         sql = ("SELECT mv_line.id\n"
                " FROM account_move_line mv_line\n"
-               " JOIN credit_control_line cr_line\n"
+               " JOIN credit_control_line_level cr_line\n"
                " ON (mv_line.id = cr_line.move_line_id)\n"
-               " WHERE cr_line.id = (SELECT credit_control_line.id "
-               " FROM credit_control_line\n"
-               "      WHERE credit_control_line.move_line_id = mv_line.id\n"
-               "      AND state != 'ignored'"
-               "      AND NOT manually_overridden"
-               "      ORDER BY credit_control_line.level desc limit 1)\n"
-               " AND cr_line.level = %(previous_level)s\n"
+               " WHERE cr_line.level = %(previous_level)s\n"
                " AND (mv_line.debit IS NOT NULL AND mv_line.debit != 0.0)\n"
                # lines from a previous level with a draft or ignored state
                # or manually overridden
                # have to be generated again for the previous level
-               " AND NOT manually_overridden\n"
                " AND cr_line.state NOT IN ('draft', 'ignored')\n"
                " AND mv_line.id in %(line_ids)s\n")
         sql += " AND "
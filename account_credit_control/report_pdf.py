@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+from openerp import models, api
+
+
+class Report(models.Model):
+    """ Use the letters already rendered by the credit control emailer """
+
+    _inherit = 'report'
+
+    @api.v7
+    def get_pdf(self, cr, uid, ids, report_name, html=None, data=None,
+                context=None):
+        context = context or {}
+        rendered = context.get('credit_control_rendered_pdfs')
+        if (rendered and html is None and data is None and
+                len(ids) == 1 and
+                report_name == 'account_credit_control.'
+                               'report_credit_control_summary'):
+            # the letters are rendered in the language of the email
+            # template, which is in the context
+            pdf = rendered.get((ids[0], context.get('lang')))
+            if pdf is not None:
+                return pdf
+        return super(Report, self).get_pdf(cr, uid, ids, report_name,
+                                           html=html, data=data,
+                                           context=context)
+
+    @api.v8
+    def get_pdf(self, records, report_name, html=None, data=None):
+        return self._model.get_pdf(self._cr, self._uid, records.ids,
+                                   report_name, html=html, data=data,
+                                   context=self._context)
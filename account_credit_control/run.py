@@ -18,12 +18,17 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import json
 import logging
+import time
 
 from openerp import models, fields, api, _
 
 logger = logging.getLogger('credit.control.run')
 
+# number of consecutive failures after which a background run is stopped
+RUN_MAX_ATTEMPTS = 3
+
 
 class CreditControlRun(models.Model):
     """ Credit Control run generate all credit control lines and reject """
@@ -51,6 +56,8 @@ class CreditControlRun(models.Model):
     )
     report = fields.Html(string='Report', readonly=True, copy=False)
     state = fields.Selection([('draft', 'Draft'),
+                              ('running', 'Running'),
+                              ('error', 'Error'),
                               ('done', 'Done')],
                              string='State',
                              required=True,
@@ -73,6 +80,52 @@ class CreditControlRun(models.Model):
         readonly=True,
         copy=False,
     )
+    partition_size = fields.Integer(
+        string='Partners per Partition',
+        required=True,
+        readonly=True,
+        states={'draft': [('readonly', False)]},
+        default=1000,
+        help='When computed in background, the partners are processed '
+             'by partitions of this size, each partition being '
+             'committed separately.',
+    )
+    partner_count = fields.Integer(string='Partners to Process',
+                                   readonly=True, copy=False)
+    partner_done = fields.Integer(string='Processed Partners',
+                                  readonly=True, copy=False)
+    last_partner_id = fields.Integer(
+        string='Last Processed Partner',
+        readonly=True,
+        copy=False,
+        help='Checkpoint of a background run: the partners up to this '
+             'id are processed.',
+    )
+    attempts = fields.Integer(
+        string='Failed Attempts',
+        readonly=True,
+        copy=False,
+        help='Number of consecutive failures of a background run. The run '
+             'is set in error after %d failures.' % RUN_MAX_ATTEMPTS,
+    )
+    progress = fields.Float(string='Progress',
+                            compute='_compute_progress')
+    policy_stats = fields.Text(
+        string='Policy Statistics',
+        readonly=True,
+        copy=False,
+        help='Generated lines and computation time per policy (JSON)',
+    )
+
+    @api.one
+    @api.depends('partner_count', 'partner_done', 'state')
+    def _compute_progress(self):
+        if self.state == 'done':
+            self.progress = 100.0
+        elif self.partner_count:
+            self.progress = 100.0 * self.partner_done / self.partner_count
+        else:
+            self.progress = 0.0
 
     @api.multi
     def _check_run_date(self, controlling_date):
@@ -94,63 +147,117 @@ class CreditControlRun(models.Model):
                                 'recent than %s exists at %s') %
                               (controlling_date, lines.date))
 
+    @api.multi
+    def _get_policy_stats(self):
+        """ Return the statistics of the policies processed so far
+
+        :return: dict {policy id (str): {'lines': int, 'time': float}}
+        """
+        self.ensure_one()
+        if not self.policy_stats:
+            return {}
+        return json.loads(self.policy_stats)
+
+    @api.multi
+    def _build_report(self):
+        """ Build the HTML report of the run from its statistics """
+        self.ensure_one()
+        stats = self._get_policy_stats()
+        report = ''
+        if self.state in ('running', 'error'):
+            report += (_("Processed <b>%d</b> of <b>%d</b> partners "
+                         "(%.0f%%).<br/>") %
+                       (self.partner_done, self.partner_count, self.progress))
+        if 'selection' in stats:
+            report += (_("Move lines selected in %.2f seconds.<br/>") %
+                       stats['selection'])
+        for policy in self.policy_ids:
+            if policy.do_nothing:
+                continue
+            policy_stats = stats.get(str(policy.id),
+                                     {'lines': 0, 'time': 0.0})
+            if policy_stats['lines']:
+                report += (_("Policy \"<b>%s</b>\" has generated <b>%d Credit "
+                             "Control Lines.</b><br/>") %
+                           (policy.name, policy_stats['lines']))
+            else:
+                report += _(
+                    "Policy \"<b>%s</b>\" has not generated any "
+                    "Credit Control Lines.<br/>" % policy.name
+                )
+            report += (_("Policy \"<b>%s</b>\" computed in %.2f "
+                         "seconds.<br/>") %
+                       (policy.name, policy_stats['time']))
+        return report
+
     @api.multi
     @api.returns('credit.control.line')
     def _generate_credit_lines(self):
-        """ Generate credit control lines. """
+        """ Generate credit control lines.
+
+        When the context contains a ``credit_control_partner_range``
+        (first partner id, last partner id), only the move lines of
+        the partners in this range are processed.
+
+        The generated lines, the lines to handle manually and the
+        statistics of the policies are added to the run.
+        """
         self.ensure_one()
         cr_line_obj = self.env['credit.control.line']
         move_line_obj = self.env['account.move.line']
         manually_managed_lines = move_line_obj.browse()
-        self._check_run_date(self.date)
 
         policies = self.policy_ids
         if not policies:
             raise api.Warning(_('Please select a policy'))
 
-        report = ''
+        stats = self._get_policy_stats()
+        tolerances = cr_line_obj._get_tolerances(self.date)
         generated = cr_line_obj.browse()
+        start = time.time()
+        selection = policies.filtered(
+            lambda p: not p.do_nothing)._select_move_lines(self.date)
+        stats['selection'] = (stats.get('selection', 0.0) +
+                              time.time() - start)
         for policy in policies:
             if policy.do_nothing:
                 continue
-            lines = policy._get_move_lines_to_process(self.date)
-            manual_lines = policy._lines_different_policy(lines)
-            lines -= manual_lines
+            start = time.time()
+            lines, manual_lines = selection[policy]
             manually_managed_lines |= manual_lines
             policy_lines_generated = cr_line_obj.browse()
             if lines:
                 # policy levels are sorted by level
                 # so iteration is in the correct order
                 create = cr_line_obj.create_or_update_from_mv_lines
+                lines_by_level = policy._classify_move_lines(
+                    self.date, lines, tolerances=tolerances)
                 for level in reversed(policy.level_ids):
-                    level_lines = level.get_level_lines(self.date, lines)
+                    level_lines = lines_by_level.get(level)
+                    if not level_lines:
+                        continue
                     policy_lines_generated += create(level_lines,
                                                      level,
-                                                     self.date)
+                                                     self.date,
+                                                     tolerances=tolerances)
             generated |= policy_lines_generated
-            if policy_lines_generated:
-                report += (_("Policy \"<b>%s</b>\" has generated <b>%d Credit "
-                             "Control Lines.</b><br/>") %
-                            (policy.name, len(policy_lines_generated)))
-            else:
-                report += _(
-                    "Policy \"<b>%s</b>\" has not generated any "
-                    "Credit Control Lines.<br/>" % policy.name
-                )
+            policy_stats = stats.setdefault(str(policy.id),
+                                            {'lines': 0, 'time': 0.0})
+            policy_stats['lines'] += len(policy_lines_generated)
+            policy_stats['time'] += time.time() - start
 
-        vals = {'state': 'done',
-                'report': report,
-                'manual_ids': [(6, 0, manually_managed_lines.ids)],
-                'line_ids': [(6, 0, generated.ids)]}
+        if generated:
+            generated.write({'run_id': self.id})
+        vals = {'policy_stats': json.dumps(stats),
+                'manual_ids': [(4, line_id)
+                               for line_id in manually_managed_lines.ids]}
         self.write(vals)
         return generated
 
     @api.multi
-    def generate_credit_lines(self):
-        """ Generate credit control lines
-
-        Lock the ``credit_control_run`` Postgres table to avoid concurrent
-        calls of this method.
+    def _lock_runs(self):
+        """ Lock the ``credit_control_run`` Postgres table to avoid
+        concurrent generations of credit lines.
         """
         try:
             self.env.cr.execute('SELECT id FROM credit_control_run'
@@ -161,7 +268,189 @@ class CreditControlRun(models.Model):
             raise api.Warning(_('A credit control run is already running'
                                 ' in background, please try later.'))
 
+    @api.multi
+    def _get_partners_to_process(self, limit=None):
+        """ Return the ids of the partners having due move lines on the
+        accounts of the policies of the run, after the checkpoint.
+
+        :param limit: maximum number of partners to return
+        :return: list of partner ids sorted by id
+        """
+        self.ensure_one()
+        policies = self.policy_ids.filtered(lambda p: not p.do_nothing)
+        if not policies.mapped('account_ids'):
+            return []
+        sql = ("SELECT DISTINCT partner_id FROM account_move_line\n"
+               " WHERE account_id IN %s\n"
+               " AND date_maturity <= %s\n"
+               " AND reconcile_id IS NULL\n"
+               " AND partner_id > %s\n"
+               " ORDER BY partner_id\n")
+        params = [tuple(policies.mapped('account_ids').ids),
+                  self.date,
+                  self.last_partner_id]
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        self.env.cr.execute(sql, params)
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.multi
+    def _finish_run(self):
+        self.ensure_one()
+        self.write({'state': 'done'})
+        self.write({'report': self._build_report()})
+
+    @api.multi
+    def _run_partitions(self, commit=True):
+        """ Generate the credit lines of a background run, partition by
+        partition.
+
+        Each partition is committed with its checkpoint, so an interrupted
+        run resumes after the last committed partition.
+
+        :param commit: commit the partitions, disabled in tests
+        """
+        self.ensure_one()
+        cr = self.env.cr
+        while True:
+            self._lock_runs()
+            partner_ids = self._get_partners_to_process(
+                limit=self.partition_size)
+            if not partner_ids:
+                break
+            partner_range = (partner_ids[0], partner_ids[-1])
+            run = self.with_context(credit_control_partner_range=partner_range)
+            run._generate_credit_lines()
+            self.write({'last_partner_id': partner_ids[-1],
+                        'partner_done': self.partner_done + len(partner_ids),
+                        'attempts': 0})
+            self.write({'report': self._build_report()})
+            if commit:
+                cr.commit()
+            # keep the memory flat on large runs
+            self.env.invalidate_all()
+            logger.info('Credit control run %s: %d/%d partners processed',
+                        self.id, self.partner_done, self.partner_count)
+        self._finish_run()
+        if commit:
+            cr.commit()
+
+    @api.multi
+    def _process_background_run(self, commit=True):
+        """ Process a background run and record its failure if any.
+
+        On failure, the pending partition is rolled back and the run is
+        resumed from its last checkpoint at the next call, until it fails
+        ``RUN_MAX_ATTEMPTS`` times in a row: it is then set in error.
+
+        :param commit: commit the partitions and the failure, disabled
+                       in tests where a savepoint is used instead
+        """
+        self.ensure_one()
+        cr = self.env.cr
+        if not commit:
+            cr.execute('SAVEPOINT credit_control_run')
+        try:
+            self._run_partitions(commit=commit)
+        except Exception as exc:
+            if commit:
+                cr.rollback()
+            else:
+                cr.execute('ROLLBACK TO SAVEPOINT credit_control_run')
+            # the cache still holds the values of the rolled back partition
+            self.env.invalidate_all()
+            logger.exception('Credit control run %s failed', self.id)
+            attempts = self.attempts + 1
+            vals = {'attempts': attempts}
+            if attempts >= RUN_MAX_ATTEMPTS:
+                vals['state'] = 'error'
+            self.write(vals)
+            report = self._build_report()
+            report += _("<br/>Interrupted: %s") % exc
+            if self.state == 'error':
+                report += (_("<br/>The run has been stopped after %d "
+                             "failed attempts.") % attempts)
+            self.write({'report': report})
+            if commit:
+                cr.commit()
+            return False
+        return True
+
+    @api.model
+    def run_background_runs(self):
+        """ Process the runs launched in background. Called by a cron.
+
+        A run interrupted by a restart or an error is resumed from its
+        last checkpoint at the next call.
+        """
+        for run in self.search([('state', '=', 'running')], order='id'):
+            run._process_background_run()
+        return True
+
+    @api.multi
+    def generate_credit_lines(self):
+        """ Generate credit control lines
+
+        Lock the ``credit_control_run`` Postgres table to avoid concurrent
+        calls of this method.
+        """
+        self._lock_runs()
+        self._check_run_date(self.date)
         self._generate_credit_lines()
+        self._finish_run()
+        return True
+
+    @api.multi
+    def generate_credit_lines_background(self):
+        """ Launch the generation of the credit control lines in
+        background. The run is processed by the scheduler, partitioned
+        by partners.
+        """
+        self.ensure_one()
+        self._lock_runs()
+        if not self.policy_ids:
+            raise api.Warning(_('Please select a policy'))
+        self._check_run_date(self.date)
+        if self.search([('state', '=', 'running')]):
+            raise api.Warning(_('A credit control run is already running'
+                                ' in background, please try later.'))
+        self.write({'state': 'running',
+                    'partner_count': len(self._get_partners_to_process()),
+                    'partner_done': 0,
+                    'last_partner_id': 0,
+                    'attempts': 0})
+        self.write({'report': self._build_report()})
+        return True
+
+    @api.multi
+    def resume_background_run(self):
+        """ Resume a background run set in error from its last
+        checkpoint.
+        """
+        self.ensure_one()
+        self.write({'state': 'running', 'attempts': 0})
+        self.write({'report': self._build_report()})
+        return True
+
+    @api.multi
+    def dry_run_credit_lines(self):
+        """ Count the move lines the run would process, without
+        generating anything. The counts are written in the report.
+        """
+        self.ensure_one()
+        policies = self.policy_ids.filtered(lambda p: not p.do_nothing)
+        if not policies:
+            raise api.Warning(_('Please select a policy'))
+        counts = policies._select_move_lines(self.date, count_only=True)
+        report = _("<b>Dry run</b>, no credit line has been "
+                   "generated.<br/>")
+        for policy in policies:
+            lines_count, manual_count = counts[policy]
+            report += (_("Policy \"<b>%s</b>\" would process <b>%d</b> "
+                         "move lines, <b>%d</b> to handle manually.<br/>") %
+                       (policy.name, lines_count, manual_count))
+        self.write({'report': report})
         return True
 
     @api.multi
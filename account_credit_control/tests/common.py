@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+from datetime import date, timedelta
+
+from openerp import fields
+from openerp.tests import common
+
+
+class CreditControlTestCase(common.TransactionCase):
+    """ Base of the tests running the 3 time policy on partners having
+    move lines due on its receivable account
+    """
+
+    def setUp(self):
+        super(CreditControlTestCase, self).setUp()
+        self.policy = self.browse_ref(
+            'account_credit_control.credit_control_3_time')
+        self.account = self.browse_ref('account_credit_control.a_recv_1')
+        self.policy.account_ids = self.account
+        self.today = fields.Date.today()
+
+    def _create_due_partners(self, vals_list):
+        """ Create partners having each a move line due for 60 days
+
+        :param vals_list: list of dicts of values of the partners
+        :returns: recordset of the created partners
+        """
+        journal = self.browse_ref('account.sales_journal')
+        income = self.browse_ref('account.a_sale')
+        period = self.env['account.period'].find(self.today)
+        maturity = fields.Date.to_string(date.today() - timedelta(days=60))
+        partner_obj = self.env['res.partner']
+        partners = partner_obj.browse()
+        for vals in vals_list:
+            partner = partner_obj.create(vals)
+            self.env['account.move'].create({
+                'journal_id': journal.id,
+                'period_id': period.id,
+                'date': self.today,
+                'line_id': [
+                    (0, 0, {'name': 'Due', 'account_id': self.account.id,
+                            'partner_id': partner.id, 'debit': 100.0,
+                            'date_maturity': maturity}),
+                    (0, 0, {'name': 'Sale', 'account_id': income.id,
+                            'partner_id': partner.id, 'credit': 100.0}),
+                ],
+            })
+            partners |= partner
+        return partners
+
+    def _create_run(self, **vals):
+        """ Create a run of the 3 time policy at the current date """
+        vals.update(date=self.today, policy_ids=[(6, 0, self.policy.ids)])
+        return self.env['credit.control.run'].create(vals)
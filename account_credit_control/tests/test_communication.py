@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+import base64
+import zipfile
+from cStringIO import StringIO
+
+from pyPdf import PdfFileWriter, PdfFileReader
+
+from .common import CreditControlTestCase
+
+REPORT_NAME = 'account_credit_control.report_credit_control_summary'
+
+
+class TestCommunication(CreditControlTestCase):
+
+    def setUp(self):
+        super(TestCommunication, self).setUp()
+        self.env['res.lang'].load_lang('fr_FR')
+        self.partners = self._create_due_partners([
+            {'name': name, 'lang': lang, 'email': 'debtor@example.com'}
+            for name, lang in (('Debtor EN', 'en_US'),
+                               ('Debtor FR', 'fr_FR'))])
+        run = self._create_run()
+        run.generate_credit_lines()
+        self.lines = run.line_ids
+        self.assertEqual(self.lines.mapped('partner_id'), self.partners)
+        comm_obj = self.env['credit.control.communication']
+        self.comms = comm_obj._generate_comm_from_credit_lines(self.lines)
+
+        # wkhtmltopdf is replaced by a one page document
+        writer = PdfFileWriter()
+        writer.addBlankPage(100, 100)
+        output = StringIO()
+        writer.write(output)
+        fake_pdf = output.getvalue()
+        self.fake_pdf = fake_pdf
+        conversions = self.conversions = []
+
+        def _run_wkhtmltopdf(self, cr, uid, *args, **kwargs):
+            conversions.append(args)
+            return fake_pdf
+
+        report_model = self.env['report']
+        report_model._patch_method('_run_wkhtmltopdf', _run_wkhtmltopdf)
+        self.addCleanup(report_model._revert_method, '_run_wkhtmltopdf')
+
+    def _comm(self, partner):
+        return self.comms.filtered(lambda comm: comm.partner_id == partner)
+
+    def test_report_langs(self):
+        """ The letters are rendered in the language of the template """
+        langs = self.comms._get_report_langs()
+        self.assertEqual(langs[self._comm(self.partners[0]).id], 'en_US')
+        self.assertEqual(langs[self._comm(self.partners[1]).id], 'fr_FR')
+
+    def test_rendered_pdf_lang(self):
+        """ A pre-rendered letter is only used in its language """
+        comm = self._comm(self.partners[1])
+        report_obj = self.env['report'].with_context(
+            credit_control_rendered_pdfs={(comm.id, 'fr_FR'): 'rendered'})
+        pdf = report_obj.with_context(lang='fr_FR').get_pdf(comm, REPORT_NAME)
+        self.assertEqual(pdf, 'rendered')
+        self.assertFalse(self.conversions)
+        pdf = report_obj.with_context(lang='en_US').get_pdf(comm, REPORT_NAME)
+        self.assertEqual(pdf, self.fake_pdf)
+        self.assertEqual(len(self.conversions), 1)
+
+    def test_generate_emails_parallel(self):
+        """ The emails attach the letters rendered in parallel """
+        emails = self.comms._generate_emails(workers=2)
+        self.assertEqual(len(emails), len(self.comms))
+        # each letter is converted once, before the emails
+        self.assertEqual(len(self.conversions), len(self.comms))
+        for email in emails:
+            self.assertEqual(len(email.attachment_ids), 1)
+            self.assertEqual(
+                base64.b64decode(email.attachment_ids.datas), self.fake_pdf)
+        self.assertEqual(set(self.lines.mapped('state')), set(['sent']))
+        self.assertEqual(self.lines.mapped('mail_message_id'), emails)
+
+    def _print(self, output):
+        printer = self.env['credit.control.printer'].create({
+            'line_ids': [(6, 0, self.lines.ids)],
+            'output': output,
+            'workers': 2,
+        })
+        printer.print_lines()
+        self.assertEqual(printer.state, 'done')
+        return printer
+
+    def test_print_zip(self):
+        """ The zip archive contains one letter per partner """
+        printer = self._print('zip')
+        self.assertEqual(printer.filename, 'credit_control_letters.zip')
+        data = StringIO(base64.b64decode(printer.data))
+        with zipfile.ZipFile(data) as archive:
+            names = archive.namelist()
+            self.assertEqual(
+                sorted(names),
+                ['Debtor_EN_%s.pdf' % self.partners[0].id,
+                 'Debtor_FR_%s.pdf' % self.partners[1].id])
+            for name in names:
+                self.assertEqual(archive.read(name), self.fake_pdf)
+        self.assertEqual(set(self.lines.mapped('state')), set(['sent']))
+
+    def test_print_merged_pdf(self):
+        """ The merged PDF contains the letters of all the partners """
+        printer = self._print('pdf')
+        self.assertEqual(printer.filename, 'credit_control_letters.pdf')
+        reader = PdfFileReader(StringIO(base64.b64decode(printer.data)))
+        self.assertEqual(reader.getNumPages(), len(self.partners))
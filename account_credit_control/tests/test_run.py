@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+from ..run import RUN_MAX_ATTEMPTS
+from .common import CreditControlTestCase
+
+
+class TestBackgroundRun(CreditControlTestCase):
+
+    def setUp(self):
+        super(TestBackgroundRun, self).setUp()
+        self.partners = self._create_due_partners(
+            [{'name': name} for name in ('Debtor 1', 'Debtor 2', 'Debtor 3')])
+        self.run = self._create_run(partition_size=1)
+
+    def test_resume_from_checkpoint(self):
+        """ A background run resumes after its last processed partner """
+        self.run.generate_credit_lines_background()
+        self.assertEqual(self.run.state, 'running')
+        self.assertEqual(self.run.partner_count, 3)
+        # simulate a run interrupted after its first partition
+        self.run.write({'last_partner_id': self.partners[0].id,
+                        'partner_done': 1})
+        self.assertTrue(self.run._process_background_run(commit=False))
+        self.assertEqual(self.run.state, 'done')
+        self.assertEqual(self.run.partner_done, 3)
+        self.assertEqual(self.run.last_partner_id, self.partners[2].id)
+        self.assertEqual(self.run.line_ids.mapped('partner_id'),
+                         self.partners[1:])
+
+    def test_error_rolls_back_partition(self):
+        """ A failing run is rolled back and set in error after
+        several failures
+        """
+        run_model = self.env['credit.control.run']
+        failing_partner = self.partners[1]
+
+        def _generate_credit_lines(self):
+            partner_range = self.env.context['credit_control_partner_range']
+            if partner_range[0] == failing_partner.id:
+                raise Exception('Failing partner')
+            return _generate_credit_lines.origin(self)
+
+        run_model._patch_method('_generate_credit_lines',
+                                _generate_credit_lines)
+        try:
+            self.run.generate_credit_lines_background()
+            for attempt in range(1, RUN_MAX_ATTEMPTS + 1):
+                self.assertEqual(self.run.state, 'running')
+                self.assertFalse(
+                    self.run._process_background_run(commit=False))
+                self.assertEqual(self.run.attempts, attempt)
+                # nothing is committed in tests: the first partition is
+                # rolled back with the failing one and must not be reported
+                self.assertEqual(self.run.partner_done, 0)
+                self.assertFalse(self.run.line_ids)
+                self.assertIn('Processed <b>0</b> of <b>3</b>',
+                              self.run.report)
+                self.assertIn('Failing partner', self.run.report)
+        finally:
+            run_model._revert_method('_generate_credit_lines')
+        self.assertEqual(self.run.state, 'error')
+
+        self.run.resume_background_run()
+        self.assertEqual(self.run.state, 'running')
+        self.assertEqual(self.run.attempts, 0)
+        self.assertTrue(self.run._process_background_run(commit=False))
+        self.assertEqual(self.run.state, 'done')
+        self.assertEqual(self.run.partner_done, 3)
+        self.assertEqual(self.run.line_ids.mapped('partner_id'),
+                         self.partners)
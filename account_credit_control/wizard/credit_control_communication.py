@@ -19,10 +19,40 @@
 #
 ##############################################################################
 import logging
+from multiprocessing.pool import ThreadPool
+
+import openerp
 from openerp import models, fields, api
 
+from ..line import prepare_bulk_insert
+
 logger = logging.getLogger('credit.control.line.mailing')
 
+# number of communications inserted per INSERT statement
+COMMUNICATION_INSERT_CHUNK = 1000
+# number of communications emailed per batch in parallel mode
+EMAIL_BATCH_SIZE = 100
+# number of PDF conversions submitted per worker at once
+RENDER_JOBS_PER_WORKER = 4
+
+REPORT_NAME = 'account_credit_control.report_credit_control_summary'
+
+
+def _render_pdf(job):
+    """ Convert a rendered HTML report to PDF with a new cursor.
+
+    Run in the threads of the rendering pool: the HTML is already
+    rendered, so the records of the report do not have to be visible
+    from the new cursor.
+    """
+    dbname, uid, context, report_name, html = job
+    with api.Environment.manage():
+        with openerp.registry(dbname).cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            comm_obj = env['credit.control.communication']
+            return env['report'].get_pdf(comm_obj.browse(), report_name,
+                                         html=html)
+
 
 class CreditCommunication(models.TransientModel):
     """Shell class used to provide a base model to email template and reporting
@@ -133,49 +163,228 @@ class CreditCommunication(models.TransientModel):
                                        ('currency_id', '=', currency_id)])
         return cr_lines
 
+    @api.model
+    def _create_bulk(self, vals_list):
+        """ Create communications with one multi-row INSERT per chunk,
+        their credit lines being linked with one INSERT per chunk.
+
+        The values must only contain plain columns and the
+        ``credit_control_line_ids`` field as a ``(6, 0, ids)`` command.
+        Otherwise the communications are created with the ORM.
+
+        :param vals_list: list of dicts of values of communications
+        :returns: recordset of created communications
+        """
+        if not vals_list:
+            return self.browse()
+        contacts = {}
+        vals_list = [dict(vals) for vals in vals_list]
+        for vals in vals_list:
+            partner_id = vals.get('partner_id')
+            if partner_id and 'contact_address' not in vals:
+                # same as create()
+                if partner_id not in contacts:
+                    contact = self._get_contact_address(partner_id)
+                    contacts[partner_id] = contact.id
+                vals['contact_address'] = contacts[partner_id]
+        line_commands = [vals.pop('credit_control_line_ids', None) or
+                         [(6, 0, [])]
+                         for vals in vals_list]
+        prepared = prepare_bulk_insert(self, vals_list)
+        if prepared is None or \
+                not all(len(x) == 1 and x[0][0] == 6 for x in line_commands):
+            comms = self.browse()
+            for vals, commands in zip(vals_list, line_commands):
+                comms += self.create(dict(vals,
+                                          credit_control_line_ids=commands))
+            return comms
+
+        cr = self.env.cr
+        names, placeholders, rows = prepared
+        lines_column = self._columns['credit_control_line_ids']
+        row_sql = ("(%s, %s, (now() at time zone 'UTC'), "
+                   "%s, (now() at time zone 'UTC'), " + placeholders + ")")
+        comm_ids = []
+        for i in xrange(0, len(rows), COMMUNICATION_INSERT_CHUNK):
+            chunk = rows[i:i + COMMUNICATION_INSERT_CHUNK]
+            # reserve the ids to know which credit lines go with
+            # which communication
+            cr.execute("SELECT nextval(%s) FROM generate_series(1, %s)",
+                       (self._sequence, len(chunk)))
+            chunk_ids = [row[0] for row in cr.fetchall()]
+            params = []
+            rel_comm_ids = []
+            rel_line_ids = []
+            for comm_id, row, commands in zip(chunk_ids, chunk,
+                                              line_commands[i:]):
+                params += [comm_id, self.env.uid, self.env.uid] + row
+                line_ids = commands[0][2]
+                rel_comm_ids += [comm_id] * len(line_ids)
+                rel_line_ids += line_ids
+            cr.execute(
+                "INSERT INTO " + self._table + " "
+                "(id, create_uid, create_date, write_uid, write_date, " +
+                ', '.join(names) + ") VALUES " +
+                ', '.join([row_sql] * len(chunk)),
+                params)
+            if rel_comm_ids:
+                cr.execute(
+                    "INSERT INTO " + lines_column._rel +
+                    " (" + lines_column._id1 + ", " + lines_column._id2 + ")"
+                    " SELECT unnest(%s::int[]), unnest(%s::int[])",
+                    (rel_comm_ids, rel_line_ids))
+            comm_ids += chunk_ids
+        return self.browse(comm_ids)
+
     @api.model
     def _generate_comm_from_credit_lines(self, lines):
         """ Aggregate credit control line by partner, level, and currency
         It also generate a communication object per aggregation.
+
+        The groups and their credit lines are fetched with one query and
+        the communications are created in bulk.
         """
         comms = self.browse()
         if not lines:
             return comms
         sql = (
-            "SELECT distinct partner_id, policy_level_id, "
+            "SELECT partner_id, policy_level_id, "
             " credit_control_line.currency_id, "
-            " credit_control_policy_level.level"
+            " array_agg(credit_control_line.id "
+            "           ORDER BY credit_control_line.id) AS line_ids"
             " FROM credit_control_line JOIN credit_control_policy_level "
             "   ON (credit_control_line.policy_level_id = "
             "       credit_control_policy_level.id)"
-            " WHERE credit_control_line.id in %s"
+            " WHERE credit_control_line.id = ANY(%s)"
+            " GROUP BY partner_id, policy_level_id, "
+            "          credit_control_line.currency_id, "
+            "          credit_control_policy_level.level"
             " ORDER by credit_control_policy_level.level, "
             "          credit_control_line.currency_id"
         )
         cr = self.env.cr
-        cr.execute(sql, (tuple(lines.ids), ))
+        cr.execute(sql, (lines.ids, ))
         res = cr.dictfetchall()
         company_currency = self.env.user.company_id.currency_id
+        vals_list = []
         for group in res:
             data = {}
-            level_lines = self._get_credit_lines(lines.ids,
-                                                 group['partner_id'],
-                                                 group['policy_level_id'],
-                                                 group['currency_id']
-                                                 )
-
-            data['credit_control_line_ids'] = [(6, 0, level_lines.ids)]
+            data['credit_control_line_ids'] = [(6, 0, group['line_ids'])]
             data['partner_id'] = group['partner_id']
             data['current_policy_level'] = group['policy_level_id']
             data['currency_id'] = group['currency_id'] or company_currency.id
-            comm = self.create(data)
-            comms += comm
-        return comms
+            vals_list.append(data)
+        return self._create_bulk(vals_list)
+
+    @api.multi
+    def _get_report_langs(self):
+        """ Return the language in which ``email.template`` renders the
+        letter attached to the email of each communication: the language
+        computed by the template, or the one of the context.
+
+        :return: dict {communication id: language code}
+        """
+        # Warning: old-api on 'email.template', see _generate_emails
+        email_template_obj = self.pool['email.template']
+        cr, uid, context = self.env.cr, self.env.uid, self.env.context
+        comm_ids_by_template = {}
+        for comm in self:
+            template = comm.current_policy_level.email_template_id
+            comm_ids_by_template.setdefault(template, []).append(comm.id)
+        langs = {}
+        for template, comm_ids in comm_ids_by_template.iteritems():
+            if template.lang:
+                langs.update(email_template_obj.render_template_batch(
+                    cr, uid, template.lang, template.model, comm_ids,
+                    context=context))
+            else:
+                langs.update(dict.fromkeys(comm_ids, context.get('lang')))
+        return langs
+
+    @api.model
+    def _iter_rendered_pdfs(self, groups, workers=1, langs=None):
+        """ Render the letters of groups of communications.
+
+        The HTML is rendered with the current cursor, the conversions
+        to PDF, each running a wkhtmltopdf process, are done in a pool of
+        ``workers`` threads. The groups are processed by batches so the
+        memory stays bounded.
+
+        :param groups: list of recordsets of communications
+        :param workers: number of PDF conversions running at once
+        :param langs: dict {communication id: language code}, a group is
+                      rendered in the language of its first communication,
+                      in the language of the context otherwise
+        :return: iterator of (communications, PDF data)
+        """
+        langs = langs or {}
+
+        def report_context(comms):
+            context = dict(self.env.context)
+            if comms and comms[0].id in langs:
+                context['lang'] = langs[comms[0].id]
+            return context
+
+        report_obj = self.env['report']
+        workers = max(workers, 1)
+        if workers == 1:
+            for comms in groups:
+                report = report_obj.with_context(report_context(comms))
+                yield comms, report.get_pdf(comms, REPORT_NAME)
+            return
+        pool = ThreadPool(workers)
+        try:
+            batch_size = workers * RENDER_JOBS_PER_WORKER
+            for i in xrange(0, len(groups), batch_size):
+                batch = groups[i:i + batch_size]
+                jobs = []
+                for comms in batch:
+                    context = report_context(comms)
+                    html = report_obj.with_context(context).get_html(
+                        comms, REPORT_NAME)
+                    jobs.append((self.env.cr.dbname, self.env.uid, context,
+                                 REPORT_NAME, html))
+                for comms, pdf in zip(batch, pool.map(_render_pdf, jobs)):
+                    yield comms, pdf
+        finally:
+            pool.close()
+            pool.join()
+
+    @api.multi
+    @api.returns('mail.mail')
+    def _generate_emails_parallel(self, workers):
+        """ Generate the emails by batches, the letters attached to the
+        emails being rendered in parallel beforehand, in the language
+        used by their email template.
+        """
+        emails = self.env['mail.mail'].browse()
+        for i in xrange(0, len(self), EMAIL_BATCH_SIZE):
+            batch = self[i:i + EMAIL_BATCH_SIZE]
+            to_render = [comm for comm in batch
+                         if comm.current_policy_level.email_template_id.
+                         report_template.report_name == REPORT_NAME]
+            langs = batch._get_report_langs()
+            rendered = dict(((comms.id, langs[comms.id]), pdf)
+                            for comms, pdf in
+                            self._iter_rendered_pdfs(to_render,
+                                                     workers=workers,
+                                                     langs=langs))
+            batch = batch.with_context(credit_control_rendered_pdfs=rendered)
+            emails += batch._generate_emails()
+            # keep the memory flat on large waves
+            self.env.invalidate_all()
+        return emails
 
     @api.multi
     @api.returns('mail.mail')
-    def _generate_emails(self):
-        """ Generate email message using template related to level """
+    def _generate_emails(self, workers=1):
+        """ Generate email message using template related to level
+
+        :param workers: with more than one worker, the attached letters
+                        are rendered in parallel, by batches
+        """
+        if workers > 1:
+            return self._generate_emails_parallel(workers)
         email_message_obj = self.env['mail.mail']
         # Warning: still using the old-api on 'email.template' because
         # the method generate_email() does not follow the cr, uid, ids
@@ -236,8 +445,7 @@ class CreditCommunication(models.TransientModel):
         of related policy template
 
         """
-        report_name = 'account_credit_control.report_credit_control_summary'
-        return self.env['report'].get_pdf(self, report_name)
+        return self.env['report'].get_pdf(self, REPORT_NAME)
 
     @api.multi
     @api.returns('credit.control.line')
@@ -18,6 +18,7 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import multiprocessing
 
 from openerp import models, fields, api, _
 
@@ -44,6 +45,11 @@ class CreditControlEmailer(models.TransientModel):
                                 default=_get_line_ids,
                                 domain=[('state', '=', 'to_be_sent'),
                                         ('channel', '=', 'email')])
+    workers = fields.Integer(string='Workers',
+                             default=lambda self: multiprocessing.cpu_count(),
+                             help="Number of attached letters rendered at "
+                                  "once. The emails are generated by "
+                                  "batches.")
 
     @api.model
     @api.returns('credit.control.line')
@@ -65,5 +71,5 @@ class CreditControlEmailer(models.TransientModel):
 
         filtered_lines = self._filter_lines(self.line_ids)
         comms = comm_obj._generate_comm_from_credit_lines(filtered_lines)
-        comms._generate_emails()
+        comms._generate_emails(workers=self.workers)
         return {'type': 'ir.actions.act_window_close'}
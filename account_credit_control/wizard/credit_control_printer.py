@@ -18,6 +18,13 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import base64
+import multiprocessing
+import re
+import zipfile
+from cStringIO import StringIO
+
+from pyPdf import PdfFileWriter, PdfFileReader
 
 from openerp import models, fields, api, _
 
@@ -42,6 +49,25 @@ class CreditControlPrinter(models.TransientModel):
     line_ids = fields.Many2many('credit.control.line',
                                 string='Credit Control Lines',
                                 default=_get_line_ids)
+    output = fields.Selection(
+        [('report', 'Report'),
+         ('pdf', 'Merged PDF'),
+         ('zip', 'Archive of PDF per partner')],
+        string='Output',
+        required=True,
+        default='report',
+        help="With the PDF outputs, the letters are rendered per partner "
+             "by several workers.",
+    )
+    workers = fields.Integer(string='Workers',
+                             default=lambda self: multiprocessing.cpu_count(),
+                             help="Number of letters rendered at once.")
+    state = fields.Selection([('draft', 'Draft'),
+                              ('done', 'Done')],
+                             string='State',
+                             default='draft')
+    data = fields.Binary(string='File', readonly=True)
+    filename = fields.Char(string='File Name', readonly=True)
 
     @api.model
     def _credit_line_predicate(self, line):
@@ -66,6 +92,51 @@ class CreditControlPrinter(models.TransientModel):
         if self.mark_as_sent:
             comms._mark_credit_line_as_sent()
 
+        if self.output != 'report':
+            return self._print_files(comms)
+
         report_name = 'account_credit_control.report_credit_control_summary'
         report_obj = self.env['report'].with_context(active_ids=comms.ids)
         return report_obj.get_action(comms, report_name)
+
+    @api.multi
+    def _print_files(self, comms):
+        """ Render the letters per partner in parallel and store them
+        in the wizard as one merged PDF or as a zip archive.
+        """
+        self.ensure_one()
+        groups = {}
+        for comm in comms:
+            groups.setdefault(comm.partner_id, comm.browse())
+            groups[comm.partner_id] |= comm
+        partners = sorted(groups, key=lambda p: (p.name, p.id))
+        rendered = comms._iter_rendered_pdfs(
+            [groups[partner] for partner in partners],
+            workers=self.workers)
+        output = StringIO()
+        if self.output == 'zip':
+            filename = 'credit_control_letters.zip'
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as arch:
+                for partner_comms, pdf in rendered:
+                    partner = partner_comms.partner_id
+                    name = re.sub(r'[^\w\-]+', '_', partner.name or '')
+                    arch.writestr('%s_%s.pdf' % (name, partner.id), pdf)
+        else:
+            filename = 'credit_control_letters.pdf'
+            writer = PdfFileWriter()
+            for __, pdf in rendered:
+                reader = PdfFileReader(StringIO(pdf))
+                for page in xrange(reader.getNumPages()):
+                    writer.addPage(reader.getPage(page))
+            writer.write(output)
+        self.write({'state': 'done',
+                    'data': base64.encodestring(output.getvalue()),
+                    'filename': filename})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_type': 'form',
+            'view_mode': 'form',
+            'target': 'new',
+        }
@@ -58,10 +58,70 @@ class FeesComputer(models.BaseModel):
             raise NotImplementedError('fees type %s is not supported' %
                                       level_fees_type)
 
+    @api.model
+    def _get_batch_compute_fun(self, level_fees_type):
+        """Retrieve function of class that should compute the fees of
+        a group of credit lines based on type
+
+        New fees types plug in by defining a method named
+        ``compute_<type>_fees_batch``. Types having only a per line
+        function (see :meth:`_get_compute_fun`) are computed line by line.
+
+        :param level_fee_type: type existing in model
+                               `credit.control.policy.level`
+                               for field dunning_fees_type
+
+        :returns: a function of class :class:`FeesComputer`
+                 with following signature
+                 self, level (record), credit_currency (record),
+                 credit_lines (recordset), rates (dict)
+                 returning the fees amount of all the lines (float)
+                 or of each line (dict {line id: float})
+
+        """
+        fname = 'compute_%s_fees_batch' % level_fees_type
+        if hasattr(self, fname):
+            return getattr(self, fname)
+        compute = self._get_compute_fun(level_fees_type)
+
+        def compute_batch(level, credit_currency, credit_lines, rates):
+            return dict((line.id, compute(line)) for line in credit_lines)
+        return compute_batch
+
+    @api.model
+    def _group_credit_lines(self, credit_lines):
+        """Group credit lines by policy level and currency
+
+        :param credit_lines: recordset of `credit.control.line`
+
+        :returns: list of (level record, currency record, line ids)
+
+        """
+        cr = self.env.cr
+        cr.execute("SELECT line.policy_level_id,"
+                   "       COALESCE(line.currency_id, company.currency_id),"
+                   "       array_agg(line.id ORDER BY line.id)"
+                   " FROM credit_control_line line"
+                   " JOIN res_company company"
+                   "   ON (company.id = line.company_id)"
+                   " WHERE line.id = ANY(%s)"
+                   " GROUP BY line.policy_level_id,"
+                   "          COALESCE(line.currency_id, company.currency_id)",
+                   (credit_lines.ids,))
+        level_obj = self.env['credit.control.policy.level']
+        currency_obj = self.env['res.currency']
+        return [(level_obj.browse(level_id), currency_obj.browse(currency_id),
+                 line_ids)
+                for level_id, currency_id, line_ids in cr.fetchall()]
+
     @api.model
     def _compute_fees(self, credit_lines):
         """Compute fees for `credit_lines` parameter
 
+        The lines are grouped by policy level and currency, the fees are
+        computed once per group and written with one UPDATE per group
+        and fees amount.
+
         Fees amount is written on credit lines in the field dunning_fees_amount
 
         :param credit_lines: recordset of `credit.control.line`
@@ -71,12 +131,51 @@ class FeesComputer(models.BaseModel):
         """
         if not credit_lines:
             return credit_lines
-        for credit in credit_lines:
-            # if there is no dependence between generated credit lines
-            # this could be threaded
-            self._compute(credit)
+        cr = self.env.cr
+        line_obj = self.env['credit.control.line']
+        line_obj.check_access_rights('write')
+        rates = {}
+        for level, currency, line_ids in self._group_credit_lines(
+                credit_lines):
+            compute = self._get_batch_compute_fun(level.dunning_fees_type)
+            fees = compute(level, currency, line_obj.browse(line_ids), rates)
+            if isinstance(fees, dict):
+                line_ids_by_fees = {}
+                for line_id, line_fees in fees.iteritems():
+                    line_ids_by_fees.setdefault(line_fees, []).append(line_id)
+            else:
+                line_ids_by_fees = {fees: line_ids}
+            for fees, fees_line_ids in line_ids_by_fees.iteritems():
+                if not fees:
+                    continue
+                cr.execute("UPDATE credit_control_line"
+                           " SET dunning_fees_amount = %s,"
+                           "     write_uid = %s,"
+                           "     write_date = (now() at time zone 'UTC')"
+                           " WHERE id = ANY(%s)",
+                           (fees, self.env.uid, fees_line_ids))
+        # the computed fields depending on the fees are invalidated too
+        credit_lines.invalidate_cache()
         return credit_lines
 
+    @api.model
+    def _convert_fees(self, amount, from_currency, to_currency, rates):
+        """Convert a fees amount, the rate between the currencies being
+        computed once and stored in `rates`
+
+        :param rates: dict {(from currency id, to currency id): rate}
+                      shared by a computation of fees
+
+        :returns: amount in `to_currency` (float)
+
+        """
+        if from_currency == to_currency:
+            return amount
+        key = (from_currency.id, to_currency.id)
+        if key not in rates:
+            rates[key] = from_currency.compute(1.0, to_currency, round=False)
+        return to_currency.round(amount * rates[key])
+
     @api.model
     def _compute(self, credit_line):
         """Compute fees for a given credit line
@@ -120,3 +219,26 @@ class FeesComputer(models.BaseModel):
             return fees_amount
         else:
             return fees_currency.compute(fees_amount, credit_currency)
+
+    @api.model
+    def compute_fixed_fees_batch(self, level, credit_currency, credit_lines,
+                                 rates):
+        """Compute fees amount for fixed fees of a group of credit lines
+        having the same level and currency.
+        Correspond to the fixed dunning fees type
+
+        :param level: policy level record of the credit lines
+        :param credit_currency: currency record of the credit lines
+        :param credit_lines: recordset of `credit.control.line`
+        :param rates: dict of the rates used by :meth:`_convert_fees`
+
+        :return: fees amount float (in credit lines currency)
+
+        """
+        fees_amount = level.dunning_fixed_amount
+        if not fees_amount:
+            return 0.0
+        fees_currency = (level.dunning_currency_id or
+                         level.policy_id.company_id.currency_id)
+        return self._convert_fees(fees_amount, fees_currency,
+                                  credit_currency, rates)
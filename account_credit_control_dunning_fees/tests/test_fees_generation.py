@@ -124,3 +124,29 @@ class FixedFeesTester(common.TransactionCase):
         self.euro_level.dunning_fixed_amount = 0.0
         fees = self.dunning_model.compute_fixed_fees(credit_line)
         self.assertEqual(fees, 0.0)
+
+    def test_batch_type_getter(self):
+        """Test that batch compute function is returned for "fixed" type"""
+        c_fun = self.dunning_model._get_batch_compute_fun('fixed')
+        self.assertEqual(c_fun, self.dunning_model.compute_fixed_fees_batch)
+
+    def test_batch_computation_different_currency(self):
+        """Test that batch fees are the same as the fees of each line"""
+        credit_line = self.line_model.new({
+            'policy_level_id': self.euro_level,
+            'currency_id': self.usd.id,
+            'company_id': self.company,
+        })
+        rates = {}
+        fees = self.dunning_model.compute_fixed_fees_batch(
+            self.euro_level, self.usd, credit_line, rates)
+        self.assertAlmostEqual(
+            fees, self.dunning_model.compute_fixed_fees(credit_line))
+        self.assertIn((self.euro.id, self.usd.id), rates)
+
+    def test_batch_no_fees(self):
+        """Test that batch fees are not generated if no amount on level"""
+        self.euro_level.dunning_fixed_amount = 0.0
+        fees = self.dunning_model.compute_fixed_fees_batch(
+            self.euro_level, self.usd, self.line_model.browse(), {})
+        self.assertEqual(fees, 0.0)
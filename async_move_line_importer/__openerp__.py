@@ -41,10 +41,26 @@ not support all CSV canvas.
 - Entry posted option of journal will be skipped.
 - AA lines will only be created when moves are posted.
 - Tax lines computation will be skipped until the move are posted.
+- When the CSV file only uses the columns of the provided canvas, moves
+  and lines are staged with COPY, validated and inserted in bulk.
 
 This option should be used with caution and preferably in conjunction with
 provided canvas in tests/data
 
+Large files can be committed by chunks of moves by setting "Moves per
+commit". A report is kept for each chunk and an import that failed or was
+interrupted is resumed after its last committed chunk. A file is imported
+once at a time, even across several server processes.
+
+Fast imports of the provided canvas can be loaded in parallel: the file is
+split in partitions of moves loaded by several cron workers, each of them
+committing a partition at once in its own transaction.
+
+The file can be checked beforehand with the check file button, or before
+each import with "Check before import". References are resolved once per
+distinct value and moves are checked to be balanced, a full error report is
+written without importing anything.
+
 Then simply press import file button. The process will be run in background
 and you will be able to continue your work.
 
@@ -18,12 +18,47 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import csv
+import tempfile
 import psycopg2
 import logging
 from openerp.osv import orm
 from openerp.tools.float_utils import float_compare
+from openerp.tools.translate import _
 _logger = logging.getLogger(__name__)
 
+# CSV columns supported by account_move._bulk_load with, for each of
+# them, None for a plain value or the table of the referenced record
+# and its columns matched against the value, the values matching none
+# of them are resolved by name_search
+BULK_MOVE_COLUMNS = {
+    'name': None,
+    'ref': None,
+    'date': None,
+    'narration': None,
+    'period_id': ('account_period', ('code', 'name')),
+    'journal_id': ('account_journal', ('code', 'name')),
+}
+BULK_LINE_COLUMNS = {
+    'name': None,
+    'debit': None,
+    'credit': None,
+    'date_maturity': None,
+    'account_id': ('account_account', ('code', 'name')),
+    'partner_id': ('res_partner', ('name',)),
+    'tax_code_id': ('account_tax_code', ('code', 'name')),
+    'analytic_account_id': ('account_analytic_account', ('code', 'name')),
+}
+BULK_REQUIRED_MOVE_COLUMNS = ('date', 'period_id', 'journal_id')
+BULK_REQUIRED_LINE_COLUMNS = ('account_id', 'name')
+BULK_DATE_COLUMNS = ('date', 'date_maturity')
+BULK_AMOUNT_COLUMNS = ('debit', 'credit')
+# amounts accepted by float() and by a cast to numeric, but inf and nan
+BULK_AMOUNT_REGEX = ('^[[:space:]]*[-+]?([0-9]+([.][0-9]*)?|[.][0-9]+)'
+                     '([eE][-+]?[0-9]+)?[[:space:]]*$')
+# maximum number of errors reported by each check of _bulk_load
+BULK_MESSAGES_LIMIT = 100
+
 
 def _format_inserts_values(vals):
     cols = vals.keys()
@@ -73,7 +108,7 @@ class account_move(orm.Model):
         debit = sum(x.get('debit') or 0.0 for x in line_dicts)
         credit = sum(x.get('credit') or 0.0 for x in line_dicts)
         if float_compare(debit, credit, precision_digits=2):
-            raise ValueError('Move is not balanced %s %s' % (debit, credits))
+            raise ValueError('Move is not balanced %s %s' % (debit, credit))
 
     def _bypass_create(self, cr, uid, vals, context=None):
         """Create entries using cursor directly
@@ -110,6 +145,357 @@ class account_move(orm.Model):
             return self._bypass_create(cr, uid, vals, context=context)
         return super(account_move, self).create(cr, uid, vals, context=context)
 
+    def _bulk_load_columns(self, head):
+        """Split a CSV head between the columns of the moves and
+        of their lines as expected by `_bulk_load`
+
+        :param head: CSV file head (list of header)
+        :returns: (move columns, line columns) as lists of
+                  (field name, index in head) or None if the
+                  head is not supported by `_bulk_load`
+
+        """
+        move_cols = []
+        line_cols = []
+        for index, name in enumerate(head):
+            if name in BULK_MOVE_COLUMNS:
+                move_cols.append((name, index))
+            elif (name.startswith('line_id/') and
+                    name[len('line_id/'):] in BULK_LINE_COLUMNS):
+                line_cols.append((name[len('line_id/'):], index))
+            else:
+                return None
+        move_names = set(name for name, __ in move_cols)
+        line_names = set(name for name, __ in line_cols)
+        if (len(move_names) != len(move_cols) or
+                len(line_names) != len(line_cols) or
+                not move_names.issuperset(BULK_REQUIRED_MOVE_COLUMNS) or
+                not line_names.issuperset(BULK_REQUIRED_LINE_COLUMNS)):
+            return None
+        return move_cols, line_cols
+
+    def _bulk_stage_rows(self, cr, data, move_cols, line_cols):
+        """Copy the CSV rows in the async_import_row temporary table
+
+        Each row gets the number of its move, the values of the move
+        are only set on the first row of the move.
+
+        :param data: CSV file content (iterable of tuples)
+        :param move_cols: move columns given by `_bulk_load_columns`
+        :param line_cols: line columns given by `_bulk_load_columns`
+
+        """
+        columns = (['m_%s' % name for name, __ in move_cols] +
+                   ['l_%s' % name for name, __ in line_cols])
+        resolved = (['m_%s_res' % name for name, __ in move_cols
+                     if BULK_MOVE_COLUMNS[name]] +
+                    ['l_%s_res' % name for name, __ in line_cols
+                     if BULK_LINE_COLUMNS[name]])
+        cr.execute("DROP TABLE IF EXISTS async_import_row")
+        cr.execute("CREATE TEMP TABLE async_import_row ("
+                   " row_no integer, move_no integer, move_row boolean, "
+                   + ''.join('%s text, ' % col for col in columns)
+                   + ''.join('%s integer, ' % col for col in resolved)
+                   + " PRIMARY KEY (row_no)) ON COMMIT DROP")
+        # rows are staged in a temporary file to keep memory usage low
+        with tempfile.TemporaryFile() as buf:
+            writer = csv.writer(buf)
+            move_no = 0
+            for row_no, row in enumerate(data):
+                move_vals = [row[i] if i < len(row) else ''
+                             for __, i in move_cols]
+                move_row = any(move_vals) or not move_no
+                if move_row:
+                    move_no += 1
+                writer.writerow(
+                    [row_no, move_no, 't' if move_row else 'f'] +
+                    move_vals +
+                    [row[i] if i < len(row) else '' for __, i in line_cols]
+                )
+            buf.seek(0)
+            cr.copy_expert(
+                "COPY async_import_row (row_no, move_no, move_row, %s) "
+                "FROM STDIN WITH CSV" % ', '.join(columns),
+                buf
+            )
+        cr.execute("ANALYZE async_import_row")
+
+    def _bulk_resolve(self, cr, column, table, match_cols, company_id):
+        """Resolve the references of a staged column in one query
+
+        The first record matching exactly the value on one of
+        `match_cols` is used, records matching on the first
+        column are preferred.
+
+        :param column: staged column holding the references
+        :param table: table of the referenced records
+        :param match_cols: columns of `table` compared to the value
+        :param company_id: company of the import
+
+        """
+        match = ' OR '.join('t.%s = v.value' % col for col in match_cols)
+        sql = ("UPDATE async_import_row r SET %(column)s_res = m.id "
+               "FROM (SELECT DISTINCT ON (v.value) v.value, t.id "
+               "      FROM (SELECT DISTINCT %(column)s AS value "
+               "            FROM async_import_row "
+               "            WHERE %(column)s IS NOT NULL) v "
+               "      JOIN %(table)s t ON (%(match)s) "
+               "      WHERE t.company_id = %%s OR t.company_id IS NULL "
+               "      ORDER BY v.value, t.%(first)s = v.value DESC, t.id) m "
+               "WHERE r.%(column)s = m.value"
+               % {'column': column, 'table': table, 'match': match,
+                  'first': match_cols[0]})
+        cr.execute(sql, (company_id or None,))
+
+    def _bulk_resolve_by_name(self, cr, uid, column, model, context=None):
+        """Resolve the staged references left unresolved by
+        `_bulk_resolve` with name_search, as BaseModel.load does
+
+        Each distinct value is searched once, so references by display
+        name, partner reference or account shortcut are supported.
+
+        :param column: staged column holding the references
+        :param model: model of the referenced records
+
+        """
+        cr.execute("SELECT DISTINCT %(column)s FROM async_import_row "
+                   "WHERE %(column)s IS NOT NULL AND %(column)s_res IS NULL"
+                   % {'column': column})
+        rel_obj = self.pool[model]
+        for value, in cr.fetchall():
+            found = rel_obj.name_search(cr, uid, value, operator='=',
+                                        limit=1, context=context)
+            if found:
+                cr.execute("UPDATE async_import_row SET %(column)s_res = %%s "
+                           "WHERE %(column)s = %%s" % {'column': column},
+                           (found[0][0], value))
+
+    def _lookup_references(self, cr, table, match_cols, values, company_id):
+        """Resolve references in one query, as `_bulk_resolve` does
+
+        :param table: table of the referenced records
+        :param match_cols: columns of `table` compared to the values
+        :param values: referenced values
+        :param company_id: company of the import
+        :returns: dict {value: id of the referenced record}
+
+        """
+        if not values:
+            return {}
+        match = ' OR '.join('t.%s = v.value' % col for col in match_cols)
+        sql = ("SELECT DISTINCT ON (v.value) v.value, t.id "
+               "FROM unnest(%%s::text[]) AS v(value) "
+               "JOIN %(table)s t ON (%(match)s) "
+               "WHERE t.company_id = %%s OR t.company_id IS NULL "
+               "ORDER BY v.value, t.%(first)s = v.value DESC, t.id"
+               % {'table': table, 'match': match, 'first': match_cols[0]})
+        cr.execute(sql, (list(values), company_id or None))
+        return dict(cr.fetchall())
+
+    def _bulk_check(self, cr, move_cols, line_cols):
+        """Validate the staged rows with set based queries
+
+        Checks the required values, the references, the format of the
+        dates and amounts, and as `_prepare_line` and `_check_balance`
+        do, that debit and credit are not set on the same line and
+        that moves are balanced.
+
+        :param move_cols: move columns given by `_bulk_load_columns`
+        :param line_cols: line columns given by `_bulk_load_columns`
+        :returns: list of messages formatted as BaseModel.load does
+
+        """
+        messages = []
+
+        def add_messages(sql, field, message):
+            cr.execute(sql + " ORDER BY 1 LIMIT %s", (BULK_MESSAGES_LIMIT,))
+            for row in cr.fetchall():
+                messages.append({
+                    'type': 'error',
+                    'field': field,
+                    'message': message % {'value': row[-1]},
+                    'rows': {'from': row[0], 'to': row[1]},
+                })
+
+        columns = ([('m', name, BULK_MOVE_COLUMNS[name])
+                    for name, __ in move_cols] +
+                   [('l', name, BULK_LINE_COLUMNS[name])
+                    for name, __ in line_cols])
+        for prefix, name, reference in columns:
+            col = '%s_%s' % (prefix, name)
+            field = name if prefix == 'm' else 'line_id/%s' % name
+            row_filter = " AND move_row" if prefix == 'm' else ""
+            if name in (BULK_REQUIRED_MOVE_COLUMNS if prefix == 'm'
+                        else BULK_REQUIRED_LINE_COLUMNS):
+                add_messages("SELECT row_no, row_no, NULL "
+                             "FROM async_import_row "
+                             "WHERE %s IS NULL%s" % (col, row_filter),
+                             field, _("Missing required value"))
+            if reference:
+                add_messages("SELECT row_no, row_no, %s "
+                             "FROM async_import_row "
+                             "WHERE %s IS NOT NULL AND %s_res IS NULL"
+                             % (col, col, col),
+                             field,
+                             _("No matching record found for "
+                               "'%(value)s'"))
+            elif name in BULK_DATE_COLUMNS:
+                add_messages("SELECT row_no, row_no, %s "
+                             "FROM async_import_row "
+                             "WHERE %s !~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$'"
+                             % (col, col),
+                             field,
+                             _("'%(value)s' is not a valid date, "
+                               "expected format is YYYY-MM-DD"))
+            elif name in BULK_AMOUNT_COLUMNS:
+                add_messages("SELECT row_no, row_no, %s "
+                             "FROM async_import_row "
+                             "WHERE %s !~ '%s'"
+                             % (col, col, BULK_AMOUNT_REGEX),
+                             field,
+                             _("'%(value)s' is not a valid amount"))
+        if messages:
+            # amounts can not be checked if some are malformed
+            return messages
+        debit = self._bulk_value('l', 'debit', line_cols)
+        credit = self._bulk_value('l', 'credit', line_cols)
+        add_messages("SELECT row_no, row_no, NULL "
+                     "FROM async_import_row "
+                     "WHERE %s <> 0 AND %s <> 0" % (debit, credit),
+                     'line_id',
+                     _("Debit and credit set on same line"))
+        add_messages("SELECT min(row_no), max(row_no), "
+                     "       sum(%s)::text || ' / ' || sum(%s)::text "
+                     "FROM async_import_row "
+                     "GROUP BY move_no "
+                     "HAVING round(sum(%s) - sum(%s), 2) <> 0"
+                     % (debit, credit, debit, credit),
+                     'line_id',
+                     _("Move is not balanced %(value)s"))
+        return messages
+
+    def _bulk_value(self, prefix, name, columns):
+        """SQL expression of the value to insert of a staged column
+
+        :param prefix: 'm' for a column of the move, 'l' for a line
+        :param name: name of the field
+        :param columns: columns given by `_bulk_load_columns`
+        :returns: SQL expression
+
+        """
+        if name not in [col for col, __ in columns]:
+            return '0' if name in BULK_AMOUNT_COLUMNS else 'NULL'
+        col = '%s_%s' % (prefix, name)
+        table = BULK_MOVE_COLUMNS if prefix == 'm' else BULK_LINE_COLUMNS
+        if table[name]:
+            return '%s_res' % col
+        if name in BULK_DATE_COLUMNS:
+            return '%s::date' % col
+        if name in BULK_AMOUNT_COLUMNS:
+            return 'COALESCE(%s::numeric, 0)' % col
+        return col
+
+    def _bulk_load(self, cr, uid, head, data, move_ids=None, context=None):
+        """Load a CSV file of moves without ORM nor row by row inserts
+
+        Rows are staged in a temporary table with COPY, references are
+        resolved and rows validated with set based queries, then moves
+        and lines are inserted with one query each.
+        The head must be supported as told by `_bulk_load_columns`.
+
+        :param head: CSV file head (list of header)
+        :param data: CSV file content (iterable of tuples)
+        :param move_ids: ids reserved for the moves, in the order of
+                         the file, else ids are taken from the sequence
+        :returns: dict like the one returned by BaseModel.load
+
+        """
+        if context is None:
+            context = {}
+        company_id = context.get('company_id', False)
+        move_cols, line_cols = self._bulk_load_columns(head)
+        self._bulk_stage_rows(cr, data, move_cols, line_cols)
+        line_obj = self.pool['account.move.line']
+        for name, __ in move_cols:
+            if BULK_MOVE_COLUMNS[name]:
+                table, match_cols = BULK_MOVE_COLUMNS[name]
+                self._bulk_resolve(cr, 'm_%s' % name, table, match_cols,
+                                   company_id)
+                self._bulk_resolve_by_name(
+                    cr, uid, 'm_%s' % name,
+                    self._all_columns[name].column._obj, context=context)
+        for name, __ in line_cols:
+            if BULK_LINE_COLUMNS[name]:
+                table, match_cols = BULK_LINE_COLUMNS[name]
+                self._bulk_resolve(cr, 'l_%s' % name, table, match_cols,
+                                   company_id)
+                self._bulk_resolve_by_name(
+                    cr, uid, 'l_%s' % name,
+                    line_obj._all_columns[name].column._obj, context=context)
+        messages = self._bulk_check(cr, move_cols, line_cols)
+        if messages:
+            cr.execute("DROP TABLE async_import_row")
+            return {'ids': False, 'messages': messages}
+
+        move_names = [name for name, __ in move_cols if name != 'name']
+        staged = ', '.join(
+            ['m_%s' % name for name, __ in move_cols] +
+            ['m_%s_res' % name for name, __ in move_cols
+             if BULK_MOVE_COLUMNS[name]]
+        )
+        if move_ids is None:
+            move_id = "nextval(%s)"
+            params = (self._sequence,)
+        else:
+            move_id = "(%s::integer[])[row_number() OVER (ORDER BY move_no)]"
+            params = (move_ids,)
+        cr.execute("DROP TABLE IF EXISTS async_import_move")
+        # ids are reserved in file order so they stay deterministic
+        cr.execute("CREATE TEMP TABLE async_import_move ON COMMIT DROP AS "
+                   "SELECT o.*, " + move_id + " AS move_id "
+                   "FROM (SELECT move_no, " + staged + " "
+                   "      FROM async_import_row "
+                   "      WHERE move_row ORDER BY move_no) o",
+                   params)
+        cr.execute("CREATE UNIQUE INDEX ON async_import_move (move_no)")
+        cr.execute("INSERT INTO account_move "
+                   "(id, create_uid, create_date, write_uid, write_date, "
+                   " company_id, state, name, " + ', '.join(move_names) + ") "
+                   "SELECT move_id, %s, now() AT TIME ZONE 'UTC', "
+                   "       %s, now() AT TIME ZONE 'UTC', "
+                   "       %s, 'draft', " +
+                   ("COALESCE(m_name, '/'), " if 'name' in
+                    [name for name, __ in move_cols] else "'/', ") +
+                   ', '.join(self._bulk_value('m', name, move_cols)
+                             for name in move_names) + " "
+                   "FROM async_import_move ORDER BY move_no",
+                   (uid, uid, company_id or None))
+        line_names = [name for name, __ in line_cols]
+        for name in BULK_AMOUNT_COLUMNS:
+            if name not in line_names:
+                line_names.append(name)
+        cr.execute("INSERT INTO account_move_line "
+                   "(create_uid, create_date, write_uid, write_date, "
+                   " move_id, journal_id, period_id, date, company_id, "
+                   " state, ref, " + ', '.join(line_names) + ") "
+                   "SELECT %s, now() AT TIME ZONE 'UTC', "
+                   "       %s, now() AT TIME ZONE 'UTC', "
+                   "       m.move_id, m.m_journal_id_res, "
+                   "       m.m_period_id_res, m.m_date::date, %s, "
+                   "       'draft', " +
+                   ("m.m_ref, " if 'ref' in move_names else "NULL, ") +
+                   ', '.join(self._bulk_value('l', name, line_cols)
+                             for name in line_names) + " "
+                   "FROM async_import_row r "
+                   "JOIN async_import_move m ON m.move_no = r.move_no "
+                   "ORDER BY r.row_no",
+                   (uid, uid, company_id or None))
+        _logger.info('%s move lines loaded in bulk', cr.rowcount)
+        cr.execute("SELECT move_id FROM async_import_move ORDER BY move_no")
+        ids = [row[0] for row in cr.fetchall()]
+        cr.execute("DROP TABLE async_import_row, async_import_move")
+        return {'ids': ids, 'messages': []}
+
 
 class account_move_line(orm.Model):
     """Redefine account move line create to bypass orm.
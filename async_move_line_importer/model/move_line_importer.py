@@ -25,16 +25,37 @@ import base64
 import threading
 import csv
 import tempfile
+import itertools
+import time
+from cStringIO import StringIO
+from datetime import datetime
 
 import psycopg2
 
 import openerp.pooler as pooler
+from openerp import SUPERUSER_ID
 from openerp.osv import orm, fields
+from openerp.tools import (DEFAULT_SERVER_DATE_FORMAT,
+                           DEFAULT_SERVER_DATETIME_FORMAT)
+from openerp.tools.float_utils import float_compare
 from openerp.tools.translate import _
 
+from .account import BULK_MOVE_COLUMNS, BULK_LINE_COLUMNS
+
 
 _logger = logging.getLogger(__name__)
 
+# size of the pieces of the stored file read from the database
+FILE_READ_SIZE = 1024 * 1024
+# maximum number of CSV rows given at once to BaseModel.load
+LOAD_CHUNK_ROWS = 1000
+# number of moves of a partition loaded by a cron worker
+# when no commit size is set
+PARTITION_MOVES = 1000
+
+# maximum number of errors reported by a check of the file
+CHECK_MESSAGES_LIMIT = 1000
+
 
 class move_line_importer(orm.Model):
     """Asynchrone move / move line importer.
@@ -52,7 +73,8 @@ class move_line_importer(orm.Model):
     def copy(self, cr, uid, id, default=None, context=None):
         if default is None:
             default = {}
-        default.update(state='draft', report=False)
+        default.update(state='draft', report=False, done_rows=0,
+                       chunk_ids=[])
         return super(move_line_importer, self).copy(cr, uid, id,
                                                     default=default,
                                                     context=context)
@@ -115,6 +137,38 @@ class move_line_importer(orm.Model):
                  "This option should be used with caution"
                  " and in conjonction with provided canvas."
         ),
+        'commit_size': fields.integer(
+            'Moves per commit',
+            help="When set, moves are committed by chunks of this size "
+                 "and a failed or interrupted import is resumed after "
+                 "the last committed chunk. \n"
+                 "When 0, the whole file is imported in one transaction."
+        ),
+        'workers': fields.integer(
+            'Workers',
+            help="Number of cron workers loading the file in parallel, "
+                 "they are bounded by the cron threads of the server. "
+                 "Only used by fast imports of the provided canvas, "
+                 "moves are then committed by partitions of "
+                 "'Moves per commit' moves."
+        ),
+        'check_before_import': fields.boolean(
+            'Check before import',
+            help="The file is checked before being imported, nothing "
+                 "is imported when an error is found."
+        ),
+        'done_rows': fields.integer(
+            'Committed rows',
+            readonly=True,
+            help="Number of CSV rows (header excluded) already committed, "
+                 "the import is resumed after them."
+        ),
+        'chunk_ids': fields.one2many(
+            'move.line.importer.chunk',
+            'importer_id',
+            'Chunks',
+            readonly=True
+        ),
     }
 
     def _get_current_company(self, cr, uid, context=None,
@@ -129,35 +183,75 @@ class move_line_importer(orm.Model):
                  'name': fields.datetime.now(),
                  'company_id': _get_current_company,
                  'delimiter': ',',
-                 'bypass_orm': False}
+                 'bypass_orm': False,
+                 'commit_size': 0,
+                 'workers': 1,
+                 'check_before_import': False,
+                 'done_rows': 0}
+
+    def write(self, cr, uid, ids, vals, context=None):
+        """Please refer to orm.BaseModel.write documentation
+
+        Committed rows of a previous file must not be skipped
+        in a new one.
+
+        """
+        if 'file' in vals and 'done_rows' not in vals:
+            vals = dict(vals, done_rows=0)
+        return super(move_line_importer, self).write(cr, uid, ids, vals,
+                                                     context=context)
+
+    def _decode_file(self, cr, uid, imp_id, dest):
+        """Decode the stored base 64 file into `dest`.
+
+        The file is read from the database and decoded piece by piece
+        so it never has to fit in memory.
+
+        :param imp_id: current importer id
+        :param dest: file object receiving the decoded content
+
+        """
+        offset = 1
+        remainder = ''
+        while True:
+            cr.execute("SELECT substring(file FROM %s FOR %s) "
+                       "FROM move_line_importer WHERE id = %s",
+                       (offset, FILE_READ_SIZE, imp_id))
+            piece = str(cr.fetchone()[0] or '')
+            if not piece:
+                break
+            offset += len(piece)
+            encoded = remainder + ''.join(piece.split())
+            # base 64 is decoded by blocks of 4 chars
+            cut = len(encoded) - len(encoded) % 4
+            dest.write(base64.b64decode(encoded[:cut]))
+            remainder = encoded[cut:]
+        if remainder:
+            dest.write(base64.b64decode(remainder))
 
     def _parse_csv(self, cr, uid, imp_id):
         """Parse stored CSV file in order to be usable by BaseModel.load method.
 
-        Manage base 64 decoding.
+        Manage base 64 decoding. The file is decoded in a temporary file
+        and its rows are read lazily.
 
         :param imp_id: current importer id
-        :returns: (head [list of first row], data [list of list])
+        :returns: (head [list of first row], data [iterator of tuples])
 
         """
         # We use tempfile in order to avoid memory error with large files
-        with tempfile.TemporaryFile() as src:
-            imp = self.read(cr, uid, imp_id, ['file', 'delimiter'])
-            content = imp['file']
-            delimiter = imp['delimiter']
-            src.write(content)
-            with tempfile.TemporaryFile() as decoded:
-                src.seek(0)
-                base64.decode(src, decoded)
-                decoded.seek(0)
-                return self._prepare_csv_data(decoded, delimiter)
+        imp = self.read(cr, uid, imp_id, ['delimiter'])
+        decoded = tempfile.TemporaryFile()
+        self._decode_file(cr, uid, imp_id, decoded)
+        decoded.seek(0)
+        return self._prepare_csv_data(decoded, imp['delimiter'])
 
     def _prepare_csv_data(self, csv_file, delimiter=","):
-        """Parse a decoded CSV file and return head list and data list
+        """Parse a decoded CSV file and return head list and data iterator
 
         :param csv_file: decoded CSV file
         :param delimiter: CSV file delimiter char
-        :returns: (head [list of first row], data [list of list])
+        :returns: (head [list of first row], data [iterator of tuples])
 
         """
         try:
@@ -170,10 +264,68 @@ class move_line_importer(orm.Model):
             )
         head = data.next()
         head = [x.replace(' ', '') for x in head]
-        # Generator does not work with orm.BaseModel.load
-        values = [tuple(x) for x in data if x]
+        # Generator does not work with orm.BaseModel.load,
+        # the rows are given to it by chunks, see _iter_move_chunks
+        values = (tuple(x) for x in data if x)
         return (head, values)
 
+    def _iter_move_chunks(self, head, data, max_rows=LOAD_CHUNK_ROWS,
+                          max_moves=None):
+        """Group the rows of a parsed CSV file by chunks of complete moves.
+
+        As for BaseModel.load, a row having a value in a column of the
+        move (not of its lines) starts a new move.
+
+        :param head: CSV file head (list of header)
+        :param data: CSV file content (iterable of tuples)
+        :param max_rows: maximum number of rows of a chunk, a chunk has
+                         at least one move
+        :param max_moves: maximum number of moves of a chunk
+        :returns: iterator of (index of the first row, list of rows)
+
+        """
+        move_cols = [i for i, name in enumerate(head) if '/' not in name]
+        chunk = []
+        move = []
+        moves = 0
+        index = 0
+        # None marks the end of the last move
+        for row in itertools.chain(data, [None]):
+            if move and (row is None or
+                         any(row[i] for i in move_cols if i < len(row))):
+                if chunk and (
+                        (max_rows and len(chunk) + len(move) > max_rows) or
+                        (max_moves and moves >= max_moves)):
+                    yield index, chunk
+                    index += len(chunk)
+                    chunk = []
+                    moves = 0
+                chunk += move
+                moves += 1
+                move = []
+            if row is not None:
+                move.append(row)
+        if chunk:
+            yield index, chunk
+
+    def _offset_messages(self, messages, offset):
+        """Shift the rows of the messages of BaseModel.load
+        from a chunk to the whole file
+
+        :param messages: BaseModel.load messages of a chunk
+        :param offset: index of the first row of the chunk
+        :returns: list of messages
+
+        """
+        for msg in messages:
+            rows = msg.get('rows')
+            if rows:
+                msg['rows'] = dict((key, value + offset)
+                                   for key, value in rows.iteritems())
+            if 'record' in msg:
+                msg['record'] += offset
+        return messages
+
     def format_messages(self, messages):
         """Format error messages generated by the BaseModel.load method
 
@@ -274,27 +426,613 @@ class move_line_importer(orm.Model):
                        context=context)
         return imp_id
 
+    def _load_by_chunks(self, cr, uid, head, data, context=None):
+        """Give the rows to BaseModel.load by chunks of complete moves
+
+        Stops on the first chunk in error.
+
+        :param head: CSV file head (list of header)
+        :param data: CSV file content (iterable of tuples)
+        :returns: dict like the one returned by BaseModel.load
+
+        """
+        move_obj = self.pool['account.move']
+        res = {'ids': [], 'messages': []}
+        for index, chunk in self._iter_move_chunks(head, data):
+            chunk_res = move_obj.load(cr, uid, head, chunk, context=context)
+            if chunk_res['messages']:
+                return {'ids': False,
+                        'messages': self._offset_messages(
+                            chunk_res['messages'], index)}
+            res['ids'] += chunk_res['ids']
+        return res
+
+    def _resolve_references(self, cr, uid, model, field, values,
+                            bulk=False, context=None):
+        """Resolve the names of the records referenced by a many2one
+        field once per distinct value
+
+        When the file is loaded by `account.move._bulk_load`, the values
+        are resolved as it does, with one query for all of them. Else
+        they are resolved by name_search as BaseModel.load does.
+
+        :param model: name of the model of the field
+        :param field: name of the many2one field
+        :param values: referenced names
+        :param bulk: True when the file is loaded by `_bulk_load`
+        :returns: dict {value: id of the referenced record}
+
+        """
+        move_obj = self.pool['account.move']
+        bulk_columns = (BULK_MOVE_COLUMNS if model == 'account.move'
+                        else BULK_LINE_COLUMNS)
+        res = {}
+        if bulk and bulk_columns.get(field):
+            table, match_cols = bulk_columns[field]
+            res = move_obj._lookup_references(cr, table, match_cols, values,
+                                              context.get('company_id'))
+        column = self.pool[model]._all_columns[field].column
+        rel_obj = self.pool[column._obj]
+        # as `_bulk_resolve_by_name` for the values not found in bulk
+        for value in values:
+            if value in res:
+                continue
+            found = rel_obj.name_search(cr, uid, value, operator='=',
+                                        limit=1, context=context)
+            if found:
+                res[value] = found[0][0]
+        return res
+
+    def _check_rows(self, cr, uid, head, data, context=None):
+        """Check a parsed CSV file without writing anything
+
+        The referenced records are resolved once per distinct value.
+        Required values, dates and amounts are checked and, as
+        `account.move._prepare_line` and `_check_balance` do, debit and
+        credit can not be set on the same line and moves must be
+        balanced.
+
+        :param head: CSV file head (list of header)
+        :param data: CSV file content (iterable of tuples)
+        :returns: (number of moves,
+                   list of messages formatted as BaseModel.load does)
+
+        """
+        if context is None:
+            context = {}
+        messages = []
+        # references are resolved as the file will be loaded
+        bulk = bool(context.get('async_bypass_create') and
+                    self.pool['account.move']._bulk_load_columns(head))
+
+        def add_message(field, message, first_row=None, last_row=None):
+            if len(messages) < CHECK_MESSAGES_LIMIT:
+                msg = {'type': 'error', 'field': field, 'message': message}
+                if first_row is not None:
+                    msg['rows'] = {'from': first_row, 'to': last_row}
+                messages.append(msg)
+
+        columns = []
+        for index, name in enumerate(head):
+            model, field = 'account.move', name
+            if name.startswith('line_id/'):
+                model, field = 'account.move.line', name[len('line_id/'):]
+            if field in ('id', '.id') or '/' in field:
+                # external and database ids are not checked
+                continue
+            model_obj = self.pool[model]
+            if field not in model_obj._all_columns:
+                add_message(name, _("Unknown column"))
+                continue
+            column = model_obj._all_columns[field].column
+            required = column.required and field not in model_obj._defaults
+            columns.append((index, name, model, field, column, required))
+
+        # {index of column: {referenced name: [first row, last row]}}
+        references = {}
+        moves = 0
+        for first_row, rows in self._iter_move_chunks(head, data,
+                                                      max_rows=None,
+                                                      max_moves=1):
+            moves += 1
+            move_debit = move_credit = 0.0
+            for row_no, row in enumerate(rows, first_row):
+                amounts = {}
+                for index, name, model, field, column, required in columns:
+                    value = row[index] if index < len(row) else ''
+                    if not value:
+                        # values of the move are only on its first row
+                        if required and (model == 'account.move.line' or
+                                         row_no == first_row):
+                            add_message(name, _("Missing required value"),
+                                        row_no, row_no)
+                        continue
+                    if column._type == 'many2one':
+                        found = references.setdefault(index, {})
+                        if value in found:
+                            found[value][1] = row_no
+                        else:
+                            found[value] = [row_no, row_no]
+                    elif column._type == 'date':
+                        try:
+                            datetime.strptime(value,
+                                              DEFAULT_SERVER_DATE_FORMAT)
+                        except ValueError:
+                            add_message(name,
+                                        _("'%s' is not a valid date") % value,
+                                        row_no, row_no)
+                    elif column._type == 'float':
+                        try:
+                            amounts[field] = float(value)
+                        except ValueError:
+                            add_message(
+                                name, _("'%s' is not a valid amount") % value,
+                                row_no, row_no)
+                if amounts.get('debit') and amounts.get('credit'):
+                    add_message('line_id',
+                                _("Debit and credit set on same line"),
+                                row_no, row_no)
+                move_debit += amounts.get('debit') or 0.0
+                move_credit += amounts.get('credit') or 0.0
+            if float_compare(move_debit, move_credit, precision_digits=2):
+                add_message('line_id',
+                            _("Move is not balanced %s / %s") %
+                            (move_debit, move_credit),
+                            first_row, first_row + len(rows) - 1)
+
+        for index, name, model, field, column, required in columns:
+            if index not in references:
+                continue
+            values = references[index]
+            found = self._resolve_references(cr, uid, model, field,
+                                             values.keys(), bulk=bulk,
+                                             context=context)
+            for value, (first_row, last_row) in sorted(
+                    values.iteritems(), key=lambda item: item[1]):
+                if value not in found:
+                    add_message(name,
+                                _("No matching record found for '%s'") %
+                                value,
+                                first_row, last_row)
+        return moves, messages
+
+    def check_import_file(self, cr, uid, imp_id, context=None):
+        """Check the CSV file and write the report without importing it"""
+        if isinstance(imp_id, list):
+            imp_id = imp_id[0]
+        current = self.read(cr, uid, imp_id, ['company_id', 'bypass_orm'],
+                            load='_classic_write')
+        ctx = dict(context or {}, company_id=current['company_id'])
+        if current['bypass_orm']:
+            # references are resolved as by import_file
+            ctx['async_bypass_create'] = True
+        head, data = self._parse_csv(cr, uid, imp_id)
+        moves, messages = self._check_rows(cr, uid, head, data, context=ctx)
+        if messages:
+            report = self.format_messages(messages)
+        else:
+            report = _("%s moves checked, no error found") % moves
+        self.write(cr, uid, [imp_id], {'report': report}, context=context)
+        return True
+
+    def _load_rows(self, cr, uid, head, data, context=None):
+        """Load rows in bulk when the ORM is bypassed and the CSV canvas
+        allows it, else by chunks with BaseModel.load
+
+        :param head: CSV file head (list of header)
+        :param data: CSV file content (iterable of tuples)
+        :returns: dict like the one returned by BaseModel.load
+
+        """
+        move_obj = self.pool['account.move']
+        if (context.get('async_bypass_create') and
+                move_obj._bulk_load_columns(head)):
+            return move_obj._bulk_load(cr, uid, head, data, context=context)
+        return self._load_by_chunks(cr, uid, head, data, context=context)
+
+    def _load_chunk(self, cr, uid, imp_id, head, rows, first_row,
+                    move_ids=None, chunk_id=None, context=None):
+        """Load a chunk of complete moves and record its report
+
+        The chunk is rolled back when in error, commit is left
+        to the caller.
+
+        :param imp_id: current importer id
+        :param head: CSV file head (list of header)
+        :param rows: rows of the chunk (list of tuples)
+        :param first_row: index of the first row of the chunk in the file
+        :param move_ids: ids reserved for the moves of the chunk, given
+                         to `account.move._bulk_load`
+        :param chunk_id: move.line.importer.chunk queued for the chunk,
+                         it is created when not given
+        :returns: values of the move.line.importer.chunk
+
+        """
+        vals = {'importer_id': imp_id,
+                'first_row': first_row,
+                'last_row': first_row + len(rows) - 1}
+        cr.execute('SAVEPOINT async_move_line_import_chunk')
+        try:
+            if move_ids is None:
+                res = self._load_rows(cr, uid, head, rows, context=context)
+            else:
+                res = self.pool['account.move']._bulk_load(
+                    cr, uid, head, rows, move_ids=move_ids, context=context)
+        except Exception as exc:
+            _logger.exception('Import of rows %s to %s failed',
+                              vals['first_row'], vals['last_row'])
+            res = {'ids': False,
+                   'messages': [{'type': 'error',
+                                 'message': repr(exc),
+                                 'rows': {'from': 0,
+                                          'to': len(rows) - 1}}]}
+        if res['messages']:
+            cr.execute('ROLLBACK TO SAVEPOINT async_move_line_import_chunk')
+            messages = self._offset_messages(res['messages'], first_row)
+            vals.update(state='error',
+                        move_count=0,
+                        report=self.format_messages(messages))
+        else:
+            cr.execute('RELEASE SAVEPOINT async_move_line_import_chunk')
+            vals.update(state='done',
+                        move_count=len(res['ids']),
+                        report=_("%s moves imported") % len(res['ids']))
+        chunk_obj = self.pool['move.line.importer.chunk']
+        if chunk_id:
+            # the loaded rows are not kept
+            chunk_obj.write(cr, uid, [chunk_id], dict(vals, rows=False),
+                            context=context)
+        else:
+            chunk_obj.create(cr, uid, vals, context=context)
+        return vals
+
+    def _format_chunks_report(self, imported, failed, done_rows):
+        """Summarize the result of an import committed by chunks
+
+        :param imported: number of imported moves
+        :param failed: values of the chunks in error
+        :param done_rows: number of committed rows
+        :returns: (state, msg)
+
+        """
+        if not failed:
+            return 'done', _("%s moves imported") % imported
+        msg = _("%s moves imported, rows %s failed.\n"
+                "Once fixed, the import will be resumed from row %s.") % (
+            imported,
+            ', '.join('%s to %s' % (vals['first_row'], vals['last_row'])
+                      for vals in failed),
+            done_rows)
+        return 'error', '\n \n'.join([msg] + [vals['report']
+                                             for vals in failed])
+
+    def _load_by_commits(self, cr, uid, imp_id, head, data, commit_size,
+                         done_rows=0, _do_commit=True, context=None):
+        """Load the moves by chunks of `commit_size` moves
+
+        Each chunk is committed with its report and the number of
+        committed rows, so a failed import can be resumed after it.
+        Stops on the first chunk in error.
+
+        :param imp_id: current importer id
+        :param head: CSV file head (list of header)
+        :param data: CSV file content (iterable of tuples)
+        :param commit_size: number of moves committed at once
+        :param done_rows: number of rows committed by a previous
+                          import, they are skipped
+        :param _do_commit: toggle commit management
+                           only used for testing purpose only
+        :returns: (state, msg)
+
+        """
+        start = done_rows
+        data = itertools.islice(data, start, None)
+        imported = 0
+        failed = []
+        for index, rows in self._iter_move_chunks(head, data, max_rows=None,
+                                                  max_moves=commit_size):
+            vals = self._load_chunk(cr, uid, imp_id, head, rows,
+                                    start + index, context=context)
+            if vals['state'] == 'error':
+                failed.append(vals)
+                if _do_commit:
+                    cr.commit()
+                break
+            imported += vals['move_count']
+            done_rows = vals['last_row'] + 1
+            self.write(cr, uid, [imp_id], {'done_rows': done_rows},
+                       context=context)
+            if _do_commit:
+                cr.commit()
+        return self._format_chunks_report(imported, failed, done_rows)
+
+    def _load_parallel(self, cr, uid, imp_id, head, data, partition_size,
+                       workers, done_rows=0, context=None):
+        """Queue the moves by partitions loaded by cron workers
+
+        Partitions of `partition_size` moves are stored as pending chunks
+        and `workers` one-shot crons are started to load them, each
+        partition is loaded and committed by a worker in its own
+        transaction, see `move.line.importer.chunk._run_chunks`.
+        Move ids are reserved beforehand in the order of the file so they
+        do not depend on the order in which the partitions are loaded.
+        Partitions committed by a previous import are skipped. The report
+        is written by the worker loading the last partition, see
+        `_finish_parallel`.
+
+        :param imp_id: current importer id
+        :param head: CSV file head (list of header)
+        :param data: CSV file content (iterable of tuples)
+        :param partition_size: number of moves of a partition
+        :param workers: number of cron workers
+        :param done_rows: number of rows committed by a previous
+                          import, they are skipped
+        :returns: (state, msg)
+        :raise: orm.except_orm if a partition overlaps a committed chunk
+
+        """
+        chunk_obj = self.pool['move.line.importer.chunk']
+        done_chunks = self._get_done_chunks(cr, uid, imp_id, done_rows,
+                                            context=context)
+        cr.execute("SELECT COALESCE(MAX(run), 0) + 1 "
+                   "FROM move_line_importer_chunk WHERE importer_id = %s",
+                   (imp_id,))
+        run = cr.fetchone()[0]
+        partitions = self._iter_move_chunks(
+            head, itertools.islice(data, done_rows, None),
+            max_rows=None, max_moves=partition_size)
+        queued = 0
+        for index, rows in partitions:
+            first_row = done_rows + index
+            last_row = first_row + len(rows) - 1
+            if done_chunks.get(first_row) == last_row:
+                continue
+            if any(first <= last_row and last >= first_row
+                   for first, last in done_chunks.iteritems()):
+                raise orm.except_orm(
+                    _('Import can not be resumed'),
+                    _('Committed chunks do not match the '
+                      'partitions, the moves per commit must '
+                      'not be changed to resume an import.'))
+            move_ids = self._reserve_move_ids(cr, head, rows)
+            chunk_obj.create(cr, uid, {
+                'importer_id': imp_id,
+                'run': run,
+                'first_row': first_row,
+                'last_row': last_row,
+                'state': 'pending',
+                'rows': self._dump_rows(head, rows),
+                'reserved_move_ids': ','.join(str(x) for x in move_ids),
+            }, context=context)
+            queued += 1
+        if not queued:
+            done_rows = self._count_done_rows(done_chunks, done_rows)
+            self.write(cr, uid, [imp_id], {'done_rows': done_rows},
+                       context=context)
+            return self._format_chunks_report(0, [], done_rows)
+        workers = min(workers, queued)
+        chunk_obj._start_workers(cr, uid, workers, context=context)
+        return 'running', _("%s partitions queued, "
+                            "they are loaded by %s workers") % (queued,
+                                                                workers)
+
+    def _get_done_chunks(self, cr, uid, imp_id, done_rows, context=None):
+        """Get the chunks committed after the committed rows
+
+        :param imp_id: current importer id
+        :param done_rows: number of committed rows
+        :returns: dict {first row: last row}
+
+        """
+        chunk_obj = self.pool['move.line.importer.chunk']
+        chunk_ids = chunk_obj.search(cr, uid,
+                                     [('importer_id', '=', imp_id),
+                                      ('state', '=', 'done'),
+                                      ('first_row', '>=', done_rows)],
+                                     context=context)
+        return dict(
+            (chunk['first_row'], chunk['last_row']) for chunk in
+            chunk_obj.read(cr, uid, chunk_ids, ['first_row', 'last_row'],
+                           context=context)
+        )
+
+    def _count_done_rows(self, done_chunks, done_rows):
+        """Count the committed rows, they only go up to the first
+        partition which is not committed
+
+        :param done_chunks: dict {first row: last row} of the chunks
+                            committed after `done_rows`
+        :param done_rows: number of committed rows
+        :returns: number of committed rows
+
+        """
+        while done_rows in done_chunks:
+            done_rows = done_chunks[done_rows] + 1
+        return done_rows
+
+    def _reserve_move_ids(self, cr, head, rows):
+        """Reserve the ids of the moves of a partition
+
+        :param head: CSV file head (list of header)
+        :param rows: rows of the partition (list of tuples)
+        :returns: sorted list of ids
+
+        """
+        cr.execute("SELECT nextval(%s) "
+                   "FROM generate_series(1, %s)",
+                   (self.pool['account.move']._sequence,
+                    self._count_moves(head, rows)))
+        return sorted(row[0] for row in cr.fetchall())
+
+    def _dump_rows(self, head, rows):
+        """Serialize the rows of a partition as a CSV file with the head
+
+        :param head: CSV file head (list of header)
+        :param rows: rows of the partition (list of tuples)
+        :returns: CSV content
+
+        """
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(head)
+        writer.writerows(rows)
+        return output.getvalue()
+
+    def _parse_rows(self, content):
+        """Parse the rows of a partition serialized by `_dump_rows`
+
+        :param content: CSV content
+        :returns: (head [list of first row], data [list of tuples])
+
+        """
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        head, data = self._prepare_csv_data(StringIO(content))
+        return head, list(data)
+
+    def _get_parallel_report(self, cr, uid, imp_id, context=None):
+        """Summarize the last parallel import once all its partitions
+        are loaded and update the committed rows
+
+        :param imp_id: current importer id
+        :returns: (state, msg)
+
+        """
+        imp = self.read(cr, uid, imp_id, ['done_rows'], context=context)
+        done_chunks = self._get_done_chunks(cr, uid, imp_id,
+                                            imp['done_rows'],
+                                            context=context)
+        done_rows = self._count_done_rows(done_chunks, imp['done_rows'])
+        self.write(cr, uid, [imp_id], {'done_rows': done_rows},
+                   context=context)
+        cr.execute("SELECT state, move_count, first_row, last_row, report "
+                   "FROM move_line_importer_chunk "
+                   "WHERE importer_id = %s AND run = "
+                   " (SELECT MAX(run) FROM move_line_importer_chunk "
+                   "  WHERE importer_id = %s) "
+                   "ORDER BY first_row",
+                   (imp_id, imp_id))
+        imported = 0
+        failed = []
+        for state, move_count, first_row, last_row, report in cr.fetchall():
+            if state == 'done':
+                imported += move_count
+            elif state == 'error':
+                failed.append({'first_row': first_row,
+                               'last_row': last_row,
+                               'report': report})
+        return self._format_chunks_report(imported, failed, done_rows)
+
+    def _finish_parallel(self, cr, uid, imp_id, context=None):
+        """Write the report of a parallel import once no partition
+        is pending anymore
+
+        :param imp_id: current importer id
+        :returns: True if the report is written
+
+        """
+        # the workers loading the last partitions wait for each other
+        cr.execute("SELECT state FROM move_line_importer "
+                   "WHERE id = %s FOR UPDATE", (imp_id,))
+        row = cr.fetchone()
+        if not row or row[0] != 'running':
+            return False
+        if self.pool['move.line.importer.chunk'].search(
+                cr, uid, [('importer_id', '=', imp_id),
+                          ('state', '=', 'pending')],
+                limit=1, context=context):
+            return False
+        state, msg = self._get_parallel_report(cr, uid, imp_id,
+                                               context=context)
+        self.write(cr, uid, [imp_id], {'state': state, 'report': msg},
+                   context=context)
+        return True
+
+    def _count_moves(self, head, rows):
+        """Count the moves of parsed CSV rows
+
+        :param head: CSV file head (list of header)
+        :param rows: CSV file content (iterable of tuples)
+        :returns: number of moves
+
+        """
+        return sum(1 for __ in self._iter_move_chunks(head, rows,
+                                                      max_rows=None,
+                                                      max_moves=1))
+
     def _load_data(self, cr, uid, imp_id, head, data, _do_commit=True,
                    context=None):
         """Function that does the load of parsed CSV file.
 
         If will log exception and susccess into the report fields.
 
+        The rows are given to BaseModel.load by chunks of complete moves,
+        the loading stops on the first chunk in error and everything is
+        rolled back. When the ORM is bypassed and the CSV canvas allows it,
+        the whole file is loaded in bulk by `account.move._bulk_load`.
+        When a commit size is set on the importer, moves are committed
+        by chunks, see `_load_by_commits`. Fast imports using several
+        workers are loaded in parallel by cron workers, see
+        `_load_parallel`.
+        Rows committed by a previous import are skipped on every path,
+        even when the commit size was reset since.
+
         :param imp_id: current importer id
         :param head: CSV file head (list of header)
-        :param data: CSV file content (list of data list)
+        :param data: CSV file content (iterable of tuples)
         :param _do_commit: toggle commit management
                            only used for testing purpose only
         :returns: current importer id
 
         """
+        if context is None:
+            context = {}
         state = msg = None
         try:
-            res = self.pool['account.move'].load(cr, uid, head, data,
-                                                 context=context)
-            r_id, state, msg = self._manage_load_results(cr, uid, imp_id, res,
-                                                         _do_commit=_do_commit,
-                                                         context=context)
+            imp = self.read(cr, uid, imp_id,
+                            ['commit_size', 'done_rows', 'workers',
+                             'check_before_import'],
+                            context=context)
+            done_rows = imp['done_rows']
+            messages = None
+            if imp['check_before_import']:
+                __, messages = self._check_rows(
+                    cr, uid, head, itertools.islice(data, done_rows, None),
+                    context=context)
+                messages = self._offset_messages(messages, done_rows)
+                if not messages:
+                    # the rows were consumed by the check
+                    head, data = self._parse_csv(cr, uid, imp_id)
+            if messages:
+                r_id, state, msg = self._manage_load_results(
+                    cr, uid, imp_id, {'ids': False, 'messages': messages},
+                    _do_commit=_do_commit, context=context)
+            elif (imp['workers'] > 1 and
+                    context.get('async_bypass_create') and
+                    self.pool['account.move']._bulk_load_columns(head)):
+                state, msg = self._load_parallel(
+                    cr, uid, imp_id, head, data,
+                    imp['commit_size'] or PARTITION_MOVES, imp['workers'],
+                    done_rows=done_rows, context=context)
+            elif imp['commit_size'] > 0:
+                state, msg = self._load_by_commits(
+                    cr, uid, imp_id, head, data, imp['commit_size'],
+                    done_rows=done_rows, _do_commit=_do_commit,
+                    context=context)
+            else:
+                cr.execute('SAVEPOINT async_move_line_import')
+                res = self._load_rows(cr, uid, head,
+                                      itertools.islice(data, done_rows, None),
+                                      context=context)
+                if res['messages']:
+                    cr.execute('ROLLBACK TO SAVEPOINT '
+                               'async_move_line_import')
+                    self._offset_messages(res['messages'], done_rows)
+                else:
+                    cr.execute('RELEASE SAVEPOINT async_move_line_import')
+                r_id, state, msg = self._manage_load_results(
+                    cr, uid, imp_id, res, _do_commit=_do_commit,
+                    context=context)
         except Exception as exc:
             if _do_commit:
                 cr.rollback()
@@ -312,6 +1050,10 @@ class move_line_importer(orm.Model):
                     cr.commit()
                 except psycopg2.Error:
                     _logger.exception('Can not do final commit')
+                try:
+                    self._unlock_import(cr, imp_id)
+                except psycopg2.Error:
+                    _logger.exception('Can not release the import lock')
                 cr.close()
         return imp_id
 
@@ -330,6 +1072,48 @@ class move_line_importer(orm.Model):
                     _('Please try latter')
                 )
 
+    def _lock_import(self, cr, imp_id):
+        """Take a Postgres advisory lock on the importer for the session
+        of the cursor, so a file is imported once at a time across all
+        the server processes.
+
+        The lock is kept through the commits of the import and released
+        by `_unlock_import`, or when the connection is lost.
+
+        :param imp_id: current importer id
+        :returns: True if the lock is acquired
+
+        """
+        cr.execute("SELECT pg_try_advisory_lock("
+                   " %s::regclass::oid::integer, %s)",
+                   (self._table, imp_id))
+        return cr.fetchone()[0]
+
+    def _unlock_import(self, cr, imp_id):
+        """Release the lock taken by `_lock_import`
+
+        :param imp_id: current importer id
+        :returns: void
+
+        """
+        cr.execute("SELECT pg_advisory_unlock("
+                   " %s::regclass::oid::integer, %s)",
+                   (self._table, imp_id))
+
+    def _commits_by_chunks(self, imp):
+        """Tell if an import commits its moves by chunks, either with
+        a commit size or as a parallel fast import
+
+        Keep in line with the attrs of the Resume Import button.
+
+        :param imp: values of the importer with commit_size,
+                    bypass_orm and workers
+        :returns: boolean
+
+        """
+        return (imp['commit_size'] > 0 or
+                (imp['bypass_orm'] and imp['workers'] > 1))
+
     def _check_permissions(self, cr, uid, context=None):
         """Ensure that user is allowed to create move / move line"""
         move_obj = self.pool['account.move']
@@ -348,6 +1132,9 @@ class move_line_importer(orm.Model):
         If you set bypass_orm to True then the load function
         will use a totally overridden create function that is a lot faster
         but that totally bypass the ORM
+        When moves are committed by chunks, a failed or interrupted import
+        is resumed after its committed rows. The pending partitions of an
+        interrupted parallel import are given to new cron workers.
 
         """
 
@@ -355,8 +1142,27 @@ class move_line_importer(orm.Model):
             imp_id = imp_id[0]
         if context is None:
             context = {}
-        current = self.read(cr, uid, imp_id, ['bypass_orm', 'company_id'],
+        current = self.read(cr, uid, imp_id,
+                            ['bypass_orm', 'company_id', 'state',
+                             'commit_size', 'workers'],
                             load='_classic_write')
+        if (current['state'] == 'running' and
+                not self._commits_by_chunks(current)):
+            raise orm.except_orm(
+                _('This import can not be resumed'),
+                _('Only the imports committed by chunks can be resumed')
+            )
+        chunk_obj = self.pool['move.line.importer.chunk']
+        pending_ids = chunk_obj.search(cr, uid,
+                                       [('importer_id', '=', imp_id),
+                                        ('state', '=', 'pending')],
+                                       context=context)
+        if pending_ids:
+            # the partitions locked by running workers are skipped
+            chunk_obj._start_workers(
+                cr, uid, max(min(current['workers'], len(pending_ids)), 1),
+                context=context)
+            return {}
         context['company_id'] = current['company_id']
         bypass_orm = current['bypass_orm']
         if bypass_orm:
@@ -371,6 +1177,13 @@ class move_line_importer(orm.Model):
         self._allows_thread(imp_id)
         db_name = cr.dbname
         local_cr = pooler.get_db(db_name).cursor()
+        # the import may run in another server process
+        if not self._lock_import(local_cr, imp_id):
+            local_cr.close()
+            raise orm.except_orm(
+                _('An import of this file is already running'),
+                _('Please try latter')
+            )
         thread = threading.Thread(target=self._load_data,
                                   name='async_move_line_import_%s' % imp_id,
                                   args=(local_cr, uid, imp_id, head, data),
@@ -378,3 +1191,169 @@ class move_line_importer(orm.Model):
         thread.start()
 
         return {}
+
+
+class move_line_importer_chunk(orm.Model):
+    """Chunk of moves committed at once by a move line importer
+
+    The partitions of a parallel import are queued as pending chunks
+    loaded by cron workers, see `move_line_importer._load_parallel`.
+
+    """
+
+    _name = "move.line.importer.chunk"
+    _order = "importer_id, first_row"
+
+    _columns = {
+        'importer_id': fields.many2one(
+            'move.line.importer',
+            'Importer',
+            required=True,
+            ondelete='cascade',
+            readonly=True
+        ),
+        'first_row': fields.integer(
+            'First row',
+            readonly=True
+        ),
+        'last_row': fields.integer(
+            'Last row',
+            readonly=True
+        ),
+        'move_count': fields.integer(
+            'Imported moves',
+            readonly=True
+        ),
+        'state': fields.selection(
+            [('pending', 'Pending'),
+             ('done', 'Success'),
+             ('error', 'Error')],
+            readonly=True,
+            string='Status'
+        ),
+        'report': fields.text(
+            'Report',
+            readonly=True
+        ),
+        'run': fields.integer(
+            'Run',
+            readonly=True,
+            help="Parallel import which queued the chunk"
+        ),
+        'rows': fields.text(
+            'Rows',
+            readonly=True,
+            help="CSV rows of a pending chunk, with the head of the file"
+        ),
+        'reserved_move_ids': fields.text(
+            'Reserved move ids',
+            readonly=True
+        ),
+        'create_date': fields.datetime(
+            'Date',
+            readonly=True
+        ),
+    }
+
+    def _start_workers(self, cr, uid, workers, context=None):
+        """Create `workers` one-shot crons loading the pending chunks
+
+        The crons of previous imports which already ran are removed.
+
+        :param workers: number of cron workers
+        :returns: True
+
+        """
+        cron_obj = self.pool['ir.cron']
+        old_ids = cron_obj.search(cr, SUPERUSER_ID,
+                                  [('model', '=', self._name),
+                                   ('function', '=', 'run_pending_chunks'),
+                                   ('numbercall', '=', 0),
+                                   ('active', '=', False)],
+                                  context=context)
+        if old_ids:
+            cron_obj.unlink(cr, SUPERUSER_ID, old_ids, context=context)
+        nextcall = time.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+        for index in range(workers):
+            cron_obj.create(cr, SUPERUSER_ID, {
+                'name': _('Move import worker %s') % (index + 1),
+                'user_id': uid,
+                'model': self._name,
+                'function': 'run_pending_chunks',
+                'args': '()',
+                'interval_number': 1,
+                'interval_type': 'minutes',
+                'numbercall': 1,
+                'doall': False,
+                'nextcall': nextcall,
+            }, context=context)
+        return True
+
+    def _lock_chunk(self, cr, chunk_id):
+        """Lock a pending chunk for the current transaction
+
+        :param chunk_id: chunk id
+        :returns: False if the chunk is not pending or loaded by
+                  another worker
+
+        """
+        try:
+            with cr.savepoint():
+                cr.execute("SELECT id FROM move_line_importer_chunk "
+                           "WHERE id = %s AND state = 'pending' "
+                           "FOR UPDATE NOWAIT", (chunk_id,))
+                return bool(cr.fetchone())
+        except psycopg2.OperationalError:
+            return False
+
+    def _run_chunks(self, cr, uid, chunk_ids=None, commit=True,
+                    context=None):
+        """Load the pending chunks, each of them in its own transaction
+        when `commit` is set
+
+        The chunks are locked while they are loaded, hence several
+        workers can load them concurrently. The report of an import is
+        written once its last chunk is loaded.
+
+        :param chunk_ids: chunks to load, all the pending ones when None
+        :param commit: toggle commit management
+                       only used for testing purpose only
+        :returns: ids of the loaded chunks
+
+        """
+        if context is None:
+            context = {}
+        importer_obj = self.pool['move.line.importer']
+        domain = [('state', '=', 'pending')]
+        if chunk_ids is not None:
+            domain.append(('id', 'in', chunk_ids))
+        res = []
+        imp_ids = set()
+        for chunk_id in self.search(cr, uid, domain, order='id',
+                                    context=context):
+            if not self._lock_chunk(cr, chunk_id):
+                continue
+            chunk = self.browse(cr, uid, chunk_id, context=context)
+            importer = chunk.importer_id
+            # as set by move_line_importer.import_file
+            ctx = dict(context, async_bypass_create=True,
+                       company_id=importer.company_id.id)
+            head, rows = importer_obj._parse_rows(chunk.rows)
+            move_ids = [int(x) for x in chunk.reserved_move_ids.split(',')]
+            importer_obj._load_chunk(cr, uid, importer.id, head, rows,
+                                     chunk.first_row, move_ids=move_ids,
+                                     chunk_id=chunk_id, context=ctx)
+            if commit:
+                cr.commit()
+            res.append(chunk_id)
+            imp_ids.add(importer.id)
+        for imp_id in imp_ids:
+            if importer_obj._finish_parallel(cr, uid, imp_id,
+                                             context=context) and commit:
+                cr.commit()
+        return res
+
+    def run_pending_chunks(self, cr, uid, context=None):
+        """Entry point of the cron workers"""
+        self._run_chunks(cr, uid, context=context)
+        return True
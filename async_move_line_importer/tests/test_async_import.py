@@ -22,6 +22,7 @@ import time
 
 import openerp.tests.common as test_common
 from openerp import addons
+from openerp.osv import orm
 
 
 class TestMoveLineImporter(test_common.SingleTransactionCase):
@@ -136,3 +137,324 @@ class TestMoveLineImporter(test_common.SingleTransactionCase):
                                                   [('ref', '=', 'test_3')])
         self.assertFalse(created_move_ids,
                          'Move was imported but it should not be the case')
+
+    def test_04_chunks_keep_moves_together(self):
+        """Test CSV rows are given to load by chunks of complete moves"""
+        cr, uid = self.cr, self.uid
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': self.get_file('faulty_moves.csv'),
+             'delimiter': ';'}
+        )
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        chunks = list(self.importer_model._iter_move_chunks(head, data,
+                                                            max_rows=4))
+        self.assertEqual([index for index, rows in chunks], [0, 3])
+        self.assertEqual([len(rows) for index, rows in chunks], [3, 3])
+        self.assertEqual(chunks[1][1][0][0], 'test_3b')
+
+    def test_05_bulk_load_failing(self):
+        """Test faulty CSV file is rejected by bulk load checks"""
+        cr, uid = self.cr, self.uid
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': self.get_file('faulty_moves.csv'),
+             'delimiter': ';',
+             'bypass_orm': True}
+        )
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        self.assertTrue(self.move_model._bulk_load_columns(head))
+        context = {'async_bypass_create': True,
+                   'company_id': 1}
+        self.importer_model._load_data(cr, uid, importer_id, head, data,
+                                       _do_commit=False, context=context)
+        importer = self.importer_model.browse(cr, uid, importer_id)
+        self.assertEquals(importer.state, 'error',
+                          'No exception %s during import' % importer.report)
+        self.assertIn('line_id/tax_code_id', importer.report)
+        created_move_ids = self.move_model.search(cr, uid,
+                                                  [('ref', '=', 'test_3')])
+        self.assertFalse(created_move_ids,
+                         'Move was imported but it should not be the case')
+
+    def test_06_chunked_commits(self):
+        """Test moves committed by chunks keep the valid chunks"""
+        cr, uid = self.cr, self.uid
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': self.get_file('faulty_moves.csv'),
+             'delimiter': ';',
+             'commit_size': 1}
+        )
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        self.importer_model._load_data(cr, uid, importer_id, head, data,
+                                       _do_commit=False, context={})
+        importer = self.importer_model.browse(cr, uid, importer_id)
+        self.assertEquals(importer.state, 'error',
+                          'No exception %s during import' % importer.report)
+        self.assertEqual(importer.done_rows, 3)
+        self.assertEqual([(c.first_row, c.last_row, c.state)
+                          for c in importer.chunk_ids],
+                         [(0, 2, 'done'), (3, 5, 'error')])
+        created_move_ids = self.move_model.search(cr, uid,
+                                                  [('ref', '=', 'test_3')])
+        self.assertEqual(len(created_move_ids), 1)
+        created_move_ids = self.move_model.search(cr, uid,
+                                                  [('ref', '=', 'test_3b')])
+        self.assertFalse(created_move_ids)
+
+    def test_07_check_file(self):
+        """Test the check of a CSV file reports errors without importing"""
+        cr, uid = self.cr, self.uid
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': self.get_file('faulty_moves.csv'),
+             'delimiter': ';'}
+        )
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        moves, messages = self.importer_model._check_rows(
+            cr, uid, head, data, context={'company_id': 1})
+        self.assertEqual(moves, 2)
+        self.assertEqual(len(messages), 1, messages)
+        self.assertEqual(messages[0]['field'], 'line_id/tax_code_id')
+        self.assertEqual(messages[0]['rows'], {'from': 4, 'to': 4})
+        self.importer_model.check_import_file(cr, uid, [importer_id])
+        importer = self.importer_model.browse(cr, uid, importer_id)
+        self.assertEqual(importer.state, 'draft')
+        self.assertIn('Faulty code', importer.report)
+        created_move_ids = self.move_model.search(cr, uid,
+                                                  [('ref', '=', 'test_3b')])
+        self.assertFalse(created_move_ids)
+
+    def test_08_resume_guards(self):
+        """Test an import is resumed once and only by chunks"""
+        cr, uid = self.cr, self.uid
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': self.get_file('one_move.csv'),
+             'delimiter': ';'}
+        )
+        self.importer_model.write(cr, uid, [importer_id],
+                                  {'state': 'running'})
+        with self.assertRaises(orm.except_orm):
+            self.importer_model.import_file(cr, uid, [importer_id])
+        # parallel fast imports commit by chunks without a commit size
+        self.assertFalse(self.importer_model._commits_by_chunks(
+            {'commit_size': 0, 'bypass_orm': True, 'workers': 1}))
+        self.assertTrue(self.importer_model._commits_by_chunks(
+            {'commit_size': 0, 'bypass_orm': True, 'workers': 2}))
+        self.assertTrue(self.importer_model._lock_import(cr, importer_id))
+        other_cr = self.registry.cursor()
+        try:
+            self.assertFalse(
+                self.importer_model._lock_import(other_cr, importer_id))
+        finally:
+            other_cr.close()
+        self.importer_model._unlock_import(cr, importer_id)
+
+    def _parallel_import(self, ref_prefix):
+        """Create an importer of the parallel_moves.csv file
+        with the moves refs starting with `ref_prefix`
+        """
+        cr, uid = self.cr, self.uid
+        test_data = self.get_file('parallel_moves.csv').decode('base64')
+        test_data = test_data.replace('test_p', ref_prefix)
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': test_data.encode('base64'),
+             'delimiter': ';',
+             'bypass_orm': True,
+             'workers': 2}
+        )
+        return importer_id
+
+    def _run_chunks_reversed(self, importer_id):
+        """Load the pending chunks of an importer in the test transaction,
+        in the reverse order of the file
+        """
+        cr, uid = self.cr, self.uid
+        chunk_model = self.registry('move.line.importer.chunk')
+        chunk_ids = chunk_model.search(cr, uid,
+                                       [('importer_id', '=', importer_id),
+                                        ('state', '=', 'pending')],
+                                       order='first_row desc')
+        for chunk_id in chunk_ids:
+            self.assertEqual(
+                chunk_model._run_chunks(cr, uid, [chunk_id], commit=False),
+                [chunk_id])
+        return chunk_ids
+
+    def _search_moves(self, ref_prefix):
+        cr, uid = self.cr, self.uid
+        return [self.move_model.search(cr, uid,
+                                       [('ref', '=', '%s%s' % (ref_prefix,
+                                                               number))])
+                for number in range(1, 6)]
+
+    def test_09_parallel_partitions(self):
+        """Test moves queued by partitions loaded by cron workers"""
+        cr, uid = self.cr, self.uid
+        importer_id = self._parallel_import('test_p')
+        self.importer_model.write(cr, uid, [importer_id],
+                                  {'commit_size': 1, 'state': 'running'})
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        context = {'async_bypass_create': True,
+                   'company_id': 1}
+        self.importer_model._load_data(cr, uid, importer_id, head, data,
+                                       _do_commit=False, context=context)
+        importer = self.importer_model.browse(cr, uid, importer_id)
+        self.assertEqual(importer.state, 'running', importer.report)
+        self.assertEqual([(c.first_row, c.last_row, c.state)
+                          for c in importer.chunk_ids],
+                         [(0, 2, 'pending'), (3, 5, 'pending'),
+                          (6, 8, 'pending'), (9, 11, 'pending'),
+                          (12, 14, 'pending')])
+        cron_ids = self.registry('ir.cron').search(
+            cr, uid, [('model', '=', 'move.line.importer.chunk'),
+                      ('function', '=', 'run_pending_chunks')])
+        self.assertEqual(len(cron_ids), 2)
+        self._run_chunks_reversed(importer_id)
+        importer.refresh()
+        # the partitions after the failed one are loaded as well
+        self.assertEqual(importer.state, 'error', importer.report)
+        self.assertEqual([(c.first_row, c.last_row, c.state)
+                          for c in importer.chunk_ids],
+                         [(0, 2, 'done'), (3, 5, 'done'),
+                          (6, 8, 'error'), (9, 11, 'done'),
+                          (12, 14, 'done')])
+        self.assertFalse([c for c in importer.chunk_ids if c.rows])
+        self.assertEqual(importer.done_rows, 6)
+        move_ids = self._search_moves('test_p')
+        self.assertEqual([len(ids) for ids in move_ids], [1, 1, 0, 1, 1])
+        # the move ids are reserved in the order of the file
+        self.assertTrue(move_ids[0][0] < move_ids[1][0] <
+                        move_ids[3][0] < move_ids[4][0])
+
+    def test_10_parallel_resume(self):
+        """Test a parallel import is resumed after its committed
+        partitions
+        """
+        cr, uid = self.cr, self.uid
+        importer_id = self._parallel_import('test_r')
+        self.importer_model.write(cr, uid, [importer_id],
+                                  {'commit_size': 1, 'state': 'running'})
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        context = {'async_bypass_create': True,
+                   'company_id': 1}
+        self.importer_model._load_data(cr, uid, importer_id, head, data,
+                                       _do_commit=False, context=context)
+        self._run_chunks_reversed(importer_id)
+        importer = self.importer_model.browse(cr, uid, importer_id)
+        done_rows = importer.done_rows
+        self.assertEqual(done_rows, 6)
+        self.registry('account.tax.code').create(
+            cr, uid, {'name': 'Missing code', 'company_id': 1})
+        # the partitions must be the same to resume
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        with self.assertRaises(orm.except_orm):
+            self.importer_model._load_parallel(
+                cr, uid, importer_id, head, data, 2, 2,
+                done_rows=done_rows, context=context)
+        self.importer_model.write(cr, uid, [importer_id],
+                                  {'state': 'running'})
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        self.importer_model._load_data(cr, uid, importer_id, head, data,
+                                       _do_commit=False, context=context)
+        importer.refresh()
+        # only the failed partition is queued again
+        self.assertEqual(
+            [(c.first_row, c.state) for c in importer.chunk_ids
+             if c.state == 'pending'],
+            [(6, 'pending')])
+        self._run_chunks_reversed(importer_id)
+        importer.refresh()
+        self.assertEqual(importer.state, 'done', importer.report)
+        self.assertEqual(importer.done_rows, 15)
+        self.assertEqual([len(ids) for ids in self._search_moves('test_r')],
+                         [1, 1, 1, 1, 1])
+
+    def test_11_resume_without_chunks(self):
+        """Test the committed rows are skipped when the commit size
+        is reset to resume an import in one transaction
+        """
+        cr, uid = self.cr, self.uid
+        test_data = self.get_file('faulty_moves.csv').decode('base64')
+        test_data = test_data.replace('test_3', 'test_s')
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': test_data.encode('base64'),
+             'delimiter': ';',
+             'commit_size': 1}
+        )
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        self.importer_model._load_data(cr, uid, importer_id, head, data,
+                                       _do_commit=False, context={})
+        importer = self.importer_model.browse(cr, uid, importer_id)
+        self.assertEqual(importer.done_rows, 3)
+        self.registry('account.tax.code').create(
+            cr, uid, {'name': 'Faulty code', 'company_id': 1})
+        self.importer_model.write(cr, uid, [importer_id],
+                                  {'commit_size': 0})
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        self.importer_model._load_data(cr, uid, importer_id, head, data,
+                                       _do_commit=False, context={})
+        importer.refresh()
+        self.assertEquals(importer.state, 'done', importer.report)
+        self.assertEqual(
+            len(self.move_model.search(cr, uid, [('ref', '=', 'test_s')])),
+            1)
+        self.assertEqual(
+            len(self.move_model.search(cr, uid, [('ref', '=', 'test_sb')])),
+            1)
+
+    def test_12_resolve_references(self):
+        """Test the references of a file not loaded in bulk are resolved
+        by name_search as BaseModel.load does
+        """
+        cr, uid = self.cr, self.uid
+        partner_model = self.registry('res.partner')
+        parent_id = partner_model.search(cr, uid,
+                                         [('name', '=', 'Camptocamp')])[0]
+        partner_id = partner_model.create(
+            cr, uid, {'name': 'Resolver', 'parent_id': parent_id})
+        display_name = partner_model.name_get(cr, uid, [partner_id])[0][1]
+        found = self.importer_model._resolve_references(
+            cr, uid, 'account.move.line', 'partner_id', [display_name],
+            context={'company_id': 1})
+        self.assertEqual(found, {display_name: partner_id})
+
+    def test_13_bulk_load_lookups(self):
+        """Test the bulk load resolves references as name_search does
+        and accepts the amounts accepted by float()
+        """
+        cr, uid = self.cr, self.uid
+        partner_model = self.registry('res.partner')
+        parent_id = partner_model.search(cr, uid,
+                                         [('name', '=', 'Camptocamp')])[0]
+        partner_id = partner_model.create(
+            cr, uid, {'name': 'Bulk Resolver', 'parent_id': parent_id})
+        display_name = partner_model.name_get(cr, uid, [partner_id])[0][1]
+        test_data = self.get_file('one_move2.csv').decode('base64')
+        test_data = test_data.replace('test_2', 'test_n')
+        test_data = test_data.replace('Camptocamp', display_name)
+        test_data = test_data.replace(';1000;', ';1e3;')
+        test_data = test_data.replace(';200;', ';.2e3;')
+        test_data = test_data.replace(';1200;', ';1200.;')
+        importer_id = self.importer_model.create(
+            cr, uid,
+            {'file': test_data.encode('base64'),
+             'delimiter': ';',
+             'bypass_orm': True}
+        )
+        head, data = self.importer_model._parse_csv(cr, uid, importer_id)
+        context = {'async_bypass_create': True,
+                   'company_id': 1}
+        res = self.move_model._bulk_load(cr, uid, head, data,
+                                         context=context)
+        self.assertFalse(res['messages'], res['messages'])
+        move = self.move_model.browse(cr, uid, res['ids'][0])
+        self.assertEqual(move.ref, 'test_n')
+        self.assertEqual(set(line.partner_id.id for line in move.line_id),
+                         set([partner_id]))
+        self.assertEqual(sum(line.debit for line in move.line_id), 1200.0)
+        self.assertEqual(sum(line.credit for line in move.line_id), 1200.0)